@@ -20,10 +20,11 @@
     FieldList,
     FormField,
     HiddenField,
+    IntegerField,
     SelectField,
     SubmitField,
 )
-from wtforms.validators import DataRequired, Optional
+from wtforms.validators import DataRequired, NumberRange, Optional
 
 from main import db
 from models import naive_utcnow
@@ -166,6 +167,7 @@ class SiteStateForm(Form):
         "Refunds",
         choices=[(s, s) for s in VALID_STATES["refund_state"]],
     )
+    queue_admission_rate = IntegerField("Tickets queue admission rate", [Optional(), NumberRange(min=0)])
     update = SubmitField("Update states")
 
 
@@ -186,6 +188,9 @@ def site_states():
             else:
                 getattr(form, name).data = current_states[name]
 
+        if "queue_admission_rate" in db_states:
+            form.queue_admission_rate.data = int(db_states["queue_admission_rate"].state)
+
     if form.validate_on_submit():
         for name in VALID_STATES:
             state_form = getattr(form, name)
@@ -202,6 +207,18 @@ def site_states():
                     state = SiteState(name, state_form.data)
                     db.session.add(state)
 
+        rate = form.queue_admission_rate.data
+        if "queue_admission_rate" in db_states:
+            if not rate:
+                app.logger.info("Disabling tickets queue")
+                db.session.delete(db_states["queue_admission_rate"])
+            elif db_states["queue_admission_rate"].state != str(rate):
+                app.logger.info("Updating tickets queue admission rate to %s", rate)
+                db_states["queue_admission_rate"].state = str(rate)
+        elif rate:
+            app.logger.info("Enabling tickets queue with admission rate %s", rate)
+            db.session.add(SiteState("queue_admission_rate", str(rate)))
+
         db.session.commit()
         refresh_states()
         return redirect(url_for(".site_states"))
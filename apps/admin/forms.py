@@ -21,7 +21,7 @@
 from models import Currency
 from models.basket import Basket
 from models.permission import Permission
-from models.product import PRODUCT_GROUP_TYPES, ProductGroup
+from models.product import PRODUCT_GROUP_TYPES, CapacitySnapshot, ProductGroup
 
 from ..common import CURRENCY_SYMBOLS
 from ..common.fields import (
@@ -257,6 +257,7 @@ def add_price_tiers(self, tiers):
                 self.price_tiers[-1].tier_id.data = pt.id
 
         pts = {pt.id: pt for pt in tiers}
+        self._capacity = CapacitySnapshot(tiers)
         for f in self.price_tiers:
             f._tier = pts[f.tier_id.data]
             values = range(f._tier.personal_limit + 1)
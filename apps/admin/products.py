@@ -19,6 +19,7 @@
 from main import db, external_url, get_or_404, mail
 from models.product import (
     VOUCHER_GRACE_PERIOD,
+    CapacitySnapshot,
     Price,
     PriceTier,
     Product,
@@ -71,7 +72,8 @@ def get_user_purchases(query):
 @products.route("/")
 def products_main():
     root_groups = ProductGroup.query.filter_by(parent_id=None).order_by(ProductGroup.id).all()
-    return render_template("admin/products/overview.html", root_groups=root_groups)
+    capacity = CapacitySnapshot(PriceTier.query.all())
+    return render_template("admin/products/overview.html", root_groups=root_groups, capacity=capacity)
 
 
 @products.route("/<int:product_id>/edit", methods=["GET", "POST"])
@@ -1,18 +1,14 @@
 from flask import redirect, render_template, request, url_for
-from sqlalchemy import func
 
 from main import db
 from models.payment import BankPayment, StripePayment
 from models.product import Voucher
 from models.user import User
 
+from ..common.search import users_from_query
 from . import admin
 
 
-def to_query(q):
-    return " & ".join(q.split(" "))
-
-
 @admin.route("/search")
 def search():
     q = request.args["q"].strip()
@@ -43,18 +39,5 @@ def search():
             )
         )
 
-    email_query = to_query(q.replace("@", " "))
-
-    # Careful with the following query. It'll stop using the indexes if you change the
-    # functions applied to the indexed columns. Which isn't really the end of the world given
-    # how small our dataset is, but I spent ages trying to work out how to get Alembic to add
-    # those indexes. So humour me.
-    results = db.session.query(User).filter(
-        func.to_tsvector("simple", User.name).match(to_query(q), postgresql_regconfig="simple")
-        | (
-            func.to_tsvector("simple", func.replace(User.email, "@", " ")).match(
-                email_query, postgresql_regconfig="simple"
-            )
-        )
-    )
+    results = users_from_query(q, limit=100)
     return render_template("admin/search-results.html", q=q, results=results)
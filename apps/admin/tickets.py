@@ -21,7 +21,7 @@
 from models.user import User
 
 from ..common import feature_enabled
-from ..common.receipt import attach_tickets, render_pdf, render_receipt, set_tickets_emailed
+from ..common.receipt import attach_tickets, render_receipt, render_receipt_pdf, set_tickets_emailed
 from ..config import config
 from ..payments.refund import create_stripe_refund
 from . import admin
@@ -463,10 +463,8 @@ def transfer_ticket_user(ticket_id, email):
 def user_tickets(user_id, ext=None):
     user = get_or_404(db, User, user_id)
 
-    receipt = render_receipt(user)
-
     if ext == ".pdf":
         url = external_url(".user_tickets", user_id=user_id)
-        return send_file(render_pdf(url, receipt), mimetype="application/pdf", max_age=60)
+        return send_file(render_receipt_pdf(user, url), mimetype="application/pdf", max_age=60)
 
-    return receipt
+    return render_receipt(user)
@@ -1,4 +1,5 @@
 import re
+from collections import defaultdict
 
 from decorator import decorator
 from flask import (
@@ -18,19 +19,31 @@
 )
 from flask_login import current_user
 from markupsafe import Markup
-from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 from main import db, get_or_404
-from models.arrivals import ArrivalsView
+from models.arrivals import (
+    ArrivalsRedemption,
+    ArrivalsView,
+    ArrivalsViewProduct,
+    CheckinCode,
+    CheckinSummary,
+    add_checkin_codes,
+    refresh_checkin_summaries,
+)
 from models.permission import Permission
 from models.purchase import CheckinStateException, Purchase
-from models.user import User, checkin_code_re
+from models.user import User, checkin_code_re, verify_checkin_code
 
 from .common import json_response
-from .common.search import users_from_query
+from .common.search import arrivals_users_from_query
 
 arrivals = Blueprint("arrivals", __name__)
 
+# Scans to accept in one bulk checkin request
+BULK_CHECKIN_LIMIT = 100
+
 
 @decorator
 def arrivals_required(f, *args, **kwargs):
@@ -91,11 +104,28 @@ def checkin_qrcode(code):
     if not match:
         abort(404)
 
-    user = User.get_by_checkin_code(app.config.get("SECRET_KEY"), code)
-    return redirect(url_for(".checkin", user_id=user.id, source="code"))
+    user_id = user_id_from_checkin_code(code)
+    if user_id is None:
+        abort(404)
+    return redirect(url_for(".checkin", user_id=user_id, source="code"))
+
+
+def user_id_from_checkin_code(code):
+    """Resolve a scanned code with a single index lookup, without loading the user."""
+    user_id = db.session.scalar(select(CheckinCode.user_id).where(CheckinCode.code == code))
+    if user_id is None and not app.config.get("ARRIVALS_NODE"):
+        # Not in the index yet (e.g. rebuild_checkin_index hasn't been run)
+        user_id = verify_checkin_code(app.config["SECRET_KEY"], code)
+    return user_id
 
 
-def user_from_code(query):
+def record_redemption(purchase):
+    """On an arrivals node, keep a record of the redemption to push upstream."""
+    if app.config.get("ARRIVALS_NODE"):
+        db.session.add(ArrivalsRedemption(app.config["ARRIVALS_NODE"], purchase, purchase.redeemed))
+
+
+def user_id_from_code(query):
     if not query:
         return None
 
@@ -105,8 +135,7 @@ def user_from_code(query):
         return None
 
     code = match.group(1)
-    user = User.get_by_checkin_code(app.config.get("SECRET_KEY"), code)
-    return user
+    return user_id_from_checkin_code(code)
 
 
 @arrivals.route("/search", methods=["GET", "POST"])
@@ -129,42 +158,30 @@ def search(query=None):
         data["n"] = int(request.form.get("n"))
 
     query = query.strip()
-    user = user_from_code(query)
+    user_id = user_id_from_code(query)
 
-    if user:
-        return {"location": url_for(".checkin", user_id=user.id, source="code")}
+    if user_id is not None:
+        return {"location": url_for(".checkin", user_id=user_id, source="code")}
 
-    users_ordered = users_from_query(query)
-    users = User.query.filter(User.id.in_([u.id for u in users_ordered]))
-
-    product_ids = [p.id for p in g.arrivals_view.products]
-    purchases = (
-        users.join(User.owned_purchases)
-        .filter_by(is_paid_for=True)
-        .filter(Purchase.product_id.in_(product_ids))
-        .group_by(User.id)
-        .with_entities(User.id, func.count(User.id))
-    )
-    purchases = dict(purchases)
+    users_ordered = arrivals_users_from_query(query)
 
-    completes = (
-        users.join(User.owned_purchases)
-        .filter_by(is_paid_for=True)
-        .filter_by(redeemed=True)
-        .filter(Purchase.product_id.in_(product_ids))
+    summaries = db.session.execute(
+        select(CheckinSummary.user_id, CheckinSummary.purchases, CheckinSummary.redeemed).where(
+            CheckinSummary.view_id == g.arrivals_view.id,
+            CheckinSummary.user_id.in_([u.id for u in users_ordered]),
+        )
     )
-
-    completes = completes.group_by(User).with_entities(User.id, func.count(User.id))
-    completes = dict(completes)
+    summaries = {user_id: (purchases, redeemed) for user_id, purchases, redeemed in summaries}
 
     user_data = []
-    for u in users:
+    for u in users_ordered:
+        purchases, completes = summaries.get(u.id, (0, 0))
         user = {
             "id": u.id,
             "name": u.name,
             "email": u.email,
-            "purchases": purchases.get(u.id, 0),
-            "completes": completes.get(u.id, 0),
+            "purchases": purchases,
+            "completes": completes,
             "url": url_for(".checkin", user_id=u.id, source="typed"),
         }
         user_data.append(user)
@@ -183,7 +200,9 @@ def checkin(user_id, source=None):
     if source not in {None, "typed", "transfer", "code"}:
         abort(404)
 
-    product_ids = [p.id for p in g.arrivals_view.products]
+    product_ids = select(ArrivalsViewProduct.product_id).where(
+        ArrivalsViewProduct.view_id == g.arrivals_view.id
+    )
     purchases = (
         user.owned_purchases.filter(Purchase.product_id.in_(product_ids))
         .filter_by(is_paid_for=True)
@@ -203,6 +222,7 @@ def checkin(user_id, source=None):
             # Only allow bulk completion, not undoing
             try:
                 p.redeem()
+                record_redemption(p)
             except CheckinStateException as e:
                 failed.append((p, e))
 
@@ -257,6 +277,7 @@ def redeem_purchase(purchase_id):
 
     try:
         purchase.redeem()
+        record_redemption(purchase)
     except CheckinStateException as e:
         flash(str(e))
 
@@ -276,6 +297,7 @@ def unredeem_purchase(purchase_id):
 
     try:
         purchase.unredeem()
+        record_redemption(purchase)
     except CheckinStateException as e:
         flash(str(e))
 
@@ -284,3 +306,105 @@ def unredeem_purchase(purchase_id):
 
     back = int(request.args.get("back", purchase.owner.id))
     return redirect(url_for(".checkin", user_id=back))
+
+
+def user_id_from_item(item):
+    if isinstance(item, int):
+        return item
+
+    item = item.strip()
+    if item.isdigit():
+        return int(item)
+
+    user_id = user_id_from_code(item)
+    if user_id is None and re.match(f"{checkin_code_re}$", item):
+        user_id = user_id_from_checkin_code(item)
+    return user_id
+
+
+@arrivals.route("/checkin", methods=["POST"])
+@json_response
+@arrivals_required
+def bulk_checkin():
+    """Check in a group of users at once.
+
+    Takes a JSON object with a list of user IDs or scanned checkin codes as "items",
+    redeems every redeemable purchase in the current view that they own, and
+    returns a result for each item.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or len(items) > BULK_CHECKIN_LIMIT:
+        abort(400)
+    if not all(isinstance(item, int | str) for item in items):
+        abort(400)
+
+    user_ids = {item: user_id_from_item(item) for item in items}
+    users = {
+        u.id: u for u in db.session.scalars(select(User).where(User.id.in_(set(user_ids.values()) - {None})))
+    }
+
+    product_ids = select(ArrivalsViewProduct.product_id).where(
+        ArrivalsViewProduct.view_id == g.arrivals_view.id
+    )
+    purchases = db.session.scalars(
+        select(Purchase)
+        .where(Purchase.owner_id.in_(users), Purchase.product_id.in_(product_ids), Purchase.is_paid_for)
+        .options(selectinload(Purchase.product))
+        .order_by(Purchase.id)
+    )
+
+    owned = defaultdict(list)
+    to_redeem = set()
+    for purchase in purchases:
+        owned[purchase.owner_id].append(purchase)
+        if not purchase.redeemed and purchase.product.get_attribute("is_redeemable"):
+            to_redeem.add(purchase.id)
+
+    redeemed = Purchase.redeem_bulk(to_redeem)
+    for purchase in redeemed:
+        record_redemption(purchase)
+    redeemed_ids = {p.id for p in redeemed}
+
+    results = []
+    for item in items:
+        user = users.get(user_ids[item])
+        if user is None:
+            results.append({"item": item, "status": "unknown"})
+            continue
+
+        result = {
+            "item": item,
+            "user_id": user.id,
+            "name": user.name,
+            "checkin_note": user.checkin_note,
+            "url": url_for(".checkin", user_id=user.id),
+            "redeemed": [p.id for p in owned[user.id] if p.id in redeemed_ids],
+            # Including any redeemed by someone else since we looked
+            "already_redeemed": [
+                p.id for p in owned[user.id] if p.id not in redeemed_ids and (p.redeemed or p.id in to_redeem)
+            ],
+            "not_redeemable": [p.id for p in owned[user.id] if not p.redeemed and p.id not in to_redeem],
+        }
+        if result["redeemed"]:
+            result["status"] = "checked-in"
+        elif result["already_redeemed"]:
+            result["status"] = "already-checked-in"
+        else:
+            result["status"] = "nothing-to-redeem"
+        results.append(result)
+
+    db.session.commit()
+    return {"results": results}
+
+
+@arrivals.cli.command("rebuild_checkin_index")
+def rebuild_checkin_index():
+    """Add any missing checkin codes and recalculate every checkin summary"""
+    if not app.config.get("ARRIVALS_NODE"):
+        add_checkin_codes(db.session, select(User.id).where(User.id.not_in(select(CheckinCode.user_id))))
+    refresh_checkin_summaries(db.session)
+    db.session.commit()
+
+
+from . import arrivals_sync  # noqa
@@ -0,0 +1,518 @@
+"""
+Syncing arrivals with a local node.
+
+The gate can't rely on the main site being fast or reachable, so arrivals can run
+on a separate instance of the app (a "node", with ARRIVALS_NODE set) with its own
+database. Upstream produces signed snapshots of everything the arrivals views need,
+which the node imports and serves checkin from. Each redemption made on the node is
+recorded as an ArrivalsRedemption and pushed back upstream in batches, where the
+latest event for each purchase wins.
+
+Both ends share ARRIVALS_SYNC_TOKEN, which nodes send to authenticate to the sync
+endpoints, and ARRIVALS_SYNC_SIGNING_KEY, which signs snapshots and pushes. Nodes
+don't have the upstream SECRET_KEY, so snapshots include each user's checkin code.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import wraps
+from hmac import compare_digest
+
+import click
+import requests
+from flask import Response, abort, request
+from flask import current_app as app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import DateTime, Numeric, Table, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from main import db
+from models import naive_utcnow
+from models.arrivals import (
+    ArrivalsRedemption,
+    ArrivalsSnapshotCursor,
+    ArrivalsViewProduct,
+    refresh_checkin_summaries,
+)
+from models.permission import UserPermission
+from models.purchase import CheckinStateException, Purchase, bought_states
+from models.scheduled_task import scheduled_task
+from models.user import User, generate_checkin_code
+
+from .arrivals import arrivals
+from .common import json_response
+
+SNAPSHOT_VERSION = 1
+
+# Tables in the order they're imported, so foreign keys are satisfied.
+# Everything but users, purchases and checkin codes is small, and sent in full.
+SNAPSHOT_TABLES = [
+    "permission",
+    "user",
+    "user_permission",
+    "checkin_code",
+    "product_group",
+    "product",
+    "price_tier",
+    "price",
+    "arrivals_view",
+    "arrivals_view_product",
+    "purchase",
+]
+# Association tables, which are replaced rather than merged so removals are seen
+REPLACED_TABLES = {"user_permission", "arrivals_view_product"}
+
+USER_COLUMNS = ["id", "email", "email_state", "name", "checkin_note"]
+PURCHASE_COLUMNS = [
+    "id",
+    "type",
+    "owner_id",
+    "price_id",
+    "price_tier_id",
+    "product_id",
+    "created",
+    "modified",
+    "state",
+    "ticket_issued",
+    "redeemed",
+]
+
+# Purchases are timestamped when they're flushed, not committed, so go back a
+# little further than the last snapshot to catch any that were committed late
+SNAPSHOT_OVERLAP = timedelta(minutes=5)
+
+REDEMPTION_BATCH_SIZE = 100
+SYNC_TIMEOUT = 30
+# Pushes are sent as soon as they're signed, so anything older is a replay
+REDEMPTION_MAX_AGE = timedelta(minutes=5)
+
+
+def get_serializer(salt: str) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(app.config["ARRIVALS_SYNC_SIGNING_KEY"], salt=salt)
+
+
+def _auth_headers() -> dict[str, str]:
+    return {"Authorization": f"Bearer {app.config['ARRIVALS_SYNC_TOKEN']}"}
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode(column, value):
+    if value is None:
+        return None
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Numeric):
+        return Decimal(value)
+    return value
+
+
+def _table_data(table: Table, columns: list[str] | None = None, where=None) -> dict:
+    selected = [table.c[name] for name in columns] if columns else list(table.c)
+    query = select(*selected).order_by(*table.primary_key.columns)
+    if where is not None:
+        query = query.where(where)
+
+    return {
+        "columns": [c.name for c in selected],
+        "rows": [[_encode(v) for v in row] for row in db.session.execute(query)],
+    }
+
+
+def build_snapshot(since: datetime | None = None) -> dict:
+    """Collect the users, purchases and checkin codes the arrivals views need.
+
+    If since is given, only purchases modified after it (in any state, so the
+    node sees refunds) are included, along with their owners.
+    """
+    # Taken before querying, so nothing changed during the export is missed next time
+    cursor = naive_utcnow()
+
+    purchase = db.metadata.tables["purchase"]
+    purchase_filter = purchase.c.product_id.in_(select(ArrivalsViewProduct.product_id))
+    if since is None:
+        purchase_filter &= purchase.c.state.in_(bought_states)
+    else:
+        purchase_filter &= purchase.c.modified > since - SNAPSHOT_OVERLAP
+
+    # Arrivals staff are always included so they can log in to the node
+    user_filter = or_(
+        User.id.in_(select(purchase.c.owner_id).where(purchase_filter)),
+        User.id.in_(select(UserPermission.c.user_id)),
+    )
+
+    tables = {
+        "purchase": _table_data(purchase, PURCHASE_COLUMNS, purchase_filter),
+        "user": _table_data(db.metadata.tables["user"], USER_COLUMNS, user_filter),
+    }
+    secret_key = app.config["SECRET_KEY"]
+    tables["checkin_code"] = {
+        "columns": ["user_id", "code"],
+        "rows": [
+            [user_id, generate_checkin_code(secret_key, user_id)] for user_id, *_ in tables["user"]["rows"]
+        ],
+    }
+    for name in SNAPSHOT_TABLES:
+        if name not in tables:
+            tables[name] = _table_data(db.metadata.tables[name])
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "cursor": cursor.isoformat(),
+        "incremental": since is not None,
+        "tables": tables,
+    }
+
+
+def dump_snapshot(since: datetime | None = None) -> str:
+    return get_serializer("arrivals-snapshot").dumps(build_snapshot(since))
+
+
+def load_snapshot(signed: str) -> dict:
+    data = get_serializer("arrivals-snapshot").loads(signed)
+    if data["version"] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported arrivals snapshot version {data['version']}")
+    return data
+
+
+def get_snapshot_cursor() -> datetime | None:
+    cursor = db.session.get(ArrivalsSnapshotCursor, app.config["ARRIVALS_UPSTREAM"])
+    return cursor.cursor if cursor else None
+
+
+def import_snapshot(data: dict) -> dict[str, int]:
+    """Merge a snapshot into this node's database, returning the row count for each table.
+
+    This bypasses the ORM, so no versions are recorded for the copied rows.
+    Local redemptions that haven't been pushed yet are reapplied afterwards.
+    """
+    counts = {}
+    for name in SNAPSHOT_TABLES:
+        table = db.metadata.tables[name]
+        columns = data["tables"][name]["columns"]
+        rows = [
+            {column: _decode(table.c[column], value) for column, value in zip(columns, row, strict=True)}
+            for row in data["tables"][name]["rows"]
+        ]
+        counts[name] = len(rows)
+
+        if name in REPLACED_TABLES:
+            db.session.execute(delete(table))
+        if not rows:
+            continue
+
+        stmt = insert(table)
+        primary_key = [c.name for c in table.primary_key.columns]
+        updates = {column: stmt.excluded[column] for column in columns if column not in primary_key}
+        if updates:
+            stmt = stmt.on_conflict_do_update(index_elements=primary_key, set_=updates)
+        else:
+            stmt = stmt.on_conflict_do_nothing()
+        db.session.execute(stmt, rows)
+
+    pending = db.session.execute(
+        select(ArrivalsRedemption.purchase_id, ArrivalsRedemption.redeemed)
+        .where(ArrivalsRedemption.result.is_(None))
+        .order_by(ArrivalsRedemption.timestamp, ArrivalsRedemption.id)
+    )
+    _set_redeemed(dict(pending.tuples()))
+    # The inserts skip the ORM, so the checkin index isn't updated as we go
+    refresh_checkin_summaries(db.session)
+
+    upstream = app.config.get("ARRIVALS_UPSTREAM")
+    if upstream:
+        cursor = db.session.get(ArrivalsSnapshotCursor, upstream)
+        if cursor is None:
+            cursor = ArrivalsSnapshotCursor(upstream=upstream)
+            db.session.add(cursor)
+        cursor.cursor = datetime.fromisoformat(data["cursor"])
+
+    return counts
+
+
+def _set_redeemed(redeemed: dict[int, bool]) -> None:
+    for value in (True, False):
+        purchase_ids = [purchase_id for purchase_id, r in redeemed.items() if r is value]
+        if purchase_ids:
+            db.session.execute(
+                update(Purchase).where(Purchase.id.in_(purchase_ids)).values(redeemed=value),
+                execution_options={"synchronize_session": False},
+            )
+
+    if redeemed:
+        refresh_checkin_summaries(
+            db.session, select(Purchase.owner_id).where(Purchase.id.in_(list(redeemed)))
+        )
+
+
+def apply_redemptions(node: str, events: list[dict]) -> list[dict]:
+    """Apply redemption events pushed from a node, oldest first.
+
+    Each purchase ends up in the state given by its most recent event, whichever
+    node it came from. Events that have already been seen get their original
+    result, so a node can safely retry a push.
+    """
+    event_ids = [event["event_id"] for event in events]
+    seen = {
+        r.event_id: r
+        for r in db.session.scalars(
+            select(ArrivalsRedemption).where(ArrivalsRedemption.event_id.in_(event_ids))
+        )
+    }
+
+    purchase_ids = {event["purchase_id"] for event in events}
+    purchases = {
+        p.id: p
+        for p in db.session.scalars(
+            select(Purchase).where(Purchase.id.in_(purchase_ids)).with_for_update(of=Purchase)
+        )
+    }
+    latest = dict(
+        db.session.execute(
+            select(ArrivalsRedemption.purchase_id, func.max(ArrivalsRedemption.timestamp))
+            .where(
+                ArrivalsRedemption.purchase_id.in_(purchase_ids),
+                ArrivalsRedemption.result.in_(["applied", "unchanged"]),
+            )
+            .group_by(ArrivalsRedemption.purchase_id)
+        ).tuples()
+    )
+
+    results = {}
+    for event in sorted(events, key=lambda e: e["timestamp"]):
+        if event["event_id"] in seen:
+            results[event["event_id"]] = seen[event["event_id"]].result
+            continue
+
+        purchase = purchases.get(event["purchase_id"])
+        if purchase is None:
+            results[event["event_id"]] = "rejected"
+            continue
+
+        timestamp = datetime.fromisoformat(event["timestamp"])
+        if event["purchase_id"] in latest and timestamp <= latest[event["purchase_id"]]:
+            result = "stale"
+        elif purchase.redeemed == event["redeemed"]:
+            result = "unchanged"
+        else:
+            try:
+                if event["redeemed"]:
+                    purchase.redeem()
+                else:
+                    purchase.unredeem()
+                result = "applied"
+            except CheckinStateException as e:
+                app.logger.warning("Rejected redemption %s from %s: %s", event["event_id"], node, e)
+                result = "rejected"
+
+        if result in {"applied", "unchanged"}:
+            latest[event["purchase_id"]] = timestamp
+
+        db.session.add(
+            ArrivalsRedemption(
+                node,
+                purchase,
+                event["redeemed"],
+                event_id=event["event_id"],
+                timestamp=timestamp,
+                result=result,
+            )
+        )
+        results[event["event_id"]] = result
+
+    return [
+        {
+            "event_id": event["event_id"],
+            "result": results[event["event_id"]],
+            "redeemed": purchases[event["purchase_id"]].redeemed
+            if event["purchase_id"] in purchases
+            else None,
+        }
+        for event in events
+    ]
+
+
+def _upstream_url(path: str) -> str:
+    return app.config["ARRIVALS_UPSTREAM"].rstrip("/") + "/arrivals/sync/" + path
+
+
+def push_redemptions(batch_size: int = REDEMPTION_BATCH_SIZE) -> tuple[int, int]:
+    """Send this node's unpushed redemptions upstream, returning (pushed, conflicts).
+
+    Where upstream didn't apply an event, the local purchase is updated to match
+    upstream, unless there are later events for it still to push.
+    """
+    node = app.config["ARRIVALS_NODE"]
+    serializer = get_serializer("arrivals-redemptions")
+    pushed = conflicts = 0
+
+    while True:
+        events = list(
+            db.session.scalars(
+                select(ArrivalsRedemption)
+                .where(ArrivalsRedemption.result.is_(None))
+                .order_by(ArrivalsRedemption.timestamp, ArrivalsRedemption.id)
+                .limit(batch_size)
+            )
+        )
+        if not events:
+            break
+
+        payload = {
+            "node": node,
+            "events": [
+                {
+                    "event_id": e.event_id,
+                    "purchase_id": e.purchase_id,
+                    "redeemed": e.redeemed,
+                    "timestamp": e.timestamp.isoformat(),
+                }
+                for e in events
+            ],
+        }
+        response = requests.post(
+            _upstream_url("redemptions"),
+            data=serializer.dumps(payload),
+            headers=_auth_headers(),
+            timeout=SYNC_TIMEOUT,
+        )
+        response.raise_for_status()
+        results = {r["event_id"]: r for r in response.json()["results"]}
+
+        for event in events:
+            event.result = results[event.event_id]["result"]
+            if event.result in {"stale", "rejected"}:
+                app.logger.warning("Upstream didn't apply %r: %s", event, event.result)
+                conflicts += 1
+        db.session.flush()
+
+        still_pending = set(
+            db.session.scalars(
+                select(ArrivalsRedemption.purchase_id).where(ArrivalsRedemption.result.is_(None))
+            )
+        )
+        _set_redeemed(
+            {
+                e.purchase_id: results[e.event_id]["redeemed"]
+                for e in events
+                if e.purchase_id not in still_pending and results[e.event_id]["redeemed"] is not None
+            }
+        )
+        db.session.commit()
+        pushed += len(events)
+
+    return pushed, conflicts
+
+
+def pull_snapshot() -> dict[str, int]:
+    cursor = get_snapshot_cursor()
+    response = requests.get(
+        _upstream_url("snapshot"),
+        params={"since": cursor.isoformat()} if cursor else {},
+        headers=_auth_headers(),
+        timeout=SYNC_TIMEOUT,
+    )
+    response.raise_for_status()
+    return import_snapshot(load_snapshot(response.text))
+
+
+def _require_sync_key(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not app.config.get("ARRIVALS_SYNC_TOKEN") or not app.config.get("ARRIVALS_SYNC_SIGNING_KEY"):
+            abort(404)
+
+        auth_header = request.headers.get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            abort(401)
+
+        if not compare_digest(auth_header.removeprefix("Bearer "), app.config["ARRIVALS_SYNC_TOKEN"]):
+            abort(401)
+
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@arrivals.route("/sync/snapshot")
+@_require_sync_key
+def sync_snapshot():
+    since = request.args.get("since")
+    try:
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        abort(400)
+
+    return Response(dump_snapshot(since), mimetype="text/plain")
+
+
+@arrivals.route("/sync/redemptions", methods=["POST"])
+@_require_sync_key
+@json_response
+def sync_redemptions():
+    try:
+        payload = get_serializer("arrivals-redemptions").loads(
+            request.get_data(as_text=True), max_age=REDEMPTION_MAX_AGE.total_seconds()
+        )
+    except BadSignature:
+        abort(401)
+
+    results = apply_redemptions(payload["node"], payload["events"])
+    db.session.commit()
+    return {"results": results}
+
+
+@scheduled_task(minutes=1)
+def sync_arrivals_node():
+    """Push local redemptions upstream, then pull any changes. Only runs on arrivals nodes."""
+    if not app.config.get("ARRIVALS_NODE"):
+        return
+
+    try:
+        pushed, conflicts = push_redemptions()
+        counts = pull_snapshot()
+        db.session.commit()
+    except requests.RequestException as e:
+        app.logger.warning("Couldn't sync arrivals with upstream: %r", e)
+        db.session.rollback()
+        return
+
+    app.logger.info(
+        "Pushed %s redemptions (%s conflicts), pulled %s purchases", pushed, conflicts, counts["purchase"]
+    )
+
+
+@arrivals.cli.command("export_snapshot")
+@click.option("--since", type=click.DateTime(), help="Only include purchases modified since (UTC)")
+@click.option("-o", "--output", type=click.File("w"), default="-")
+def export_snapshot(since, output):
+    """Write a signed arrivals snapshot, for importing on an arrivals node"""
+    output.write(dump_snapshot(since))
+
+
+@arrivals.cli.command("import_snapshot")
+@click.argument("snapshot", type=click.File("r"), required=False)
+def import_snapshot_command(snapshot):
+    """Import an arrivals snapshot from a file, or from upstream if none is given"""
+    if snapshot is None:
+        counts = pull_snapshot()
+    else:
+        counts = import_snapshot(load_snapshot(snapshot.read().strip()))
+    db.session.commit()
+
+    for name, count in counts.items():
+        click.echo(f"{name}: {count}")
+
+
+@arrivals.cli.command("push_redemptions")
+@click.option("--batch-size", type=int, default=REDEMPTION_BATCH_SIZE, show_default=True)
+def push_redemptions_command(batch_size):
+    """Push this node's redemptions upstream"""
+    pushed, conflicts = push_redemptions(batch_size)
+    click.echo(f"Pushed {pushed} redemptions, {conflicts} not applied upstream")
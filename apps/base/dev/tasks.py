@@ -1,25 +1,54 @@
 """Development CLI tasks"""
 
+import random
+import tracemalloc
 from dataclasses import dataclass
 from datetime import datetime, time, timedelta
 from itertools import islice
+from time import perf_counter
+from types import SimpleNamespace
 
 import click
+from faker import Faker
 from flask import current_app as app
+from sqlalchemy import event, insert, select, text
 from sqlalchemy.exc import MultipleResultsFound, NoResultFound
 
+from apps.arrivals import user_id_from_checkin_code
+from apps.cfp.scheduler import compute_clashes
 from apps.cfp.tasks import create_tags
+from apps.common.pdf_renderer import PDFRenderer, get_pdf_renderer
+from apps.common.receipt import render_receipt
+from apps.common.search import users_from_query
 from apps.common.walletpass import generate_pkpass, generate_unsigned_pkpass
+from apps.schedule.data import (
+    ScheduleContext,
+    ScheduleFilter,
+    get_schedule_item_dict_full,
+    get_schedule_items,
+)
+from apps.schedule.feeds import _iter_frab_occurrences
+from apps.schedule.frab_exporter import FrabExporterFilter, FrabXmlExporter
 from apps.tickets.tasks import create_product_groups
 from apps.volunteer.init_data import shifts as init_shifts
-from main import db
-from models.content import Venue
+from main import db, external_url
+from models.arrivals import (
+    ArrivalsView,
+    ArrivalsViewProduct,
+    CheckinSummary,
+    add_checkin_codes,
+    refresh_checkin_summaries,
+)
+from models.content import ScheduleItem, Venue
 from models.content.schedule import ScheduleItemType
 from models.content.venue import TimeBlock
 from models.feature_flag import FeatureFlag, refresh_flags
 from models.payment import BankAccount
+from models.permission import Permission
+from models.product import Price, PriceTier, Product, ProductGroup
+from models.purchase import Purchase
 from models.site_state import SiteState, refresh_states
-from models.user import User
+from models.user import User, generate_checkin_code
 
 from ...config import config
 from . import dev_cli
@@ -272,6 +301,307 @@ def dump_pkpass(email, outfile=None, signed=False):
     click.echo(f"Wrote pass for {user.email} to {outfile}")
 
 
+class QueryCounter:
+    """Count the statements sent to the database while in use, for the benchmarks below."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *_):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(db.engine, "before_cursor_execute", self._count)
+
+
+@dev_cli.command("benchmark_pdfs")
+@click.option("--users", default=2000, help="Number of fake users with tickets to create")
+@click.option("--cold", default=10, help="Number of PDFs to render with a fresh browser each")
+def benchmark_pdfs(users, cold):
+    """Measure PDFs per second for ticket receipts, as sent by email_tickets.
+
+    This compares launching a browser per PDF (as we used to) with the pooled
+    renderer, both one at a time and with everything submitted at once.
+    Each fake user has one paid ticket, so the receipts are a realistic size.
+    """
+    group = ProductGroup(type="admissions", name="pdf-benchmark")
+    product = Product(name="pdf-benchmark", parent=group)
+    tier = PriceTier(name="pdf-benchmark", parent=product, personal_limit=1)
+    price = Price(price_tier=tier, currency="GBP", price_int=100)
+    db.session.add(price)
+
+    fake_users = [User(f"pdf-benchmark-{i}@example.com", f"PDF Benchmark {i}") for i in range(users)]
+    db.session.add_all(fake_users)
+    for user in fake_users:
+        purchase = Purchase(price, user)
+        purchase.set_state("paid")
+        db.session.add(purchase)
+    db.session.flush()
+
+    def report(name, count, elapsed):
+        click.echo(f"{name:<16}: {count} PDFs in {elapsed:.1f}s, {count / elapsed:.1f} PDFs/s")
+
+    try:
+        with app.test_request_context():
+            pages = [
+                (external_url("tickets.receipt", user_id=user.id), render_receipt(user, pdf=True))
+                for user in fake_users
+            ]
+
+            start = perf_counter()
+            for url, page in pages[:cold]:
+                renderer = PDFRenderer(concurrency=1)
+                try:
+                    renderer.render(url, page)
+                finally:
+                    renderer.close()
+            report("browser per PDF", len(pages[:cold]), perf_counter() - start)
+
+            renderer = get_pdf_renderer()
+            # Don't count the browser launch
+            renderer.render(*pages[0])
+
+            start = perf_counter()
+            for url, page in pages:
+                renderer.render(url, page)
+            report("pooled, serial", len(pages), perf_counter() - start)
+
+            start = perf_counter()
+            futures = [renderer.submit(url, page) for url, page in pages]
+            for future in futures:
+                future.result()
+            report("pooled, parallel", len(pages), perf_counter() - start)
+    finally:
+        db.session.rollback()
+
+
+@dev_cli.command("benchmark_user_search")
+@click.option("--users", default=50000, help="Number of fake users to create")
+@click.option("--repeat", default=5, help="Number of times to run each search")
+def benchmark_user_search(users, repeat):
+    """Time user searches with and without the trigram indexes.
+
+    The searches run in the same transaction as the fake users are inserted in,
+    with index and bitmap scans turned off to stand in for no indexes.
+    """
+    fake = Faker("en_GB")
+    db.session.execute(
+        insert(User),
+        [{"email": f"{i}.{fake.email()}", "name": fake.name()} for i in range(users)],
+    )
+    db.session.execute(text('ANALYZE "user"'))
+
+    queries = ["smith", "jo", "sarah jones", "example.org", "zzzz"]
+    try:
+        for indexes in [True, False]:
+            if not indexes:
+                db.session.execute(text("SET LOCAL enable_bitmapscan = off"))
+                db.session.execute(text("SET LOCAL enable_indexscan = off"))
+
+            for query in queries:
+                start = perf_counter()
+                for _ in range(repeat):
+                    results = users_from_query(query)
+                elapsed = (perf_counter() - start) / repeat
+
+                label = "indexed" if indexes else "seq scan"
+                click.echo(f"{label:<8} {query!r:<15}: {elapsed * 1000:7.1f}ms, {len(results)} results")
+    finally:
+        db.session.rollback()
+
+
+@dev_cli.command("benchmark_checkin_scan")
+@click.option("--users", default=5000, help="Number of fake users with tickets to create")
+@click.option("--scans", default=1000, help="Number of checkin codes to scan")
+def benchmark_checkin_scan(users, scans):
+    """Compare resolving scanned checkin codes via the checkin index with verifying
+    the HMAC and counting purchases for each scan, as arrivals.search used to.
+
+    Every fake user has one paid, unredeemed ticket, so each scan should find exactly that.
+    """
+    group = ProductGroup(type="admissions", name="checkin-benchmark", attributes={"is_redeemable": True})
+    product = Product(name="checkin-benchmark", parent=group)
+    tier = PriceTier(name="checkin-benchmark", parent=product)
+    price = Price(price_tier=tier, currency="GBP", price_int=100)
+    view = ArrivalsView(name="checkin-benchmark", required_permission=Permission("checkin-benchmark"))
+    db.session.add_all([price, ArrivalsViewProduct(view, product)])
+    db.session.flush()
+
+    user_ids = db.session.scalars(
+        insert(User).returning(User.id),
+        [
+            {"email": f"checkin-benchmark-{i}@example.com", "name": f"Checkin Benchmark {i}"}
+            for i in range(users)
+        ],
+    ).all()
+    db.session.execute(
+        insert(Purchase),
+        [
+            {
+                "type": "admission_ticket",
+                "price_id": price.id,
+                "price_tier_id": tier.id,
+                "product_id": product.id,
+                "owner_id": user_id,
+                "purchaser_id": user_id,
+                "state": "paid",
+            }
+            for user_id in user_ids
+        ],
+    )
+    # Bulk inserts skip the hooks which maintain the index
+    add_checkin_codes(db.session, user_ids)
+    refresh_checkin_summaries(db.session)
+    db.session.execute(text("ANALYZE checkin_code, checkin_summary, purchase"))
+
+    secret_key = app.config["SECRET_KEY"]
+    codes = [generate_checkin_code(secret_key, user_id) for user_id in random.choices(user_ids, k=scans)]
+
+    def verify_and_count(code):
+        user = User.get_by_checkin_code(secret_key, code)
+        db.session.expire(view)
+        product_ids = [p.id for p in view.products]
+        paid = user.owned_purchases.filter(Purchase.product_id.in_(product_ids)).filter_by(is_paid_for=True)
+        return paid.count(), paid.filter_by(redeemed=True).count()
+
+    def index_lookup(code):
+        user_id = user_id_from_checkin_code(code)
+        return db.session.execute(
+            select(CheckinSummary.purchases, CheckinSummary.redeemed).where(
+                CheckinSummary.user_id == user_id, CheckinSummary.view_id == view.id
+            )
+        ).one()
+
+    try:
+        for name, scan in [("HMAC and count", verify_and_count), ("checkin index", index_lookup)]:
+            with QueryCounter() as queries:
+                start = perf_counter()
+                for code in codes:
+                    assert scan(code) == (1, 0)
+                elapsed = perf_counter() - start
+            click.echo(
+                f"{name:<15}: {scans / elapsed:7.0f} scans/s, {queries.count / scans:.1f} queries per scan"
+            )
+    finally:
+        db.session.rollback()
+
+
+@dev_cli.command("benchmark_schedule")
+@click.option("--items", default=1000, help="Number of fake schedule items to create")
+@click.option("--favourites", default=100, help="Number of items the user has favourited")
+@click.option("--repeat", default=5, help="Number of times to build the schedule")
+def benchmark_schedule(items, favourites, repeat):
+    """Time building the logged-in schedule JSON over a large fake schedule.
+
+    The items are unofficial content from FakeDataGenerator, and none are committed.
+    """
+    fdg = FakeDataGenerator()
+    schedule_items = [fdg.create_schedule_item(official_content=False) for _ in range(items)]
+    for schedule_item in schedule_items:
+        schedule_item.state = "published"
+
+    user = User("schedule-benchmark@example.com", "Schedule Benchmark")
+    user.favourites = random.sample(schedule_items, min(favourites, items))
+    db.session.add(user)
+    db.session.flush()
+    published = db.session.query(ScheduleItem).filter_by(state="published").count()
+
+    try:
+        with app.test_request_context():
+            timings = []
+            for _ in range(repeat):
+                # Make sure nothing's served from the identity map
+                db.session.expire_all()
+                with QueryCounter() as queries:
+                    start = perf_counter()
+
+                    filter = ScheduleFilter(user=user)
+                    ctx = ScheduleContext.from_filter(filter)
+                    sids = [get_schedule_item_dict_full(ctx, si) for si in get_schedule_items(filter)]
+
+                    timings.append(perf_counter() - start)
+
+        click.echo(
+            f"{published} published items, {len(sids)} built: "
+            f"best {min(timings) * 1000:.1f}ms, mean {sum(timings) / repeat * 1000:.1f}ms, "
+            f"{queries.count} queries"
+        )
+    finally:
+        db.session.rollback()
+
+
+@dev_cli.command("benchmark_frab")
+def benchmark_frab():
+    """Compare peak memory for building the frab XML in one go and streaming it.
+
+    This uses whatever's scheduled in the DB, so run the scheduler first.
+    """
+
+    def measure(render):
+        db.session.expunge_all()
+        tracemalloc.start()
+        try:
+            size = render()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return size, peak
+
+    def build():
+        return len(FrabXmlExporter(FrabExporterFilter(), _iter_frab_occurrences()).run())
+
+    def stream():
+        exporter = FrabXmlExporter(FrabExporterFilter(), _iter_frab_occurrences())
+        return sum(len(chunk) for chunk in exporter.stream())
+
+    with app.test_request_context():
+        for name, render in [("run", build), ("stream", stream)]:
+            size, peak = measure(render)
+            click.echo(f"{name}: {size} bytes, peak {peak / 1024:.0f}KiB")
+
+
+@dataclass(eq=False)
+class BenchmarkOccurrence:
+    """Just enough of an Occurrence for compute_clashes, hashed by identity like a model"""
+
+    id: int
+    proposal: SimpleNamespace
+
+
+@dev_cli.command("benchmark_clashes")
+@click.option("--users", default=5000, help="Number of users with favourites")
+@click.option("--occurrences", default=500, help="Number of occurrences to favourite")
+@click.option("--repeat", default=3, help="Number of times to compute the clashes")
+def benchmark_clashes(users, occurrences, repeat):
+    """Time compute_clashes over fake favourites, including some people who favourite everything.
+
+    This doesn't touch the DB.
+    """
+    proposals = [SimpleNamespace(id=i) for i in range(occurrences)]
+    all_occurrences = [BenchmarkOccurrence(i, proposals[i]) for i in range(occurrences)]
+    # Groups of occurrences which people tend to favourite together
+    groups = [random.sample(all_occurrences, 5) for _ in range(occurrences // 20)]
+
+    user_faves = {}
+    for user_id in range(users):
+        if random.random() < 0.05:
+            faves = random.sample(all_occurrences, random.randint(occurrences // 2, occurrences))
+        else:
+            faves = random.sample(all_occurrences, random.randint(1, min(30, occurrences)))
+            faves += random.choice(groups)
+        user_faves[user_id] = faves
+    click.echo(f"{sum(len(set(f)) for f in user_faves.values())} favourites")
+
+    for _ in range(repeat):
+        start = perf_counter()
+        ranked = compute_clashes(user_faves)
+        click.echo(f"compute_clashes: {(perf_counter() - start) * 1000:.0f}ms, {len(ranked)} clashes")
+
+
 @dev_cli.command("createbankaccounts")
 def create_bank_accounts_cmd():
     create_bank_accounts()
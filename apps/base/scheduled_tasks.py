@@ -1,12 +1,14 @@
 import logging
-from datetime import timedelta
-from itertools import groupby
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from typing import Any
 
 from flask import current_app as app
 from prometheus_client import Counter
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import contains_eager, selectinload
 
 from apps.common import walletpass
 from main import db, mail
@@ -17,8 +19,28 @@
 logger = logging.getLogger(__name__)
 
 EMAIL_YIELD_INTERVAL = timedelta(seconds=30)
+# Recipients are claimed and marked as sent this many at a time
+EMAIL_BATCH_SIZE = 20
 
 email_yields = Counter("emf_email_yields", "Queued email yields")
+emails_sent = Counter("emf_emails_sent", "Queued emails sent", ["bulk"])
+
+
+@dataclass
+class EmailSendRun:
+    """State shared between the workers in a single run of send_emails"""
+
+    deadline: datetime
+    failed_ids: set[int] = field(default_factory=set)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add_failed(self, rec: EmailJobRecipient) -> None:
+        with self.lock:
+            self.failed_ids.add(rec.id)
+
+    def get_failed(self) -> list[int]:
+        with self.lock:
+            return list(self.failed_ids)
 
 
 @scheduled_task(minutes=1)
@@ -28,49 +50,105 @@ def send_emails() -> int:
 
     The job only runs once a minute, so this isn't really suitable for time-sensitive emails.
 
+    Recipients are claimed in batches with SKIP LOCKED, so several worker threads
+    (each with its own session and mail connections) can send at once without
+    doing anything twice. Sent flags are committed per batch, so if the process
+    dies mid-batch, up to EMAIL_BATCH_SIZE emails may be sent again.
+
     We yield if the process takes too long (e.g. mail server is struggling),
     as only one scheduled task can run at once.
     """
+    run = EmailSendRun(deadline=naive_utcnow() + EMAIL_YIELD_INTERVAL)
+    workers = app.config.get("EMAIL_SEND_WORKERS", 4)
+
+    if workers <= 1:
+        results = [send_email_batches(run)]
+    else:
+        flask_app = app._get_current_object()  # type: ignore[attr-defined]
 
-    start = naive_utcnow()
+        def worker() -> tuple[int, bool]:
+            with flask_app.app_context():
+                return send_email_batches(run)
 
-    recs: list[EmailJobRecipient] = list(
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send_emails") as executor:
+            futures = [executor.submit(worker) for _ in range(workers)]
+            results = [future.result() for future in futures]
+
+    if any(yielded for _, yielded in results):
+        logger.warning("Email sending is taking too long, yielding")
+        email_yields.inc()
+
+    return sum(count for count, _ in results)
+
+
+def claim_recipients(run: EmailSendRun) -> list[EmailJobRecipient]:
+    """Lock the next batch of unsent recipients that no other worker is sending."""
+    return list(
         db.session.scalars(
             select(EmailJobRecipient)
             .join(EmailJobRecipient.job)
             .options(
-                joinedload(EmailJobRecipient.job),
+                contains_eager(EmailJobRecipient.job),
+                selectinload(EmailJobRecipient.user),
             )
             .where(
                 EmailJobRecipient.sent == False,
                 EmailJobRecipient.sent_at.is_(None),
+                EmailJobRecipient.id.not_in(run.get_failed()),
             )
             .order_by(
                 EmailJob.priority,
                 EmailJob.id,
                 EmailJobRecipient.id,
             )
+            .limit(EMAIL_BATCH_SIZE)
+            # Jobs are shared between workers, so only lock the recipients
+            .with_for_update(skip_locked=True, of=EmailJobRecipient)
         )
     )
 
-    count = 0
-    for bulk, grouped_recs in groupby(recs, lambda r: r.job.bulk):
-        if bulk:
-            # Use config beginning BULK_MAIL_ on production-like systems (see apps/common/backends/bulk.py)
-            backend = app.config.get("BULK_MAIL_BACKEND")
-        else:
-            backend = None
-
-        with mail.get_connection(backend=backend) as conn:
-            for rec in grouped_recs:
-                count += send_email(conn, rec)
 
-                if naive_utcnow() - start > EMAIL_YIELD_INTERVAL:
-                    logger.warning("Email sending is taking too long, yielding")
-                    email_yields.inc()
-                    return count
+def send_email_batches(run: EmailSendRun) -> tuple[int, bool]:
+    """Send batches of recipients until there are none left or the deadline passes.
 
-    return count
+    Returns the number sent, and whether we stopped because of the deadline.
+    """
+    connections: dict[bool, Any] = {}
+    count = 0
+    try:
+        while True:
+            if naive_utcnow() > run.deadline:
+                return count, True
+
+            recs = claim_recipients(run)
+            if not recs:
+                return count, False
+
+            batch_count = 0
+            for rec in recs:
+                bulk = rec.job.bulk
+                if bulk not in connections:
+                    # Use config beginning BULK_MAIL_ on production-like systems (see apps/common/backends/bulk.py)
+                    backend = app.config.get("BULK_MAIL_BACKEND") if bulk else None
+                    connections[bulk] = mail.get_connection(backend=backend)
+                    connections[bulk].open()
+
+                sent = send_email(connections[bulk], rec)
+                if sent > 0:
+                    emails_sent.labels(bulk=str(bulk)).inc(sent)
+                else:
+                    run.add_failed(rec)
+                batch_count += sent
+
+            db.session.commit()
+            count += batch_count
+
+            if batch_count == 0:
+                logger.warning("Failed to send any of a batch of %s emails, giving up", len(recs))
+                return count, False
+    finally:
+        for conn in connections.values():
+            conn.close()
 
 
 def send_email(conn: Any, rec: EmailJobRecipient) -> int:
@@ -92,7 +170,6 @@ def send_email(conn: Any, rec: EmailJobRecipient) -> int:
     if sent_count > 0:
         rec.sent = True
         rec.sent_at = naive_utcnow()
-        db.session.commit()
 
     return sent_count
 
@@ -1,23 +1,27 @@
-from collections import Counter, defaultdict
+import hashlib
+from collections import defaultdict
+from collections.abc import Iterator
 from datetime import datetime, time, timedelta
-from itertools import combinations
 
+import numpy as np
 from flask import current_app as app
+from scipy.sparse import csr_matrix, triu
 from scipy.stats import false_discovery_control, hypergeom
 from slotmachine import Conflict, SchedulingProblem, SchedulingSolution, SlotMachine, Talk, VenueTimes
 from sqlalchemy import and_, not_, select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
 from apps.config import config
-from main import db
+from main import cache, db
 from models.content import (
     Occurrence,
     ScheduleItem,
+    ScheduleItemPresenter,
     ScheduleItemType,
-    Venue,
+    VenueTimeIndex,
 )
 from models.content.potential_schedule import PotentialSchedule, PotentialScheduleOccurrence
-from models.content.schedule import SLOT_DURATION
+from models.content.schedule import FAVOURITES_GENERATION, SLOT_DURATION
 
 # Default types considered to use for speaker/slot conflict detection, even if
 # they are not being auto-scheduled
@@ -30,6 +34,12 @@
     "djset",
 ]
 
+# Clashes are also recalculated whenever any favourites change
+CLASHES_TIMEOUT = 60 * 60
+
+# In an incremental re-solve, talks this close to a changed talk in the same venue can also move
+INCREMENTAL_NEIGHBOURHOOD = timedelta(hours=2)
+
 
 def total_minutes(delta: timedelta) -> int:
     return int(delta.total_seconds() / 60)
@@ -56,43 +66,166 @@ def compute_clashes(
     MAX_QVALUE = 0.05
 
     population = len(user_faves)
-    fans: Counter[Occurrence] = Counter()
-    popularity: Counter[tuple[Occurrence, Occurrence]] = Counter()
-    for occurrences in user_faves.values():
-        unique = set(occurrences)
-        fans.update(unique)
-        for o1, o2 in combinations(sorted(unique, key=lambda o: o.id), 2):
-            # We don't care about clashes with other occurrences of the same
-            # proposal, we have a hard constraint preventing them clashing
-            if o1.proposal == o2.proposal:
-                continue
-            popularity[(o1, o2)] += 1
+    occurrences = sorted({o for faves in user_faves.values() for o in faves}, key=lambda o: o.id)
+    column = {o: i for i, o in enumerate(occurrences)}
+
+    # A users x occurrences matrix of favourites, so A^T A counts the fans of
+    # each pair of occurrences, with the fans of each occurrence on the diagonal.
+    rows: list[int] = []
+    columns: list[int] = []
+    for row, faves in enumerate(user_faves.values()):
+        for occurrence in set(faves):
+            rows.append(row)
+            columns.append(column[occurrence])
+    favourites = csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(population, len(occurrences))
+    )
+    co_favourites = favourites.T @ favourites
+    fans = co_favourites.diagonal()
+    pairs = triu(co_favourites, k=1, format="coo")
+    a, b, counts = pairs.row, pairs.col, pairs.data
+
+    # We don't care about clashes with other occurrences of the same
+    # proposal, we have a hard constraint preventing them clashing
+    proposals = np.array([o.proposal.id if o.proposal else -1 for o in occurrences], dtype=np.int64)
+    candidates = (counts >= MIN_PEOPLE) & (proposals[a] != proposals[b])
+    a, b, counts = a[candidates], b[candidates], counts[candidates]
+    if len(counts) == 0:
+        return []
+
+    expected = fans[a] * fans[b] / population
+    # Pairs often share the same counts, and hypergeom.sf is slow per value
+    tests, inverse = np.unique(np.stack([counts, fans[a], fans[b]]), axis=1, return_inverse=True)
+    pvalues = hypergeom.sf(tests[0] - 1, population, tests[1], tests[2])[inverse.reshape(-1)]
+    qvalues = false_discovery_control(pvalues, method="bh")
+    significant = ~((counts < MIN_LIFT * expected) | (qvalues > MAX_QVALUE))
+
+    ranked = [
+        (occurrences[i], occurrences[j], count, max(1, round(count - mean)))
+        for i, j, count, mean in zip(
+            a[significant].tolist(),
+            b[significant].tolist(),
+            counts[significant].tolist(),
+            expected[significant].tolist(),
+            strict=True,
+        )
+    ]
+    ranked.sort(key=lambda r: (-r[3], r[0].id, r[1].id))
+    return ranked
 
-    candidates: list[tuple[tuple[Occurrence, Occurrence], int]] = []
-    a_fans = []
-    b_fans = []
-    for (a, b), count in popularity.items():
-        if count < MIN_PEOPLE:
-            continue
-        candidates.append(((a, b), count))
-        a_fans.append(fans[a])
-        b_fans.append(fans[b])
-
-    ranked: list[tuple[Occurrence, Occurrence, int, int]] = []
-    if candidates:
-        expected = [na * nb / population for na, nb in zip(a_fans, b_fans, strict=True)]
-        pvalues = hypergeom.sf([count - 1 for _, count in candidates], population, a_fans, b_fans)
-        qvalues = false_discovery_control(pvalues, method="bh")
-
-        for ((o1, o2), count), mean, qvalue in zip(candidates, expected, qvalues, strict=True):
-            if count < MIN_LIFT * mean or qvalue > MAX_QVALUE:
-                continue
-            ranked.append((o1, o2, count, max(1, round(count - mean))))
-        ranked.sort(key=lambda r: r[3], reverse=True)
 
+def get_clashes(user_faves: dict[int, list[Occurrence]]) -> list[tuple[Occurrence, Occurrence, int, int]]:
+    """compute_clashes, cached until any favourites change.
+
+    user_faves must contain every favourite of the occurrences it includes, so
+    the result only depends on which occurrences are included.
+    """
+    occurrences = {o.id: o for faves in user_faves.values() for o in faves}
+    included = sorted((o.id, o.schedule_item.proposal_id) for o in occurrences.values())
+    digest = hashlib.sha256(repr(included).encode()).hexdigest()
+    key = f"clashes/{FAVOURITES_GENERATION.get()}/{digest}"
+
+    cached = cache.get(key)
+    if cached is not None:
+        return [(occurrences[a], occurrences[b], count, weight) for a, b, count, weight in cached]
+
+    ranked = compute_clashes(user_faves)
+    cache.set(
+        key, [(o1.id, o2.id, count, weight) for o1, o2, count, weight in ranked], timeout=CLASHES_TIMEOUT
+    )
     return ranked
 
 
+def overlapping_pairs(intervals: list[tuple[datetime, datetime, int]]) -> Iterator[tuple[int, int]]:
+    """Yield the IDs of each pair of overlapping (start, end, id) intervals."""
+    active: list[tuple[datetime, int]] = []
+    for start, end, id in sorted(intervals):
+        active = [(e, i) for e, i in active if e > start]
+        for _, other in active:
+            yield other, id
+        active.append((end, id))
+
+
+def restrict_to_changes(
+    talks: list[Talk],
+    conflicts: list[Conflict],
+    free: set[int],
+    previous_slots: dict[int, tuple[int, datetime]],
+) -> tuple[list[Conflict], set[int], set[int]]:
+    """Pin talks which don't need to move to their previous slots, for an incremental re-solve.
+
+    A talk in `free` has changed if its previous slot is missing, is no longer
+    allowed, or overlaps another talk in the same venue or with the same speaker.
+    Changed talks are re-solved along with nearby talks in the same venue and
+    talks sharing a speaker, and everything else is fixed where it was. Previous
+    slots are also given to the solver as a starting point.
+
+    Talks are modified in place. Returns the conflicts which involve a talk being
+    re-solved, the IDs of the changed talks, and the IDs of all talks being re-solved.
+    """
+    slots: dict[int, tuple[int, datetime]] = {}
+    for talk in talks:
+        if talk.id in previous_slots:
+            slots[talk.id] = previous_slots[talk.id]
+        elif talk.venue is not None and talk.start_time is not None:
+            slots[talk.id] = (talk.venue, talk.start_time)
+
+    def fits(talk: Talk, venue: int, start: datetime) -> bool:
+        end = start + timedelta(minutes=talk.duration)
+        return any(
+            vt.venue == venue and any(s <= start and end <= e for s, e in vt.times) for vt in talk.venue_times
+        )
+
+    changed = {
+        talk.id
+        for talk in talks
+        if talk.id in free and (talk.id not in slots or not fits(talk, *slots[talk.id]))
+    }
+
+    by_venue: dict[int, list[tuple[datetime, datetime, int]]] = defaultdict(list)
+    by_speaker: dict[int, list[tuple[datetime, datetime, int]]] = defaultdict(list)
+    for talk in talks:
+        if talk.id not in slots or talk.id in changed:
+            continue
+        venue, start = slots[talk.id]
+        interval = (start, start + timedelta(minutes=talk.duration + talk.minutes_after), talk.id)
+        by_venue[venue].append(interval)
+        for speaker in talk.speakers:
+            by_speaker[speaker].append(interval)
+
+    for intervals in [*by_venue.values(), *by_speaker.values()]:
+        for a, b in overlapping_pairs(intervals):
+            changed |= {a, b} & free
+
+    resolved = set(changed)
+    talks_by_id = {talk.id: talk for talk in talks}
+    for talk in talks:
+        if talk.id not in free or talk.id in changed:
+            continue
+        for changed_id in changed:
+            other = talks_by_id[changed_id]
+            if talk.speakers & other.speakers:
+                resolved.add(talk.id)
+            elif talk.id in slots and changed_id in slots:
+                venue, start = slots[talk.id]
+                other_venue, other_start = slots[changed_id]
+                if venue == other_venue and abs(start - other_start) <= INCREMENTAL_NEIGHBOURHOOD:
+                    resolved.add(talk.id)
+
+    for talk in talks:
+        if talk.id not in free or talk.id not in slots:
+            continue
+        venue, start = slots[talk.id]
+        if talk.id not in resolved:
+            talk.venue_times = [
+                VenueTimes(venue=venue, times=[(start, start + timedelta(minutes=talk.duration))])
+            ]
+        if talk.id not in resolved or fits(talk, venue, start):
+            talk.venue, talk.start_time = venue, start
+
+    return [c for c in conflicts if c.talks & resolved], changed, resolved
+
+
 class Scheduler:
     """Automatic Scheduler
 
@@ -104,6 +237,9 @@ def __init__(self):
         self.venues = {}
         # Occurrences that we couldn't feed to the scheduler because they're lacking information
         self.unschedulable: list[Occurrence] = []
+        # For incremental runs, the occurrences which needed moving, and all those being re-solved
+        self.changed: set[int] = set()
+        self.resolved: set[int] | None = None
 
     def get_schedulable_occurrences(self) -> list[Occurrence]:
         """Fetch a list of Occurrences that the automatic scheduler should consider
@@ -126,6 +262,14 @@ def get_schedulable_occurrences(self) -> list[Occurrence]:
             )
             .options(joinedload(Occurrence.schedule_item).joinedload(ScheduleItem.proposal))
             .options(joinedload(Occurrence.schedule_item).selectinload(ScheduleItem.favourited_by))
+            .options(joinedload(Occurrence.schedule_item).joinedload(ScheduleItem.user))
+            .options(joinedload(Occurrence.schedule_item).selectinload(ScheduleItem.availability))
+            .options(
+                joinedload(Occurrence.schedule_item)
+                .selectinload(ScheduleItem.schedule_item_presenters)
+                .joinedload(ScheduleItemPresenter.user)
+            )
+            .options(selectinload(Occurrence.allowed_venues))
             .order_by(ScheduleItem.favourite_count.desc())
         ).all()
 
@@ -136,6 +280,8 @@ def get_schedule_problem(
         types: list[ScheduleItemType],
         conflict_types: list[ScheduleItemType] | None = None,
         max_clashes: int = 1000,
+        incremental: bool = False,
+        previous: PotentialSchedule | None = None,
     ) -> SchedulingProblem:
         # "types" are the content types to auto-schedule. All other types are
         # fixed in place as if manually scheduled and present only for speaker
@@ -144,8 +290,15 @@ def get_schedule_problem(
         # "conflict_types" are the content types to consider when they are not
         # being auto-scheduled but we want to consider them for speaker and
         # slot conflict detection
+        #
+        # If "incremental" is set, only occurrences which no longer fit in their
+        # slot in "previous" (or the current schedule) are re-solved, along with
+        # their neighbours. Everything else stays where it was.
         if conflict_types is None:
             conflict_types = DEFAULT_CONFLICT_TYPES
+
+        # Load venues first so the occurrences' scheduled venues come from the session
+        index = VenueTimeIndex.load()
         occurrences = self.get_schedulable_occurrences()
 
         occurrences_by_type: dict[ScheduleItemType, list[Occurrence]] = defaultdict(list)
@@ -153,8 +306,7 @@ def get_schedule_problem(
             occurrences_by_type[occurrence.schedule_item.type].append(occurrence)
 
         capacity_by_type: dict[ScheduleItemType, dict[int, int]] = defaultdict(dict)
-        venues: list[Venue] = list(db.session.scalars(select(Venue)))
-        for venue in venues:
+        for venue in index.venues.values():
             self.venues[venue.id] = venue
             for block in venue.time_blocks:
                 if not venue.capacity:
@@ -185,7 +337,7 @@ def get_schedule_problem(
                     # in the sorted favourites list to indicate how popular it
                     # is, multiplied by venue capacity rank to weight it
                     fav_rank = 10 - (i * 10 // len(occurrences))
-                    allowed_times = occurrence.allowed_times(True)
+                    allowed_times = occurrence.allowed_times(True, index)
 
                     venue_times = [
                         VenueTimes(
@@ -224,7 +376,7 @@ def get_schedule_problem(
                 # Manually scheduled content in a non-automatically scheduled timeblock
                 # doesn't need changeover time because we placed it there
                 if occurrence.manually_scheduled and any(
-                    not block.automatic for block in occurrence.time_blocks()
+                    not block.automatic for block in occurrence.time_blocks(index)
                 ):
                     minutes_after = 0
                 else:
@@ -256,7 +408,7 @@ def get_schedule_problem(
         # between them. Uses the same model as the clashfinder.
         conflicts = [
             Conflict(talks={o1.id, o2.id}, weight=weight)
-            for o1, o2, _count, weight in compute_clashes(user_faves)[:max_clashes]
+            for o1, o2, _count, weight in get_clashes(user_faves)[:max_clashes]
         ]
 
         # Encourage occurrences of items flagged "spread across days" onto
@@ -282,6 +434,19 @@ def get_schedule_problem(
             if 2 <= len(occurrence_ids) <= len(event_day_ranges)
         ]
 
+        if incremental:
+            previous_slots = (
+                {so.occurrence_id: (so.venue_id, so.start_time) for so in previous.scheduled_occurrences}
+                if previous
+                else {}
+            )
+            free = {
+                talk.id for talk in scheduler_talks if self.occurrences[talk.id].schedule_item.type in types
+            }
+            conflicts, self.changed, self.resolved = restrict_to_changes(
+                scheduler_talks, conflicts, free, previous_slots
+            )
+
         return SchedulingProblem(
             talks=scheduler_talks, conflicts=conflicts, slot_duration=total_minutes(SLOT_DURATION)
         )
@@ -294,6 +459,11 @@ def generate_potential_schedule(self, solution: SchedulingSolution) -> Potential
             "timings": {name: td.total_seconds() for name, td in solution.timings.items()},
             "variables": solution.variables,
         }
+        if self.resolved is not None:
+            potential_schedule.scheduler_stats["incremental"] = {
+                "changed": sorted(self.changed),
+                "resolved": len(self.resolved),
+            }
 
         potential_schedule.scheduled_occurrences = [
             PotentialScheduleOccurrence(
@@ -311,8 +481,10 @@ def run(
         conflict_types: list[ScheduleItemType] | None = None,
         max_clashes: int = 1000,
         runtime: int = 30,
+        incremental: bool = False,
+        previous: PotentialSchedule | None = None,
     ) -> PotentialSchedule:
-        problem = self.get_schedule_problem(types, conflict_types, max_clashes)
+        problem = self.get_schedule_problem(types, conflict_types, max_clashes, incremental, previous)
         if len(problem.talks) == 0:
             raise Exception("No talks to schedule")
 
@@ -0,0 +1,248 @@
+"""Run the automatic scheduler in the background.
+
+Solving can take minutes, which is far too long for a web request, so each run
+is queued as a SchedulerJob and run in its own `flask cfp run_scheduler_job`
+process. Several jobs can run at once to compare different parameters.
+"""
+
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+from typing import Any
+
+from flask import current_app as app
+from slotmachine import SchedulingProblem, SchedulingSolution, SlotMachine, Unsatisfiable
+from sqlalchemy import func, select
+
+from main import db
+from models import naive_utcnow
+from models.content import ScheduleItemType
+from models.content.potential_schedule import PotentialSchedule, SchedulerJob, SchedulerJobState
+from models.scheduled_task import scheduled_task
+
+from .scheduler import Scheduler
+
+# How often a running job records its progress and checks whether it's been cancelled
+HEARTBEAT_INTERVAL = 5
+
+# Running jobs which haven't recorded any progress for this long have died
+STALE_JOB_TIMEOUT = timedelta(minutes=5)
+
+# Postgres advisory lock held while starting jobs, so only one process counts
+# and claims them at a time
+START_JOBS_LOCK = 0x5C4ED
+
+
+class SchedulerJobCancelled(Exception):
+    pass
+
+
+def queue_scheduler_job(
+    types: list[ScheduleItemType],
+    conflict_types: list[ScheduleItemType],
+    max_clashes: int,
+    runtime: int,
+    incremental: bool = False,
+    previous: PotentialSchedule | None = None,
+) -> SchedulerJob:
+    """Queue a scheduler run. Incremental runs only move what they have to from
+    the `previous` potential schedule, or the current schedule if there isn't one.
+    """
+    job = SchedulerJob(
+        parameters={
+            "types": types,
+            "conflict_types": conflict_types,
+            "max_clashes": max_clashes,
+            "runtime": runtime,
+            "incremental": incremental,
+            "previous_schedule_id": previous.id if previous else None,
+        },
+        progress={},
+    )
+    db.session.add(job)
+    return job
+
+
+def launch_job(job_id: int) -> None:
+    """Start a process to run a job, which carries on after this request or process ends."""
+    subprocess.Popen(
+        [sys.executable, "-m", "flask", "cfp", "run_scheduler_job", str(job_id)],
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def start_queued_jobs() -> list[SchedulerJob]:
+    """Start as many queued jobs as there's room for, oldest first.
+
+    Each job's solver uses several cores, so only SCHEDULER_JOB_CONCURRENCY run at once.
+    """
+    limit = app.config.get("SCHEDULER_JOB_CONCURRENCY", 2)
+    # Otherwise two processes could both see a free slot and fill it. This is
+    # released when the claimed jobs are committed.
+    db.session.execute(select(func.pg_advisory_xact_lock(START_JOBS_LOCK)))
+    running = db.session.scalar(select(func.count(SchedulerJob.id)).where(SchedulerJob.state == "running"))
+    if running >= limit:
+        db.session.commit()
+        return []
+
+    jobs = list(
+        db.session.scalars(
+            select(SchedulerJob)
+            .where(SchedulerJob.state == "queued")
+            .order_by(SchedulerJob.created, SchedulerJob.id)
+            .limit(limit - running)
+            .with_for_update()
+        )
+    )
+    now = naive_utcnow()
+    for job in jobs:
+        job.state = "running"
+        job.started = job.heartbeat = now
+    db.session.commit()
+
+    for job in jobs:
+        try:
+            launch_job(job.id)
+        except OSError as e:
+            app.logger.exception("Couldn't start scheduler job %s", job.id)
+            finish_job(job, "failed", f"Couldn't start job: {e}")
+            db.session.commit()
+
+    return jobs
+
+
+def finish_job(job: SchedulerJob, state: SchedulerJobState, error: str | None = None) -> None:
+    job.state = state
+    job.error = error
+    job.finished = naive_utcnow()
+    job.update_progress(phase=state)
+
+
+def check_cancelled(job: SchedulerJob) -> None:
+    """Record the job's progress, and stop if someone's cancelled it."""
+    db.session.commit()
+    # The commit expired the job, so this is fresh from the database
+    if job.cancel_requested:
+        raise SchedulerJobCancelled()
+
+
+def solve(job: SchedulerJob, problem: SchedulingProblem, runtime: int) -> SchedulingSolution:
+    """Run the solver in a thread, so this one can keep recording progress."""
+    result: dict[str, Any] = {}
+
+    def run() -> None:
+        try:
+            result["solution"] = SlotMachine(problem).solve(max_time_in_seconds=runtime)
+        except Exception as e:
+            result["error"] = e
+
+    start = time.monotonic()
+    # The solver can't be interrupted, so if the job's cancelled it's left to die with the process
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        thread.join(HEARTBEAT_INTERVAL)
+        job.update_progress(elapsed=round(time.monotonic() - start))
+        check_cancelled(job)
+
+    if "error" in result:
+        raise result["error"]
+    return result["solution"]
+
+
+def run_job(job_id: int) -> SchedulerJobState:
+    """Run a scheduler job to completion in this process, returning the state it ended in."""
+    job = db.session.get(SchedulerJob, job_id)
+    if job is None:
+        raise ValueError(f"No scheduler job with ID {job_id}")
+
+    if job.state == "queued":
+        # Run directly rather than by start_queued_jobs
+        job.state = "running"
+        job.started = naive_utcnow()
+    elif job.state != "running":
+        app.logger.warning("Scheduler job %s is %s, not running it", job.id, job.state)
+        return job.state
+
+    params = job.parameters
+    scheduler = Scheduler()
+    try:
+        job.update_progress(phase="building")
+        check_cancelled(job)
+        previous = None
+        if params.get("previous_schedule_id"):
+            previous = db.session.get(PotentialSchedule, params["previous_schedule_id"])
+        problem = scheduler.get_schedule_problem(
+            params["types"],
+            params["conflict_types"],
+            params["max_clashes"],
+            params.get("incremental", False),
+            previous,
+        )
+        unschedulable = [o.id for o in scheduler.unschedulable]
+        job.update_progress(
+            phase="solving",
+            elapsed=0,
+            talks=len(problem.talks),
+            conflicts=len(problem.conflicts),
+            unschedulable=unschedulable,
+        )
+        if scheduler.resolved is not None:
+            job.update_progress(changed=sorted(scheduler.changed), resolved=len(scheduler.resolved))
+        check_cancelled(job)
+        if len(problem.talks) == 0:
+            raise Exception("No talks to schedule")
+
+        solution = solve(job, problem, params["runtime"])
+
+        potential_schedule = scheduler.generate_potential_schedule(solution)
+        potential_schedule.scheduler_stats |= {"parameters": params, "unschedulable": unschedulable}
+        job.potential_schedule = potential_schedule
+        finish_job(job, "finished")
+
+    except SchedulerJobCancelled:
+        app.logger.info("Scheduler job %s cancelled", job.id)
+        finish_job(job, "cancelled")
+
+    except Unsatisfiable as e:
+        app.logger.exception("Unsatisfiable schedule")
+        finish_job(job, "failed", f"Schedule was unsatisfiable :( ({e.status})")
+
+    except Exception as e:
+        app.logger.exception("Scheduler job %s failed", job.id)
+        db.session.rollback()
+        finish_job(job, "failed", f"Scheduler failed: {e}")
+
+    db.session.commit()
+
+    # There's room for another job now
+    start_queued_jobs()
+    return job.state
+
+
+def cancel_job(job: SchedulerJob) -> None:
+    if job.state == "queued":
+        finish_job(job, "cancelled")
+    elif job.state == "running":
+        job.cancel_requested = True
+
+
+@scheduled_task(minutes=1)
+def check_scheduler_jobs() -> dict[str, Any]:
+    """Fail any scheduler jobs whose process has died, and start queued jobs."""
+    stale = db.session.scalars(
+        select(SchedulerJob).where(
+            SchedulerJob.state == "running",
+            SchedulerJob.heartbeat < naive_utcnow() - STALE_JOB_TIMEOUT,
+        )
+    ).all()
+    for job in stale:
+        app.logger.warning("Scheduler job %s stopped responding", job.id)
+        finish_job(job, "failed", "Job stopped responding")
+    db.session.commit()
+
+    started = start_queued_jobs()
+    return {"failed": [job.id for job in stale], "started": [job.id for job in started]}
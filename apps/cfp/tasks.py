@@ -1,3 +1,5 @@
+import logging
+import os
 from csv import DictReader
 
 import click
@@ -18,6 +20,7 @@
 from models.user import User
 
 from . import cfp
+from .scheduler_jobs import run_job
 
 
 @cfp.cli.command("import")
@@ -134,3 +137,14 @@ def delete_tags(tags_to_delete):
 
     db.session.commit()
     app.logger.info(f"Successfully deleted {tags_deleted} tags.")
+
+
+@cfp.cli.command("run_scheduler_job")
+@click.argument("job_id", type=int)
+def run_scheduler_job(job_id):
+    """Run a queued automatic scheduler job"""
+    state = run_job(job_id)
+    if state == "cancelled":
+        # The solver thread can't be stopped, so don't wait for it
+        logging.shutdown()
+        os._exit(0)
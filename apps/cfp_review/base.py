@@ -51,7 +51,7 @@
     ReversionForm,
     SendMessageForm,
 )
-from .majority_judgement import calculate_max_normalised_score
+from .majority_judgement import calculate_max_normalised_scores
 
 
 @cfp_review.route("/")
@@ -472,12 +472,28 @@ def rank(round_id: int) -> ResponseReturnValue:
     form = AcceptanceForm()
     scored_proposals = []
 
-    for round_prop in round.proposal_rounds:
-        if round_prop.outcome == "not-enough-votes":
-            continue
-        score_list = [v.vote for v in round_prop.proposal.votes if v.state == "voted" and v.vote]
-        score = calculate_max_normalised_score(score_list)
-        scored_proposals.append((round_prop.proposal, score))
+    ranked_rounds = select(ProposalRound).where(
+        ProposalRound.round == round, ProposalRound.outcome != "not-enough-votes"
+    )
+    proposal_rounds = {
+        round_prop.proposal_id: round_prop
+        for round_prop in db.session.scalars(
+            ranked_rounds.options(joinedload(ProposalRound.proposal)).order_by(ProposalRound.proposal_id)
+        )
+    }
+    # Abstentions and zero votes are ignored
+    ranked_proposal_ids = ranked_rounds.with_only_columns(ProposalRound.proposal_id)
+    votes = db.session.execute(
+        select(ProposalVote.proposal_id, ProposalVote.vote).where(
+            ProposalVote.proposal_id.in_(ranked_proposal_ids),
+            ProposalVote.state == "voted",
+            ProposalVote.vote != 0,
+        )
+    ).all()
+    scores = calculate_max_normalised_scores([p for p, _ in votes], [v for _, v in votes])
+
+    for proposal_id, round_prop in proposal_rounds.items():
+        scored_proposals.append((round_prop.proposal, scores.get(proposal_id, 0)))
 
     scored_proposals = sorted(scored_proposals, key=lambda p: p[1], reverse=True)
 
@@ -495,14 +511,7 @@ def rank(round_id: int) -> ResponseReturnValue:
                 if proposal.state != "anonymised":
                     continue
 
-                proposal_round = (
-                    db.session.query(ProposalRound)
-                    .where(
-                        ProposalRound.round == round,
-                        ProposalRound.proposal == proposal,
-                    )
-                    .one()
-                )
+                proposal_round = proposal_rounds[proposal.id]
                 proposal_round.score = score
                 app.logger.info(f"score is {score}, type is {type(score)}")
 
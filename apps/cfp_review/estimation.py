@@ -13,7 +13,7 @@
     Venue,
 )
 from models.content.schedule import EVENT_SPACING, SCHEDULE_ITEM_INFOS, SLOT_DURATION, ScheduleItemInfo
-from models.content.venue import TimeBlock
+from models.content.venue import TimeBlock, VenueTimeIndex
 
 # Estimates either cover automatically-scheduled or manually-scheduled content.
 type EstimateType = Literal["automatic", "manual"]
@@ -68,6 +68,7 @@ def get_cfp_estimate(schedule_item_type: ScheduleItemType, estimate_type: Estima
 
     missing_occurrences = 0
     occurrence_count = 0
+    index = VenueTimeIndex.load()
 
     for schedule_item in schedule_items:
         if len(schedule_item.occurrences) == 0:
@@ -80,7 +81,7 @@ def get_cfp_estimate(schedule_item_type: ScheduleItemType, estimate_type: Estima
             # An occurrence counts as automatically scheduled if it can be placed in any timeblock
             # that is both a default venue for its content type and marked as automatic.
             can_be_automatically_scheduled = any(
-                time_block.automatic and time_block.default for time_block in occurrence.time_blocks()
+                time_block.automatic and time_block.default for time_block in occurrence.time_blocks(index)
             )
 
             if (can_be_automatically_scheduled and estimate_type == "manual") or (
@@ -22,8 +22,19 @@
     4. For each member of a group remove one instance of that group's
        median rating from the member's score
     5. Repeat steps 2-4 until the submissions are sorted or each group is empty
+
+The batch functions score every submission in a round at once. Because the
+floor median is always taken from a sorted list, the order in which ratings are
+removed only depends on how many there are, so submissions with the same
+number of ratings can be scored together as rows of an array.
 """
 
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from functools import cache
+
+import numpy as np
+
 
 class MajorityJudgementException(Exception):
     pass
@@ -115,3 +126,100 @@ def calculate_normalised_score(score_list, max_score_length, default_vote=1, bas
         score_list = score_list + to_add
 
     return calculate_score(score_list, base)
+
+
+@cache
+def get_mj_order(length: int) -> np.ndarray:
+    """
+    Return the indices of a sorted score list of this length, in the order the
+    MJ algorithm takes them (e.g. [1, 2, 0, 3] for 4 scores)
+    """
+    indices = list(range(length))
+    order = []
+    while indices:
+        order.append(indices.pop((len(indices) - 1) // 2))
+    result = np.array(order, dtype=np.intp)
+    # It's cached, so make sure nobody changes it
+    result.flags.writeable = False
+    return result
+
+
+def _batch_scores(
+    keys: Sequence[int], scores: Sequence[int], base: int
+) -> Iterator[tuple[np.ndarray, np.ndarray, int]]:
+    """
+    Given one (key, score) pair per vote, yield arrays of keys and their
+    calculate_score values, grouped by vote count, with the maximum score for
+    that many votes.
+    """
+    key_array = np.asarray(keys, dtype=np.int64)
+    score_array = np.asarray(scores, dtype=np.int64)
+    invalid = (score_array < 0) | (score_array >= base)
+    if invalid.any():
+        raise MajorityJudgementException(
+            f"Incorrectly set base. Got {score_array[invalid][0]}, expected 0 <= values < {base}"
+        )
+
+    # Sorting by key then score gives each key's sorted scores as a contiguous run
+    order = np.lexsort((score_array, key_array))
+    key_array, score_array = key_array[order], score_array[order]
+    unique_keys, starts, counts = np.unique(key_array, return_index=True, return_counts=True)
+
+    for length in np.unique(counts).tolist():
+        rows = counts == length
+        digits = score_array[starts[rows, np.newaxis] + get_mj_order(length)]
+        max_score = base**length - 1
+        if max_score <= np.iinfo(np.int64).max:
+            powers = base ** np.arange(length - 1, -1, -1, dtype=np.int64)
+        else:
+            # Too big for int64, so fall back to Python ints
+            digits = digits.astype(object)
+            powers = np.array([base**i for i in range(length - 1, -1, -1)], dtype=object)
+        yield unique_keys[rows], digits @ powers, max_score
+
+
+def _group_scores(keys: Sequence[int], scores: Sequence[int]) -> dict[int, list[int]]:
+    score_lists: dict[int, list[int]] = defaultdict(list)
+    for key, score in zip(keys, scores, strict=True):
+        score_lists[key].append(score)
+    return score_lists
+
+
+def calculate_scores(keys: Sequence[int], scores: Sequence[int], base: int = 3) -> dict[int, int]:
+    """
+    calculate_score for many score lists at once, given as parallel sequences
+    with one entry per vote. Returns a dict of key to score.
+    """
+    if base > 10:
+        # calculate_score writes each rating out as a decimal string, so
+        # ratings of 10 or more don't map to a single digit
+        return {
+            key: calculate_score(score_list, base) for key, score_list in _group_scores(keys, scores).items()
+        }
+
+    return {
+        key: int(score)
+        for batch_keys, batch_scores, _ in _batch_scores(keys, scores, base)
+        for key, score in zip(batch_keys.tolist(), batch_scores.tolist(), strict=True)
+    }
+
+
+def calculate_max_normalised_scores(
+    keys: Sequence[int], scores: Sequence[int], base: int = 3
+) -> dict[int, float]:
+    """
+    calculate_max_normalised_score for many score lists at once, given as
+    parallel sequences with one entry per vote. Keys with no votes are omitted.
+    """
+    if base > 10:
+        # As in calculate_scores
+        return {
+            key: calculate_max_normalised_score(score_list, base)
+            for key, score_list in _group_scores(keys, scores).items()
+        }
+
+    return {
+        key: float(score) / max_score
+        for batch_keys, batch_scores, max_score in _batch_scores(keys, scores, base)
+        for key, score in zip(batch_keys.tolist(), batch_scores.tolist(), strict=True)
+    }
@@ -7,14 +7,14 @@
 from typing import Any, cast, get_args
 
 import slotmachine
-from flask import current_app as app
 from flask import flash, jsonify, redirect, render_template, request, send_file, url_for
 from flask.typing import ResponseReturnValue
 from sqlalchemy import and_, not_, select
 from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import desc
 
-from apps.cfp.scheduler import DEFAULT_CONFLICT_TYPES, Scheduler, compute_clashes
+from apps.cfp.scheduler import DEFAULT_CONFLICT_TYPES, Scheduler, get_clashes
+from apps.cfp.scheduler_jobs import cancel_job, queue_scheduler_job, start_queued_jobs
 from apps.cfp_review.email import ProposalEmailReason, send_email_for_proposal
 from apps.cfp_review.estimation import get_cfp_estimate
 from apps.config import config
@@ -25,7 +25,7 @@
     ScheduleItem,
     Venue,
 )
-from models.content.potential_schedule import PotentialSchedule, PotentialScheduleOccurrence
+from models.content.potential_schedule import PotentialSchedule, PotentialScheduleOccurrence, SchedulerJob
 from models.content.schedule import (
     SCHEDULE_ITEM_INFOS,
     ScheduleItemInfo,
@@ -145,39 +145,52 @@ def run_scheduler():
     ]
 
     if request.method == "POST" and request.form.get("run"):
-        types = request.form.getlist("auto_type")
-        conflict_types = request.form.getlist("conflict_type")
-        max_clashes = request.form.get("max_clashes", 1000, type=int)
-        runtime = request.form.get("runtime", 30, type=int)
-        scheduler = Scheduler()
-        result = None
-        try:
-            result = scheduler.run(types, conflict_types, max_clashes, runtime)
-        except slotmachine.Unsatisfiable as e:
-            app.logger.exception("Unsatisfiable schedule")
-            flash(f"Schedule was unsatisfiable :( ({e.status})")
-        except Exception as e:
-            app.logger.exception("Scheduler failed")
-            flash(f"Scheduler failed: {e}")
-
-        if scheduler.unschedulable:
-            ids = ", ".join(str(o.id) for o in scheduler.unschedulable)
-            flash(
-                f"{len(scheduler.unschedulable)} occurrences unschedulable due to lack of times. May be manually scheduled outside a timeblock, or there are no automatic timeblocks of that type. Occurrence IDs: {ids}"
-            )
+        incremental = request.form.get("incremental") == "true"
+        # Start from the schedule shown in the tweaker
+        draft, automatic = latest_new_schedules()
+        job = queue_scheduler_job(
+            cast("list[ScheduleItemType]", request.form.getlist("auto_type")),
+            cast("list[ScheduleItemType]", request.form.getlist("conflict_type")),
+            request.form.get("max_clashes", 1000, type=int),
+            request.form.get("runtime", 30, type=int),
+            incremental,
+            (draft or automatic) if incremental else None,
+        )
+        db.session.commit()
+        start_queued_jobs()
+        flash(f"Scheduler job {job.id} queued")
+        return redirect(url_for(".run_scheduler"))
 
-        if result is not None:
-            db.session.add(result)
-            db.session.commit()
-            return redirect(url_for(".potential_schedule", schedule_id=result.id))
+    jobs = db.session.scalars(
+        select(SchedulerJob)
+        .options(joinedload(SchedulerJob.potential_schedule))
+        .order_by(desc(SchedulerJob.created))
+        .limit(20)
+    ).all()
 
     return render_template(
         "cfp_review/schedule/schedule_run.html",
         type_options=type_options,
         conflict_type_options=conflict_type_options,
+        jobs=jobs,
+        refresh=any(job.active for job in jobs),
     )
 
 
+@cfp_review.route("/schedule/run-scheduler/job/<int:job_id>/cancel", methods=["POST"])
+@schedule_required
+def cancel_scheduler_job(job_id: int) -> ResponseReturnValue:
+    job = get_or_404(db, SchedulerJob, job_id)
+    if not job.active:
+        flash(f"Scheduler job {job.id} has already stopped")
+        return redirect(url_for(".run_scheduler"))
+
+    cancel_job(job)
+    db.session.commit()
+    flash(f"Cancelling scheduler job {job.id}")
+    return redirect(url_for(".run_scheduler"))
+
+
 @cfp_review.route("/schedule/run-scheduler/export.json")
 @schedule_required
 def run_scheduler_export() -> ResponseReturnValue:
@@ -547,7 +560,7 @@ def clashfinder() -> ResponseReturnValue:
             user_faves[user.id] += schedule_item.occurrences
 
     population = len(user_faves)
-    ranked = compute_clashes(user_faves)
+    ranked = get_clashes(user_faves)
 
     show_all = request.args.get("show_all") == "true"
 
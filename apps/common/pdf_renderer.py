@@ -0,0 +1,132 @@
+"""
+A long-lived headless Chromium for rendering PDFs.
+
+Launching a browser takes a second or two, which adds up when emailing out
+thousands of tickets. Instead, each process starts a browser the first time
+it's needed, driven from a background thread running its own event loop, and
+keeps a small pool of browser contexts to render pages in. Callers on any
+thread submit HTML and get PDF bytes back.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import Future
+
+from flask import current_app as app
+from playwright.async_api import Browser, BrowserContext, Playwright, async_playwright
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+# Give up waiting for a PDF after this many seconds
+RENDER_TIMEOUT = 60
+
+pdfs_rendered = Counter("emf_pdfs_rendered", "PDFs rendered by the pooled browser")
+browser_launches = Counter("emf_pdf_browser_launches", "Headless browser launches for rendering PDFs")
+
+
+class PDFRenderer:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.pid = os.getpid()
+
+        self.playwright: Playwright | None = None
+        self.browser: Browser | None = None
+        # Renders wait here for a free context, which limits how many run at once
+        self.contexts: asyncio.Queue[BrowserContext] = asyncio.Queue()
+        self.launch_lock = asyncio.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="pdf_renderer", daemon=True)
+        self.thread.start()
+
+    async def _ensure_browser(self) -> None:
+        async with self.launch_lock:
+            if self.browser is not None and self.browser.is_connected():
+                return
+
+            if self.browser is not None:
+                logger.warning("PDF rendering browser has gone away, relaunching")
+
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+
+            self.browser = await self.playwright.chromium.launch(
+                # Handlers don't work as we're not in the main thread.
+                handle_sigint=False,
+                handle_sigterm=False,
+                handle_sighup=False,
+            )
+            browser_launches.inc()
+
+            # Any contexts still out belong to the old browser, and are returned to the old queue
+            self.contexts = asyncio.Queue()
+            for _ in range(self.concurrency):
+                self.contexts.put_nowait(await self.browser.new_context())
+
+    async def _render(self, url: str, html: str) -> bytes:
+        await self._ensure_browser()
+
+        contexts = self.contexts
+        context = await contexts.get()
+        try:
+            page = await context.new_page()
+            try:
+                await page.route(url, lambda route: route.fulfill(body=html))
+                await page.goto(url)
+                pdf = await page.pdf(format="A4")
+            finally:
+                await page.close()
+        finally:
+            contexts.put_nowait(context)
+
+        pdfs_rendered.inc()
+        return pdf
+
+    def submit(self, url: str, html: str) -> Future[bytes]:
+        """Queue a page to be rendered. url is where the page claims to be, for relative links."""
+        return asyncio.run_coroutine_threadsafe(self._render(url, html), self.loop)
+
+    def render(self, url: str, html: str) -> bytes:
+        future = self.submit(url, html)
+        try:
+            return future.result(timeout=RENDER_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        async def shutdown():
+            if self.browser is not None:
+                await self.browser.close()
+            if self.playwright is not None:
+                await self.playwright.stop()
+
+        if os.getpid() != self.pid or not self.loop.is_running():
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=10)
+        except Exception as e:
+            logger.warning("Error shutting down PDF rendering browser: %r", e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_renderer: PDFRenderer | None = None
+_renderer_lock = threading.Lock()
+
+
+def get_pdf_renderer() -> PDFRenderer:
+    """Get this process's renderer, starting it if necessary.
+
+    The browser and its thread don't survive a fork, so a forked worker gets a new one.
+    """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None or _renderer.pid != os.getpid():
+            _renderer = PDFRenderer(app.config.get("PDF_RENDER_CONCURRENCY", 4))
+            atexit.register(_renderer.close)
+        return _renderer
@@ -1,22 +1,38 @@
-import asyncio
+import hashlib
 import io
 from collections import namedtuple
+from collections.abc import Sequence
+from concurrent.futures import Future
+from functools import lru_cache
 from typing import IO, Any
 
 import segno
 from flask import current_app as app
 from flask import render_template
 from markupsafe import Markup
-from playwright.async_api import async_playwright
+from sqlalchemy import select
+from sqlalchemy.orm import contains_eager, joinedload
 
 from apps.common import feature_enabled
-from main import external_url
-from models.product import PriceTier, Product, ProductGroup
-from models.purchase import Purchase, PurchaseTransfer
+from apps.common.pdf_renderer import RENDER_TIMEOUT, PDFRenderer, get_pdf_renderer
+from main import cache, db, external_url
+from models.product import PRODUCT_CACHE_GENERATION, PriceTier, Product, ProductGroup
+from models.purchase import RECEIPT_CACHE_GENERATION, Purchase, PurchaseTransfer
+from models.user import User
 
 from ..config import config
 
 RECEIPT_TYPES = ["admissions", "parking", "campervan", "merchandise", "hire"]
+RECEIPT_TEMPLATES = [
+    "base.html",
+    "_receipthelpers.html",
+    "receipt.html",
+    "receipt-parking.html",
+    "receipt-campervan.html",
+]
+
+# Cached PDFs are keyed on their contents, so this only needs to free up space
+RECEIPT_PDF_CACHE_TIMEOUT = 24 * 60 * 60
 
 TicketMeta = namedtuple(
     "TicketMeta",
@@ -24,33 +40,63 @@
 )
 
 
-def get_purchase_metadata(user: Any) -> TicketMeta:
-    purchases = (
-        user.owned_purchases.filter_by(is_paid_for=True)
-        .join(PriceTier)
-        .join(Product)
-        .join(ProductGroup)
-        .with_entities(Purchase)
+# Which TicketMeta field each type of product group goes in
+RECEIPT_META_FIELDS = {
+    "admissions": "admissions",
+    "parking": "parking_tickets",
+    "campervan": "campervan_tickets",
+    "merchandise": "merch",
+    "hire": "hires",
+}
+
+
+def get_purchase_metadata(user: User) -> TicketMeta:
+    return get_purchase_metadata_bulk([user])[user.id]
+
+
+def get_purchase_metadata_bulk(users: Sequence[User]) -> dict[int, TicketMeta]:
+    """Load the paid purchases and transfers for several users in two queries."""
+    user_ids = [user.id for user in users]
+    if not user_ids:
+        return {}
+
+    fields: dict[int, dict[str, list]] = {
+        user_id: {field: [] for field in TicketMeta._fields} for user_id in user_ids
+    }
+
+    purchases = db.session.scalars(
+        select(Purchase)
+        .where(Purchase.owner_id.in_(user_ids), Purchase.is_paid_for == True)
+        .options(
+            joinedload(Purchase.price_tier),
+            joinedload(Purchase.product).joinedload(Product.parent),
+        )
         .order_by(Purchase.id)
     )
-    return TicketMeta(
-        admissions=purchases.filter(ProductGroup.type == "admissions").all(),
-        parking_tickets=purchases.filter(ProductGroup.type == "parking").all(),
-        campervan_tickets=purchases.filter(ProductGroup.type == "campervan").all(),
-        merch=purchases.filter(ProductGroup.type == "merchandise").all(),
-        hires=purchases.filter(ProductGroup.type == "hire").all(),
-        transferred_tickets=(
-            user.transfers_from.join(Purchase)
-            .filter_by(state="paid")
-            .with_entities(PurchaseTransfer)
-            .order_by("timestamp")
-            .all()
-        ),
+    for purchase in purchases:
+        field = RECEIPT_META_FIELDS.get(purchase.product.parent.type)
+        if field is not None:
+            fields[purchase.owner_id][field].append(purchase)
+
+    transfers = db.session.scalars(
+        select(PurchaseTransfer)
+        .join(PurchaseTransfer.purchase)
+        .where(PurchaseTransfer.from_user_id.in_(user_ids), Purchase.state == "paid")
+        .options(
+            contains_eager(PurchaseTransfer.purchase).joinedload(Purchase.product).joinedload(Product.parent),
+            joinedload(PurchaseTransfer.to_user),
+        )
+        .order_by(PurchaseTransfer.timestamp, PurchaseTransfer.id)
     )
+    for transfer in transfers:
+        fields[transfer.from_user_id]["transferred_tickets"].append(transfer)
 
+    return {user_id: TicketMeta(**user_fields) for user_id, user_fields in fields.items()}
 
-def render_receipt(user, png=False, pdf=False):
-    meta = get_purchase_metadata(user)
+
+def render_receipt(user, png=False, pdf=False, meta: TicketMeta | None = None):
+    if meta is None:
+        meta = get_purchase_metadata(user)
 
     return render_template(
         "receipt.html",
@@ -70,54 +116,117 @@ def render_receipt(user, png=False, pdf=False):
 def render_pdf(url, html):
     # This needs to fetch URLs found within the page, so if
     # you're running a dev server, use app.run(processes=2)
-
-    async def to_pdf():
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                # Handlers don't work as we're not in the main thread.
-                handle_sigint=False,
-                handle_sigterm=False,
-                handle_sighup=False,
-            )
-            context = await browser.new_context()
-            page = await browser.new_page()
-
-            await page.route(url, lambda route: route.fulfill(body=html))
-            await page.goto(url)
-            pdf = await page.pdf(format="A4")
-            await page.close()
-            await context.close()
-            await browser.close()
-        return pdf
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    pdf = loop.run_until_complete(to_pdf())
+    pdf = get_pdf_renderer().render(url, html)
 
     pdffile = io.BytesIO(pdf)
     return pdffile
 
 
-def make_qrfile(data: str, kind: str = "svg", **kwargs: dict[str, Any]) -> IO[bytes]:
+@lru_cache(maxsize=1024)
+def _make_qr(data: str, kind: str, options: tuple[tuple[str, Any], ...]) -> bytes:
     qrfile = io.BytesIO()
     qr = segno.make_qr(data)
-    qr.save(qrfile, kind=kind, **kwargs)
-    qrfile.seek(0)
-    return qrfile
+    qr.save(qrfile, kind=kind, **dict(options))
+    return qrfile.getvalue()
 
 
+def make_qrfile(data: str, kind: str = "svg", **kwargs: Any) -> IO[bytes]:
+    # QR codes are deterministic, so only generate each one once
+    return io.BytesIO(_make_qr(data, kind, tuple(sorted(kwargs.items()))))
+
+
+@lru_cache(maxsize=1024)
 def format_inline_qr(data: str) -> Markup:
     qr = segno.make(data)
     return Markup(qr.svg_inline(svgclass=None, omitsize=True))
 
 
-def attach_tickets(msg, user):
+@lru_cache(maxsize=1)
+def get_receipt_template_version() -> str:
+    """A digest of the receipt templates, so cached PDFs are regenerated when they change."""
+    assert app.jinja_env.loader is not None
+    digest = hashlib.sha256()
+    for name in RECEIPT_TEMPLATES:
+        source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+        digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_receipt_pdf_key(user: User, url: str) -> str:
+    """Build a cache key from everything that goes into a user's receipt."""
+    purchases = db.session.execute(
+        select(Purchase.id, Purchase.state, Purchase.product_id)
+        .where(Purchase.owner_id == user.id, Purchase.is_paid_for == True)
+        .order_by(Purchase.id)
+    ).all()
+
+    parts = [
+        get_receipt_template_version(),
+        PRODUCT_CACHE_GENERATION.get(),
+        RECEIPT_CACHE_GENERATION.get(user.id),
+        url,
+        app.config.get("CHECKIN_BASE"),
+        user.name,
+        user.email,
+        user.checkin_code,
+        *purchases,
+    ]
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8") + b"\0")
+    return f"receipt_pdf/{user.id}/{digest.hexdigest()}"
+
+
+def render_receipt_pdf(user: User, url: str) -> IO[bytes]:
+    """Render a user's receipt as a PDF, reusing the last one if nothing's changed."""
+    key = get_receipt_pdf_key(user, url)
+    pdf = cache.get(key)
+    if pdf is None:
+        page = render_receipt(user, pdf=True)
+        pdf = render_pdf(url, page).read()
+        cache.set(key, pdf, timeout=RECEIPT_PDF_CACHE_TIMEOUT)
+    return io.BytesIO(pdf)
+
+
+def render_receipt_pdfs(users: Sequence[User], renderer: PDFRenderer | None = None) -> list[bytes]:
+    """Render several users' receipts at once, as many in parallel as the renderer allows.
+
+    Uses this process's shared renderer unless another is given.
+    """
+    if renderer is None:
+        renderer = get_pdf_renderer()
+
+    urls = {user.id: external_url("tickets.receipt", user_id=user.id) for user in users}
+    keys = {user.id: get_receipt_pdf_key(user, urls[user.id]) for user in users}
+    pdfs: dict[int, bytes | Future[bytes]] = {}
+    for user in users:
+        pdf = cache.get(keys[user.id])
+        if pdf is not None:
+            pdfs[user.id] = pdf
+
+    uncached = [user for user in users if user.id not in pdfs]
+    metas = get_purchase_metadata_bulk(uncached)
+    for user in uncached:
+        page = render_receipt(user, pdf=True, meta=metas[user.id])
+        pdfs[user.id] = renderer.submit(urls[user.id], page)
+
+    results = []
+    for user in users:
+        pdf = pdfs[user.id]
+        if isinstance(pdf, Future):
+            pdf = pdf.result(timeout=RENDER_TIMEOUT)
+            cache.set(keys[user.id], pdf, timeout=RECEIPT_PDF_CACHE_TIMEOUT)
+        results.append(pdf)
+    return results
+
+
+def attach_tickets(msg, user, pdf: bytes | None = None):
     # Attach tickets to a mail Message
-    page = render_receipt(user, pdf=True)
-    url = external_url("tickets.receipt", user_id=user.id)
-    pdf = render_pdf(url, page)
+    if pdf is None:
+        url = external_url("tickets.receipt", user_id=user.id)
+        pdf = render_receipt_pdf(user, url).read()
 
-    msg.attach(f"EMF{config.event_year}.pdf", pdf.read(), "application/pdf")
+    msg.attach(f"EMF{config.event_year}.pdf", pdf, "application/pdf")
 
     if feature_enabled("ISSUE_APPLE_PKPASS_TICKETS"):
         # Circular import again
@@ -1,37 +1,99 @@
+import base64
+import binascii
+import struct
+
+from flask import current_app as app
+from sqlalchemy import case, func, or_, select
+
+from main import db
 from models import User
+from models.arrivals import CheckinCode
+from models.purchase import Purchase
+from models.user import generate_checkin_code
+
+
+def escape(like: str) -> str:
+    return like.replace("^", "^^").replace("%", "^%").replace("_", "^_")
+
+
+def users_from_query(query: str, limit: int = 10) -> list[User]:
+    """Find users by name or email, best matches first, in a single query.
+
+    Exact matches come first, then ones containing all the words in order,
+    then ones starting with any of the words, then ones containing any of them.
+    The ILIKE patterns can use the trigram indexes on user.name and user.email.
+    """
+    query = query.lower().strip()
+    words = [escape(word) for word in query.split(" ") if word]
+    if not words:
+        return []
+
+    columns = [User.name, User.email]
+
+    def matches(pattern: str):
+        return or_(*[column.ilike(pattern, escape="^") for column in columns])
+
+    ranks = [(matches(escape(query)), 0)]
+    if len(words) > 1:
+        ranks.append((matches("%" + "%".join(words) + "%"), 1))
+    ranks.append((or_(*[matches(f"{word}%") for word in words]), 2))
+    contains = or_(*[matches(f"%{word}%") for word in words])
+
+    rank = case(*ranks, else_=3)
+    similarity = func.greatest(func.similarity(User.name, query), func.similarity(User.email, query))
+
+    return list(
+        db.session.scalars(
+            select(User).where(contains).order_by(rank, similarity.desc(), User.name, User.id).limit(limit)
+        )
+    )
+
+
+def user_from_checkin_code_fragment(fragment: str) -> User | None:
+    """Find the user whose checkin code starts with fragment.
+
+    The first four characters of a checkin code encode the user ID, so only
+    prefixes of at least that length can be looked up.
+    """
+    try:
+        user_id, version = struct.unpack("HB", base64.urlsafe_b64decode(fragment[:4]))
+    except binascii.Error, struct.error, ValueError:
+        return None
 
+    if version != 1:
+        return None
 
-def users_from_query(query):
-    names = User.query.order_by(User.name)
-    emails = User.query.order_by(User.email)
+    if app.config.get("ARRIVALS_NODE"):
+        # Nodes can't generate checkin codes, but have a copy from upstream
+        code = db.session.scalar(select(CheckinCode.code).where(CheckinCode.user_id == user_id))
+    else:
+        code = generate_checkin_code(app.config["SECRET_KEY"], user_id)
 
-    def escape(like):
-        return like.replace("^", "^^").replace("%", "^%")
+    if not code or not code.startswith(fragment):
+        return None
 
-    def name_match(pattern, query):
-        return names.filter(User.name.ilike(pattern.format(query), escape="^")).limit(10).all()
+    return db.session.get(User, user_id)
 
-    def email_match(pattern, query):
-        return emails.filter(User.email.ilike(pattern.format(query), escape="^")).limit(10).all()
 
-    fulls = []
-    starts = []
-    contains = []
-    query = query.lower()
-    words = list(map(escape, filter(None, query.split(" "))))
+def arrivals_users_from_query(query: str, limit: int = 10) -> list[User]:
+    """As users_from_query, but also match purchase IDs and checkin code fragments first."""
+    query = query.strip()
+    users: list[User] = []
 
-    if " " in query:
-        fulls += name_match("%{0}%", "%".join(words))
-        fulls += email_match("%{0}%", "%".join(words))
+    # Purchase IDs are 32-bit
+    if query.isdigit() and len(query) < 10:
+        owner = db.session.scalars(
+            select(User).join(User.owned_purchases).where(Purchase.id == int(query))
+        ).one_or_none()
+        if owner:
+            users.append(owner)
 
-    for word in words:
-        starts += name_match("{0}%", word)
-        contains += name_match("%{0}%", word)
+    elif " " not in query and len(query) >= 4:
+        user = user_from_checkin_code_fragment(query)
+        if user:
+            users.append(user)
 
-    for word in words:
-        starts += email_match("{0}%", word)
-        contains += email_match("%{0}%", word)
+    users += users_from_query(query, limit)
 
     # make unique, but keep in order
-    users = list(dict.fromkeys(fulls + starts + contains))[:10]
-    return users
+    return list(dict.fromkeys(users))[:limit]
@@ -3,13 +3,14 @@
 from dataclasses import dataclass, field
 from datetime import datetime
 from typing import NotRequired, TypedDict
+from urllib.parse import quote
 
 import pendulum
 from flask import request
 from flask_login import current_user
 from slugify import slugify
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import Select, select
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 
 from apps.common import tidy_workshop_cost
 from main import db, external_url
@@ -19,6 +20,7 @@
     TalkAttributes,
     WorkshopAttributes,
 )
+from models.content.schedule import FavouriteScheduleItem
 from models.user import User
 
 from ..config import config
@@ -91,12 +93,55 @@ def from_request(cls):
         )
 
 
-def _get_schedule_item_dict(filter: ScheduleFilter, schedule_item: ScheduleItem) -> ScheduleItemDict:
-    if filter.user:
-        favourites_ids = [f.id for f in filter.user.favourites]
-    else:
-        favourites_ids = []
+@dataclass(frozen=True)
+class ScheduleContext:
+    """Everything from the request needed to build schedule item dicts, worked out once.
 
+    The builders below only read from this, so they don't touch the DB or the URL map.
+    """
+
+    favourite_ids: frozenset[int] = frozenset()
+    venues: frozenset[str] = frozenset()
+    item_url_prefix: str = ""
+
+    @classmethod
+    def from_filter(cls, filter: ScheduleFilter) -> ScheduleContext:
+        favourite_ids: frozenset[int] = frozenset()
+        if filter.user:
+            favourite_ids = frozenset(
+                db.session.scalars(
+                    select(FavouriteScheduleItem.c.schedule_item_id).where(
+                        FavouriteScheduleItem.c.user_id == filter.user.id
+                    )
+                )
+            )
+
+        # Building each link with url_for is relatively slow, so do it once and fill in the ID
+        url = external_url("schedule.item", year=config.event_year, schedule_item_id=0)
+        assert url.endswith("/0")
+
+        return cls(
+            favourite_ids=favourite_ids,
+            venues=frozenset(filter.venues),
+            item_url_prefix=url.removesuffix("0"),
+        )
+
+    def item_link(self, schedule_item: ScheduleItem) -> str:
+        if not schedule_item.slug:
+            return f"{self.item_url_prefix}{schedule_item.id}"
+        return f"{self.item_url_prefix}{schedule_item.id}-{quote(schedule_item.slug)}"
+
+    def includes_occurrence(self, occurrence: Occurrence) -> bool:
+        if not occurrence.scheduled:
+            return False
+
+        # Safe assertion due to check that state == "scheduled"
+        assert occurrence.scheduled_venue is not None
+
+        return not self.venues or occurrence.scheduled_venue.name in self.venues
+
+
+def _get_schedule_item_dict(ctx: ScheduleContext, schedule_item: ScheduleItem) -> ScheduleItemDict:
     sid = ScheduleItemDict(
         id=schedule_item.id,
         type=schedule_item.type,
@@ -106,15 +151,10 @@ def _get_schedule_item_dict(filter: ScheduleFilter, schedule_item: ScheduleItem)
         description=schedule_item.description or "",
         short_description=schedule_item.short_description or "",
         video_privacy=schedule_item.video_privacy,
-        is_fave=schedule_item.id in favourites_ids,
+        is_fave=schedule_item.id in ctx.favourite_ids,
         official_content=schedule_item.official_content,
         slug=schedule_item.slug,
-        link=external_url(
-            ".item",
-            year=config.event_year,
-            schedule_item_id=schedule_item.id,
-            slug=schedule_item.slug,
-        ),
+        link=ctx.item_link(schedule_item),
         occurrences=[],
     )
     if isinstance(schedule_item.attributes, WorkshopAttributes | FamilyWorkshopAttributes):
@@ -137,7 +177,7 @@ def _get_schedule_item_dict(filter: ScheduleFilter, schedule_item: ScheduleItem)
     return sid
 
 
-def _get_occurrence_dict(filter: ScheduleFilter, occurrence: Occurrence) -> OccurrenceDict:
+def _get_occurrence_dict(ctx: ScheduleContext, occurrence: Occurrence) -> OccurrenceDict:
     assert occurrence.scheduled
 
     # We can make these assertions because state == "scheduled"
@@ -168,28 +208,20 @@ def _get_occurrence_dict(filter: ScheduleFilter, occurrence: Occurrence) -> Occu
     return od
 
 
-def get_schedule_item_dicts_flat(
-    filter: ScheduleFilter, schedule_item: ScheduleItem
-) -> list[ScheduleItemDict]:
+def get_schedule_item_dicts_flat(ctx: ScheduleContext, schedule_item: ScheduleItem) -> list[ScheduleItemDict]:
     """
     Returns a list of ScheduleItemDicts, each with one .occurrence that matches the filter
     """
     flat_sids = []
 
-    sid = _get_schedule_item_dict(filter, schedule_item)
+    sid = _get_schedule_item_dict(ctx, schedule_item)
 
     occurrence: Occurrence
     for occurrence in schedule_item.occurrences:
-        if not occurrence.scheduled:
+        if not ctx.includes_occurrence(occurrence):
             continue
 
-        # Safe assertion due to check that state == "scheduled"
-        assert occurrence.scheduled_venue is not None
-
-        if filter.venues and occurrence.scheduled_venue.name not in filter.venues:
-            continue
-
-        od = _get_occurrence_dict(filter, occurrence)
+        od = _get_occurrence_dict(ctx, occurrence)
         # TODO: maybe we should type these differently
         flat_sid = sid.copy()
         flat_sid["occurrences"] = [od]
@@ -198,24 +230,28 @@ def get_schedule_item_dicts_flat(
     return flat_sids
 
 
-def get_schedule_item_dict_full(filter: ScheduleFilter, schedule_item: ScheduleItem) -> ScheduleItemDict:
+def get_schedule_item_dict_for_occurrence(ctx: ScheduleContext, occurrence: Occurrence) -> ScheduleItemDict:
+    """
+    Returns a ScheduleItemDict with just the given .occurrence, like get_schedule_item_dicts_flat
+    """
+    # TODO: maybe we should type these differently
+    flat_sid = _get_schedule_item_dict(ctx, occurrence.schedule_item)
+    flat_sid["occurrences"] = [_get_occurrence_dict(ctx, occurrence)]
+    return flat_sid
+
+
+def get_schedule_item_dict_full(ctx: ScheduleContext, schedule_item: ScheduleItem) -> ScheduleItemDict:
     """
     Returns a ScheduleItemDict with a list of .occurrences that match the filter
     """
-    sid = _get_schedule_item_dict(filter, schedule_item)
+    sid = _get_schedule_item_dict(ctx, schedule_item)
 
     occurrence: Occurrence
     for occurrence in schedule_item.occurrences:
-        if not occurrence.scheduled:
+        if not ctx.includes_occurrence(occurrence):
             continue
 
-        # Safe assertion due to check that state == "scheduled"
-        assert occurrence.scheduled_venue is not None
-
-        if filter.venues and occurrence.scheduled_venue.name not in filter.venues:
-            continue
-
-        od = _get_occurrence_dict(filter, occurrence)
+        od = _get_occurrence_dict(ctx, occurrence)
         sid["occurrences"].append(od)
 
     return sid
@@ -254,9 +290,42 @@ def get_schedule_items(filter: ScheduleFilter) -> list[ScheduleItem]:
     return schedule_items
 
 
+def get_schedule_occurrences_query(filter: ScheduleFilter) -> Select:
+    """
+    Like get_schedule_items, but selects scheduled occurrences of published items,
+    with the item and venue, so they can be read a row at a time.
+    """
+    query = (
+        select(Occurrence)
+        .join(Occurrence.schedule_item)
+        .join(Occurrence.scheduled_venue)
+        .where(
+            ScheduleItem.state == "published",
+            Occurrence.scheduled_time.isnot(None),
+        )
+        .options(
+            contains_eager(Occurrence.schedule_item),
+            contains_eager(Occurrence.scheduled_venue),
+            joinedload(Occurrence.lottery),
+        )
+    )
+
+    if filter.user and filter.is_favourite:
+        query = query.where(ScheduleItem.favourited_by.any(User.id == filter.user.id))
+
+    if filter.venues:
+        query = query.where(Venue.name.in_(filter.venues))
+
+    if filter.types:
+        query = query.where(ScheduleItem.type.in_(filter.types))
+
+    return query
+
+
 def get_upcoming(filter: ScheduleFilter, per_venue_limit: int = 2) -> dict[str, list[ScheduleItemDict]]:
     schedule_items = get_schedule_items(filter)
-    flat_sids = [flat_sid for si in schedule_items for flat_sid in get_schedule_item_dicts_flat(filter, si)]
+    ctx = ScheduleContext.from_filter(filter)
+    flat_sids = [flat_sid for si in schedule_items for flat_sid in get_schedule_item_dicts_flat(ctx, si)]
 
     # TODO: surely now/next could come straight from the DB? I can't believe we need wrangle this structure
     now = pendulum.now(event_tz)  # type: ignore[arg-type]
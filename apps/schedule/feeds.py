@@ -1,17 +1,20 @@
+import hashlib
 import json
+from collections.abc import Callable, Iterable, Iterator
 from datetime import timedelta
 
 from dateutil.parser import parse as parse_date
-from flask import Response, abort, redirect, request, url_for
+from flask import Response, abort, redirect, request, stream_with_context, url_for
 from flask import current_app as app
 from flask.typing import ResponseReturnValue
 from flask_cors import cross_origin
 from flask_login import current_user
 from icalendar import Calendar, Event
-from sqlalchemy import select
+from sqlalchemy import Date, cast
 
-from main import db, external_url, get_or_404
-from models.content import Occurrence, ScheduleItem
+from main import cache, db, external_url, get_or_404
+from models.content import Occurrence, ScheduleItem, Venue
+from models.content.schedule import SCHEDULE_GENERATION
 from models.user import User
 
 from ..common import feature_enabled, feature_flag, json_response
@@ -19,15 +22,18 @@
 from . import event_tz, schedule
 from .base import LINEUP_TYPE_ORDER
 from .data import (
+    ScheduleContext,
     ScheduleFilter,
     ScheduleItemDict,
     _fix_up_times_horribly,
+    get_schedule_item_dict_for_occurrence,
     get_schedule_item_dict_full,
     get_schedule_item_dicts_flat,
     get_schedule_items,
+    get_schedule_occurrences_query,
     get_upcoming,
 )
-from .frab_exporter import FrabExporterFilter, FrabJsonExporter, FrabXmlExporter
+from .frab_exporter import DAY_CHANGEOVER, FrabExporterFilter, FrabJsonExporter, FrabXmlExporter
 from .historic import feed_historic
 
 
@@ -56,6 +62,70 @@ def _format_event_description(flat_sid: ScheduleItemDict) -> str:
     return description
 
 
+# Cached feeds are keyed on the schedule generation, so this only matters if the
+# schedule is edited from another process and the cache isn't shared.
+FEED_CACHE_TIMEOUT = 5 * 60
+
+
+def cached_feed(
+    mimetype: str,
+    filter: ScheduleFilter | FrabExporterFilter,
+    build: Callable[[], str | bytes | Iterable[bytes]],
+) -> Response:
+    """Serve a public feed from the cache, with a strong ETag so polling clients can get a 304.
+
+    Feeds are cached per schedule generation, which changes whenever a ScheduleItem,
+    Occurrence or Venue is edited, so this should only be used for responses which
+    don't depend on the current user.
+
+    The key includes the filter parsed from the request rather than the whole URL,
+    so query parameters the feed doesn't read (e.g. cache busters) share an entry.
+
+    If build returns an iterable of chunks, the first response is streamed to the
+    client as it's generated, and cached once it's complete.
+    """
+    key = f"schedule_feed/{SCHEDULE_GENERATION.get()}/{feature_enabled('SCHEDULE')}/{request.path}/{filter!r}"
+    entry = cache.get(key)
+    if entry is None:
+        body = build()
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if not isinstance(body, bytes):
+            return Response(stream_with_context(_stream_and_cache(key, body)), mimetype=mimetype)
+
+        entry = (body, hashlib.sha256(body).hexdigest())
+        cache.set(key, entry, timeout=FEED_CACHE_TIMEOUT)
+
+    body, etag = entry
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def _stream_and_cache(key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    digest = hashlib.sha256()
+    body = []
+    for chunk in chunks:
+        digest.update(chunk)
+        body.append(chunk)
+        yield chunk
+
+    cache.set(key, (b"".join(body), digest.hexdigest()), timeout=FEED_CACHE_TIMEOUT)
+
+
+def _render_schedule_json(filter: ScheduleFilter) -> str:
+    schedule_items = get_schedule_items(filter)
+    ctx = ScheduleContext.from_filter(filter)
+    full_sids = [get_schedule_item_dict_full(ctx, si) for si in schedule_items]
+
+    if not feature_enabled("SCHEDULE"):
+        full_sids = [sid | {"occurrences": []} for sid in full_sids]
+
+    _fix_up_times_horribly(full_sids)
+
+    return json.dumps(full_sids)
+
+
 @schedule.route("/schedule/<int:year>.json")
 @cross_origin(methods=["GET"])
 def schedule_json(year: int) -> ResponseReturnValue:
@@ -70,15 +140,11 @@ def schedule_json(year: int) -> ResponseReturnValue:
     if not feature_enabled("SCHEDULE"):
         filter.types = LINEUP_TYPE_ORDER
 
-    schedule_items = get_schedule_items(filter)
-    full_sids = [get_schedule_item_dict_full(filter, si) for si in schedule_items]
-
-    if not feature_enabled("SCHEDULE"):
-        full_sids = [sid | {"occurrences": []} for sid in full_sids]
-
-    _fix_up_times_horribly(full_sids)
+    if filter.user:
+        # Includes favourites
+        return Response(_render_schedule_json(filter), mimetype="application/json")
 
-    return Response(json.dumps(full_sids), mimetype="application/json")
+    return cached_feed("application/json", filter, lambda: _render_schedule_json(filter))
 
 
 @schedule.route("/schedule/<int:year>.frab")
@@ -89,6 +155,23 @@ def schedule_frab(year: int) -> ResponseReturnValue:
     return redirect(url_for("schedule.schedule_frab_xml", year=year))
 
 
+# Occurrences are fetched from a server-side cursor this many at a time
+FEED_YIELD_PER = 100
+
+
+def _iter_frab_occurrences() -> Iterator[Occurrence]:
+    # Ordered as the exporter outputs them, so the XML can be streamed
+    day_start = timedelta(hours=DAY_CHANGEOVER.hour, minutes=DAY_CHANGEOVER.minute)
+    query = get_schedule_occurrences_query(ScheduleFilter()).order_by(
+        cast(Occurrence.scheduled_time - day_start, Date),
+        Venue.priority.desc(),
+        Venue.name,
+        Occurrence.scheduled_time,
+        Occurrence.id,
+    )
+    return iter(db.session.scalars(query.execution_options(yield_per=FEED_YIELD_PER)))
+
+
 @schedule.route("/schedule/<int:year>.frab.xml")
 def schedule_frab_xml(year):
     if year != config.event_year:
@@ -97,28 +180,13 @@ def schedule_frab_xml(year):
     if not feature_enabled("SCHEDULE"):
         abort(404)
 
-    # FIXME: the only real difference between this and get_schedule_items is the ordering
-    # Should we move the order_by into there?
-    schedule_items = list(
-        db.session.scalars(
-            select(ScheduleItem)
-            .join(Occurrence)
-            .where(
-                ScheduleItem.state == "published",
-                ScheduleItem.occurrences.any(
-                    Occurrence.scheduled_time.isnot(None),
-                ),
-            )
-            .order_by(Occurrence.scheduled_time)
-        ).unique()
-    )
-
     filter = FrabExporterFilter.from_request()
 
-    exporter = FrabXmlExporter(filter, schedule_items)
-    frab = exporter.run()
+    def build():
+        exporter = FrabXmlExporter(filter, _iter_frab_occurrences())
+        return exporter.stream()
 
-    return Response(frab, mimetype="application/xml")
+    return cached_feed("application/xml", filter, build)
 
 
 @schedule.route("/schedule/<int:year>.frab.json")
@@ -129,42 +197,22 @@ def schedule_frab_json(year):
     if not feature_enabled("SCHEDULE"):
         abort(404)
 
-    schedule_items = list(
-        db.session.scalars(
-            select(ScheduleItem)
-            .join(Occurrence)
-            .where(
-                ScheduleItem.state == "published",
-                ScheduleItem.occurrences.any(
-                    Occurrence.scheduled_time.isnot(None),
-                ),
-            )
-            .order_by(Occurrence.scheduled_time)
-        ).unique()
-    )
-
     filter = FrabExporterFilter.from_request()
 
-    exporter = FrabJsonExporter(
-        filter, schedule_items, external_url("schedule.schedule_frab_json", year=year)
-    )
-    frab = exporter.run()
-
-    return Response(json.dumps(frab, indent=4), mimetype="application/json")
+    def build():
+        exporter = FrabJsonExporter(
+            filter, _iter_frab_occurrences(), external_url("schedule.schedule_frab_json", year=year)
+        )
+        return json.dumps(exporter.run(), indent=4)
 
+    return cached_feed("application/json", filter, build)
 
-@schedule.route("/schedule/<int:year>.ical")
-@schedule.route("/schedule/<int:year>.ics")
-def schedule_ical(year: int) -> ResponseReturnValue:
-    if year != config.event_year:
-        return feed_historic(year, "ics")
 
-    if not feature_enabled("SCHEDULE"):
-        abort(404)
+def _stream_schedule_ical(filter: ScheduleFilter, year: int) -> Iterator[bytes]:
+    """Generate the calendar a VEVENT at a time, as each occurrence is read.
 
-    filter = ScheduleFilter.from_request()
-    schedule_items = get_schedule_items(filter)
-    flat_sids = [flat_sid for si in schedule_items for flat_sid in get_schedule_item_dicts_flat(filter, si)]
+    The output is the same as adding every event to the Calendar and calling to_ical.
+    """
     title = f"EMF {config.event_year}"
 
     cal = Calendar()
@@ -173,18 +221,46 @@ def schedule_ical(year: int) -> ResponseReturnValue:
     cal.add("X-WR-CALDESC", title)
     cal.add("version", "2.0")
 
-    for flat_sid in flat_sids:
+    end = b"END:VCALENDAR\r\n"
+    header = cal.to_ical()
+    assert header.endswith(end)
+    yield header[: -len(end)]
+
+    ctx = ScheduleContext.from_filter(filter)
+    query = get_schedule_occurrences_query(filter).order_by(Occurrence.scheduled_time, Occurrence.id)
+    for occurrence in db.session.scalars(query.execution_options(yield_per=FEED_YIELD_PER)):
+        if not ctx.includes_occurrence(occurrence):
+            continue
+
+        flat_sid = get_schedule_item_dict_for_occurrence(ctx, occurrence)
         cal_event = Event()
-        occurrence = flat_sid["occurrences"][0]
-        cal_event.add("uid", f"{year}-content-{flat_sid['id']}-{occurrence['occurrence_num']}")
+        od = flat_sid["occurrences"][0]
+        cal_event.add("uid", f"{year}-content-{flat_sid['id']}-{od['occurrence_num']}")
         cal_event.add("summary", flat_sid["title"])
         cal_event.add("description", _format_event_description(flat_sid))
-        cal_event.add("location", occurrence["venue"])
-        cal_event.add("dtstart", occurrence["start_date"])
-        cal_event.add("dtend", occurrence["end_date"])
-        cal.add_component(cal_event)
+        cal_event.add("location", od["venue"])
+        cal_event.add("dtstart", od["start_date"])
+        cal_event.add("dtend", od["end_date"])
+        yield cal_event.to_ical()
 
-    return Response(cal.to_ical(), mimetype="text/calendar")
+    yield end
+
+
+@schedule.route("/schedule/<int:year>.ical")
+@schedule.route("/schedule/<int:year>.ics")
+def schedule_ical(year: int) -> ResponseReturnValue:
+    if year != config.event_year:
+        return feed_historic(year, "ics")
+
+    if not feature_enabled("SCHEDULE"):
+        abort(404)
+
+    filter = ScheduleFilter.from_request()
+    if filter.user:
+        # May be filtered to favourites
+        return Response(stream_with_context(_stream_schedule_ical(filter, year)), mimetype="text/calendar")
+
+    return cached_feed("text/calendar", filter, lambda: _stream_schedule_ical(filter, year))
 
 
 @schedule.route("/favourites.json")
@@ -211,7 +287,8 @@ def favourites_json() -> ResponseReturnValue:
         filter.types = LINEUP_TYPE_ORDER
 
     schedule_items = get_schedule_items(filter)
-    full_sids = [get_schedule_item_dict_full(filter, sid) for sid in schedule_items]
+    ctx = ScheduleContext.from_filter(filter)
+    full_sids = [get_schedule_item_dict_full(ctx, si) for si in schedule_items]
 
     _fix_up_times_horribly(full_sids)
 
@@ -242,9 +319,8 @@ def favourites_ical() -> ResponseReturnValue:
         assert filter.user is not None
 
         schedule_items = get_schedule_items(filter)
-        flat_sids = [
-            flat_sid for si in schedule_items for flat_sid in get_schedule_item_dicts_flat(filter, si)
-        ]
+        ctx = ScheduleContext.from_filter(filter)
+        flat_sids = [flat_sid for si in schedule_items for flat_sid in get_schedule_item_dicts_flat(ctx, si)]
     else:
         flat_sids = []
 
@@ -313,7 +389,7 @@ def item_json(year: int, schedule_item_id: int, slug: str | None = None) -> Resp
         user=(current_user.is_authenticated and current_user) or None,
     )
 
-    sid = get_schedule_item_dict_full(filter, schedule_item)
+    sid = get_schedule_item_dict_full(ScheduleContext.from_filter(filter), schedule_item)
 
     # FIXME: do we really need to do this?
     for od in sid["occurrences"]:
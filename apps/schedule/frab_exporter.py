@@ -1,5 +1,5 @@
 import xml.etree.ElementTree as etree
-from collections.abc import Sequence
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass, field
 from datetime import datetime, time, timedelta
 from functools import cached_property
@@ -10,11 +10,20 @@
 from flask import request
 
 from main import db, external_url
-from models.content import SCHEDULE_ITEM_INFOS, ScheduleItem, Venue, schedule_item_slug
+from models.content import SCHEDULE_ITEM_INFOS, Occurrence, Venue, schedule_item_slug
 
 from ..config import config
 from . import event_tz
-from .data import ScheduleFilter, ScheduleItemDict, _get_occurrence_dict, _get_schedule_item_dict
+from .data import (
+    ScheduleContext,
+    ScheduleFilter,
+    ScheduleItemDict,
+    get_schedule_item_dict_for_occurrence,
+)
+
+# Each day's schedule runs from this time to the same time the next day,
+# which allows us to have late events
+DAY_CHANGEOVER = time(4, 0)
 
 # Default licence for recordings
 LICENCE = "CC BY-SA 4.0"
@@ -54,8 +63,10 @@ def from_request(cls):
 
 
 class FrabExporter:
-    def __init__(self, filter: FrabExporterFilter, schedule_items: Sequence[ScheduleItem]):
-        self.schedule_items = schedule_items
+    def __init__(self, filter: FrabExporterFilter, occurrences: Iterable[Occurrence]):
+        # These should be ordered by day (see DAY_CHANGEOVER), then room, then time,
+        # as FrabXmlExporter.stream writes each one out as it's read
+        self.occurrences = occurrences
         self.filter = filter
 
     def format_duration(self, start_time: datetime, end_time: datetime) -> str:
@@ -68,8 +79,7 @@ def format_duration(self, start_time: datetime, end_time: datetime) -> str:
         hours = int(hours % 24)
         return f"{days:d}:{hours:02d}:{minutes:02d}"
 
-    def get_day_start_end(self, dt: datetime, start_time: time = time(4, 0)) -> tuple[datetime, datetime]:
-        # A day changeover of 4am allows us to have late events.
+    def get_day_start_end(self, dt: datetime, start_time: time = DAY_CHANGEOVER) -> tuple[datetime, datetime]:
         # All in local time because that's what people deal in.
         start_date = dt.date()
         if dt.time() < start_time:
@@ -85,62 +95,58 @@ def get_day_start_end(self, dt: datetime, start_time: time = time(4, 0)) -> tupl
 
         return start_dt, end_dt
 
-    @cached_property
-    def schedule(self):
-        # This is basically a reimplementation of get_schedule_item_dicts_flat
-        # TODO: it might be better to use the ScheduleItem/Occurrences directly
-        if not self.schedule_items:
-            return []
-
+    def events(self) -> Iterator[tuple[Venue, ScheduleItemDict]]:
+        """Yield each scheduled occurrence which passes the filter, with its venue,
+        as a schedule item dict with just that occurrence.
+        """
         # Empty filter
-        filter = ScheduleFilter()
+        ctx = ScheduleContext.from_filter(ScheduleFilter())
+
+        for occurrence in self.occurrences:
+            if not occurrence.scheduled:
+                continue
+            venue = occurrence.scheduled_venue
+            assert venue
+
+            if self.filter.official_venues_only and venue.allows_attendee_content:
+                continue
+
+            if self.filter.village_id and venue.village_id != self.filter.village_id:
+                continue
 
+            if self.filter.venue_ids and venue.id not in self.filter.venue_ids:
+                continue
+
+            yield venue, get_schedule_item_dict_for_occurrence(ctx, occurrence)
+
+    @cached_property
+    def schedule(self):
         data = {}
         index = 1
-        for schedule_item in self.schedule_items:
-            sid = _get_schedule_item_dict(filter, schedule_item)
-            for occurrence in schedule_item.occurrences:
-                if not occurrence.scheduled:
-                    continue
-                assert occurrence.scheduled_venue
-
-                if self.filter.official_venues_only and occurrence.scheduled_venue.allows_attendee_content:
-                    continue
-
-                if self.filter.village_id and occurrence.scheduled_venue.village_id != self.filter.village_id:
-                    continue
-
-                if self.filter.venue_ids and occurrence.scheduled_venue.id not in self.filter.venue_ids:
-                    continue
-
-                od = _get_occurrence_dict(filter, occurrence)
-                # TODO: maybe we should type these differently
-                flat_sid = sid.copy()
-                flat_sid["occurrences"] = [od]
-
-                day_start, day_end = self.get_day_start_end(od["start_date"])
-                day_key = day_start.strftime("%Y-%m-%d")
-                venue_key = occurrence.scheduled_venue.name
-
-                if day_key not in data:
-                    data[day_key] = {
-                        "index": index,
-                        "start": day_start,
-                        "end": day_end,
-                        "rooms": {},
-                    }
-                    index += 1
-
-                day = data[day_key]
-                if venue_key not in day["rooms"]:
-                    day["rooms"][venue_key] = {
-                        "id": occurrence.scheduled_venue.id,
-                        "name": occurrence.scheduled_venue.name,
-                        "priority": occurrence.scheduled_venue.priority,
-                        "talks": [],
-                    }
-
-                day["rooms"][venue_key]["talks"].append(flat_sid)
+        for venue, flat_sid in self.events():
+            day_start, day_end = self.get_day_start_end(flat_sid["occurrences"][0]["start_date"])
+            day_key = day_start.strftime("%Y-%m-%d")
+            venue_key = venue.name
+
+            if day_key not in data:
+                data[day_key] = {
+                    "index": index,
+                    "start": day_start,
+                    "end": day_end,
+                    "rooms": {},
+                }
+                index += 1
+
+            day = data[day_key]
+            if venue_key not in day["rooms"]:
+                day["rooms"][venue_key] = {
+                    "id": venue.id,
+                    "name": venue.name,
+                    "priority": venue.priority,
+                    "talks": [],
+                }
+
+            day["rooms"][venue_key]["talks"].append(flat_sid)
 
         for day in data.values():
             day["rooms"] = sorted(
@@ -151,8 +157,8 @@ def schedule(self):
 
 
 class FrabJsonExporter(FrabExporter):
-    def __init__(self, filter: FrabExporterFilter, schedule_items: Sequence[ScheduleItem], url: str):
-        super().__init__(filter, schedule_items)
+    def __init__(self, filter: FrabExporterFilter, occurrences: Iterable[Occurrence], url: str):
+        super().__init__(filter, occurrences)
         self.url = url
 
     @cached_property
@@ -276,6 +282,13 @@ def run(self):
         }
 
 
+def _start_tag(element: Element) -> bytes:
+    # Serialise a childless copy so the attributes are escaped exactly as tostring would
+    empty = etree.tostring(etree.Element(element.tag, element.attrib))
+    assert empty.endswith(b" />")
+    return empty[:-3] + b">"
+
+
 class FrabXmlExporter(FrabExporter):
     def _add_sub_with_text(self, parent: Element, tag: str, text: str, **extra: str) -> Element:
         node = etree.SubElement(parent, tag, {}, **extra)
@@ -403,3 +416,60 @@ def run(self) -> bytes:
                     self.add_event(room, schedule_venue["name"], schedule_event)
 
         return etree.tostring(root)
+
+    def stream(self) -> Iterator[bytes]:
+        """Serialise the schedule one event at a time, as the occurrences are read.
+
+        As the occurrences are ordered by day and room, each <day> and <room> can be
+        closed as soon as the next one starts, so nothing is held on to between events.
+        The output is byte-for-byte the same as run().
+        """
+        root: Element = self.make_root()
+        yield _start_tag(root)
+        for child in root:
+            yield etree.tostring(child)
+
+        # Days and rooms seen so far, so out of order occurrences fail rather than repeat them
+        days: set[datetime] = set()
+        rooms: set[str] = set()
+        day: Element | None = None
+        room: Element | None = None
+        for venue, flat_sid in self.events():
+            day_start, day_end = self.get_day_start_end(flat_sid["occurrences"][0]["start_date"])
+            if day is None or day.get("start") != day_start.isoformat():
+                if day_start in days:
+                    raise ValueError("Occurrences must be ordered by day")
+                days.add(day_start)
+                rooms = set()
+
+                if room is not None:
+                    yield b"</room>"
+                    room = None
+                if day is not None:
+                    yield b"</day>"
+
+                day = self.add_day(root, len(days), day_start, day_end)
+                root.remove(day)
+                yield _start_tag(day)
+
+            if room is None or room.get("name") != venue.name:
+                if venue.name in rooms:
+                    raise ValueError("Occurrences must be ordered by room within each day")
+                rooms.add(venue.name)
+
+                if room is not None:
+                    yield b"</room>"
+
+                room = self.add_room(day, venue.name)
+                day.remove(room)
+                yield _start_tag(room)
+
+            event = self.add_event(room, venue.name, flat_sid)
+            room.remove(event)
+            yield etree.tostring(event)
+
+        if room is not None:
+            yield b"</room>"
+        if day is not None:
+            yield b"</day>"
+        yield b"</schedule>"
@@ -42,8 +42,8 @@
 from ..common.receipt import (
     attach_tickets,
     make_qrfile,
-    render_pdf,
     render_receipt,
+    render_receipt_pdf,
     set_tickets_emailed,
 )
 from ..common.walletpass import update_gwallet_pass_if_needed
@@ -207,12 +207,11 @@ def receipt(user_id=None, format=None):
     if format == "pdf":
         pdf = True
 
-    page = render_receipt(user, png, pdf)
     if pdf:
         url = external_url("tickets.receipt", user_id=user_id)
-        return send_file(render_pdf(url, page), mimetype="application/pdf", max_age=60)
+        return send_file(render_receipt_pdf(user, url), mimetype="application/pdf", max_age=60)
 
-    return page
+    return render_receipt(user, png, pdf)
 
 
 # This used to be for xhtml2pdf, but is handy for creating a shareable image
@@ -3,6 +3,8 @@
 from flask import (
     abort,
     flash,
+    g,
+    get_template_attribute,
     redirect,
     render_template,
     request,
@@ -20,10 +22,18 @@
 from sqlalchemy.orm import joinedload
 
 from apps.common.walletpass import update_gwallet_pass_if_needed
-from main import db
+from main import cache, db
 from models.basket import Basket
 from models.exc import CapacityException
-from models.product import PriceTier, Product, ProductGroup, ProductView, ProductViewProduct, Voucher
+from models.product import (
+    PRODUCT_CACHE_GENERATION,
+    PriceTier,
+    Product,
+    ProductGroup,
+    ProductView,
+    ProductViewProduct,
+    Voucher,
+)
 from models.site_state import get_sales_state, get_site_state
 
 from ..common import feature_enabled, get_user_currency, set_user_currency
@@ -31,6 +41,7 @@
 from ..config import config
 from . import empty_baskets, get_product_view, invalid_vouchers, no_capacity, tickets
 from .forms import TicketAmountsForm
+from .queue import check_queue
 
 
 @tickets.route("/tickets/tees")
@@ -90,6 +101,19 @@ def main(flow="main"):
         # User is prevented from buying by the sales state.
         return render_template("tickets/cutoff.html")
 
+    if not view.cfp_accepted_only and not view.vouchers_only and not session.get("basket_purchase_ids"):
+        # Hold everyone who doesn't already have reservations in the queue, if it's enabled.
+        holding_page = check_queue()
+        if holding_page is not None:
+            return holding_page
+
+    if can_use_cached_page(view):
+        # There's nothing user-specific about this page, so use the pre-rendered version.
+        # Anonymous users without reservations don't bypass the unavailable state.
+        page = render_cached_page(view, flow, available=sales_state == "available")
+        if page is not None:
+            return page
+
     # OK, looks like we can try and sell the user some stuff.
     products = products_for_view(view)
     form = TicketAmountsForm(list(products))
@@ -181,6 +205,114 @@ def products_for_view(product_view: ProductView) -> Sequence[Product]:
     )
 
 
+# The pre-rendered page isn't invalidated by changes to site state or feature flags,
+# so this should match the lifetime of those caches.
+CACHED_PAGE_TIMEOUT = 60
+
+
+def can_use_cached_page(view: ProductView) -> bool:
+    """Whether the tickets page for this view is the same for the current user as it
+    would be for any other anonymous user with an empty basket.
+
+    This is the case for almost everyone refreshing the page during a sale launch.
+    """
+    return (
+        request.method == "GET"
+        and current_user.is_anonymous
+        and not view.cfp_accepted_only
+        and not view.vouchers_only
+        and not session.get("basket_purchase_ids")
+        and not session.get("basket_surplus_purchase_ids")
+        and not session.get("ticket_voucher")
+        and not session.get("_flashes")
+        and feature_enabled("TICKETS_PAGE_CACHE")
+    )
+
+
+@cache.memoize(timeout=5)
+def get_anonymous_tier_limits(view_id: int) -> dict[int, int]:
+    """The number of items an anonymous user can buy from each active tier in a view.
+
+    This only depends on capacity, so is shared between all anonymous users.
+    """
+    view = db.session.get_one(ProductView, view_id)
+    tiers = [tier for product in products_for_view(view) for tier in product.price_tiers if tier.active]
+    return {tier.id: limit for tier, limit in PriceTier.user_limits(tiers).items()}
+
+
+def amount_placeholder(tier_id: int) -> Markup:
+    return Markup(f"<!-- tier-amount-{tier_id} -->")
+
+
+def render_page_shell(view: ProductView, flow: str, available: bool) -> dict:
+    """Render the tickets page, leaving placeholders for the amount selectors.
+
+    The selector for each tier is rendered for every limit it might have, so the
+    current capacity can be filled in without touching the DB or template engine.
+    """
+    currency = get_user_currency()
+    form = TicketAmountsForm(list(products_for_view(view)))
+    form.populate(Basket(current_user, currency))
+    form.currency_code.data = currency
+
+    amount_cell = get_template_attribute("tickets/_macros.html", "amount_cell")
+    cells = {}
+    for f in form.tiers:
+        tier = form._tiers[f.tier_id.data]
+        f._tier = tier
+        f._user_limit_reached = False
+
+        variants = []
+        for limit in range(tier.personal_limit + 1):
+            f.form.amount.values = range(limit + 1)
+            f._any = limit > 0
+            variants.append(str(amount_cell(f, available)))
+        cells[tier.id] = variants
+
+    html = render_template(
+        "tickets/choose.html",
+        form=form,
+        flow=flow,
+        view=view,
+        available=available,
+        voucher=None,
+        amount_placeholders={tier_id: amount_placeholder(tier_id) for tier_id in cells},
+    )
+    return {"html": html, "csp_nonce": g.csp_nonce, "cells": cells}
+
+
+def render_cached_page(view: ProductView, flow: str, available: bool) -> str | None:
+    """Fill in the current capacity and per-request values on the pre-rendered page.
+
+    Returns None if the cached page can't be used, e.g. because the tiers on sale
+    have changed since the capacity was last checked.
+    """
+    key_parts = [
+        PRODUCT_CACHE_GENERATION.get(),
+        request.base_url,
+        flow,
+        view.id,
+        get_user_currency(),
+        available,
+        get_site_state(),
+    ]
+    key = "tickets_page/" + "/".join(str(p) for p in key_parts)
+    shell = cache.get(key)
+    if shell is None:
+        shell = render_page_shell(view, flow, available)
+        cache.set(key, shell, timeout=CACHED_PAGE_TIMEOUT)
+
+    limits = get_anonymous_tier_limits(view.id)
+    page = shell["html"].replace(shell["csp_nonce"], g.csp_nonce)
+    for tier_id, variants in shell["cells"].items():
+        if tier_id not in limits:
+            return None
+        limit = min(limits[tier_id], len(variants) - 1)
+        page = page.replace(amount_placeholder(tier_id), variants[limit])
+
+    return page
+
+
 def handle_ticket_selection(
     form: TicketAmountsForm, view: ProductView, flow: str, basket: Basket
 ) -> ResponseReturnValue:
@@ -15,7 +15,7 @@
 from models import Currency
 from models.basket import Basket
 from models.payment import BankPayment, StripePayment
-from models.product import PriceTier, Product, Voucher
+from models.product import CapacitySnapshot, PriceTier, Product, Voucher
 from models.user import User
 
 from ..common.fields import EmailField, HiddenIntegerField, IntegerSelectField
@@ -82,6 +82,10 @@ def ensure_capacity(form, basket: Basket, voucher: Voucher | None) -> bool:
         # which the typechecker doesn't really like.
 
         # Whether submitted or not, update the allowed amounts before validating
+        capacity = CapacitySnapshot(form._tiers.values())
+        form._capacity = capacity
+        user_limits = PriceTier.user_limits(form._tiers.values(), current_user, capacity)
+        general_limits = PriceTier.user_limits(form._tiers.values(), capacity=capacity)
         capacity_available = True
         for f in form.tiers:
             pt_id = f.tier_id.data
@@ -90,7 +94,7 @@ def ensure_capacity(form, basket: Basket, voucher: Voucher | None) -> bool:
 
             # If they've already got reserved tickets, they can keep them
             # because they've been reserved in the database
-            user_specific_limit = tier.user_limit(current_user)
+            user_specific_limit = user_limits[tier]
             user_limit = max(user_specific_limit, basket.get(tier, 0))
 
             # If a voucher is being used, limit the number of adult tickets by however
@@ -105,7 +109,7 @@ def ensure_capacity(form, basket: Basket, voucher: Voucher | None) -> bool:
             values = range(user_limit + 1)
             f.form.amount.values = values
             f._any = any(values)  # type: ignore[attr-defined]
-            f._user_limit_reached = user_specific_limit == 0 and tier.user_limit() > 0  # type: ignore[attr-defined]
+            f._user_limit_reached = user_specific_limit == 0 and general_limits[tier] > 0  # type: ignore[attr-defined]
 
         return capacity_available
 
@@ -0,0 +1,87 @@
+"""
+Virtual queue for the tickets page.
+
+When the queue_admission_rate site state is set, visitors to the tickets page are
+given a signed, time-ordered token holding their place in the queue, and are shown
+a holding page until the admission frontier reaches them (see models.ticket_queue).
+"""
+
+from flask import current_app as app
+from flask import render_template, session
+from flask.typing import ResponseReturnValue
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from prometheus_client import Counter
+
+from main import cache
+from models.site_state import get_queue_admission_rate
+from models.ticket_queue import QUEUE_BACKENDS, QueueBackend
+
+queue_held = Counter("emf_tickets_queue_held_total", "Tickets page requests served the queue holding page")
+queue_admitted = Counter("emf_tickets_queue_admitted_total", "Visitors let through the tickets queue")
+
+# Once admitted, visitors don't need to queue again for this long
+TOKEN_MAX_AGE = 6 * 60 * 60
+
+
+def get_queue_backend() -> QueueBackend:
+    return QUEUE_BACKENDS[app.config.get("TICKETS_QUEUE_BACKEND", "cache")]()
+
+
+def get_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="tickets-queue")
+
+
+def load_token() -> dict | None:
+    token = session.get("ticket_queue_token")
+    if token is None:
+        return None
+
+    try:
+        return get_serializer().loads(token, max_age=TOKEN_MAX_AGE)
+    except BadSignature:
+        # Includes expired tokens
+        return None
+
+
+def save_token(position: int, admitted: bool) -> None:
+    session["ticket_queue_token"] = get_serializer().dumps({"position": position, "admitted": admitted})
+
+
+@cache.memoize(timeout=1)
+def get_admitted_position(rate: int) -> int:
+    return get_queue_backend().get_admitted(rate)
+
+
+def check_queue() -> ResponseReturnValue | None:
+    """Return the holding page if the current visitor hasn't been let through the queue yet.
+
+    Every held visitor hits this on each refresh, so it should stay cheap: admitted
+    visitors are let through on their token alone, and the admitted position is
+    shared across requests for a second rather than asked of the backend each time.
+    """
+    rate = get_queue_admission_rate()
+    if not rate:
+        return None
+
+    token = load_token()
+    if token is None:
+        token = {"position": get_queue_backend().issue_position(), "admitted": False}
+        save_token(**token)
+
+    if token["admitted"]:
+        return None
+
+    admitted = get_admitted_position(rate)
+    if token["position"] <= admitted:
+        queue_admitted.inc()
+        save_token(token["position"], True)
+        return None
+
+    queue_held.inc()
+    ahead = token["position"] - admitted
+    # Poll more often as the visitor gets near the front
+    refresh = min(max(ahead // (rate * 4), 5), 30)
+    page = render_template(
+        "tickets/queue.html", ahead=ahead, wait_minutes=ahead // (rate * 60), refresh=refresh
+    )
+    return page, 200, {"Cache-Control": "no-store"}
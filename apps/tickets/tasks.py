@@ -1,4 +1,8 @@
+import queue
+import threading
 from datetime import timedelta
+from itertools import batched
+from time import monotonic, sleep
 
 import click
 import googleapiclient.errors
@@ -8,8 +12,9 @@
 from sqlalchemy import func, select
 
 from apps.common import feature_enabled, walletpass
-from apps.common.receipt import RECEIPT_TYPES, attach_tickets, set_tickets_emailed
-from main import db
+from apps.common.pdf_renderer import PDFRenderer
+from apps.common.receipt import RECEIPT_TYPES, attach_tickets, render_receipt_pdfs, set_tickets_emailed
+from main import db, mail
 from models import naive_utcnow
 from models.payment import Payment
 from models.product import (
@@ -331,6 +336,57 @@ def create_merch():
     db.session.commit()
 
 
+def get_capacity_object(
+    group_name: str, product_name: str | None, tier_name: str | None
+) -> ProductGroup | Product | PriceTier:
+    if tier_name is not None:
+        if product_name is None:
+            raise click.ClickException("--product must be specified with --tier.")
+        obj = PriceTier.get_by_name(group_name, product_name, tier_name)
+    elif product_name is not None:
+        obj = Product.get_by_name(group_name, product_name)
+    else:
+        obj = ProductGroup.get_by_name(group_name)
+
+    if obj is None:
+        raise click.ClickException("Not found.")
+    return obj
+
+
+@tickets.cli.command("shard_capacity")
+@click.argument("group")
+@click.option("--product", help="Shard this product rather than the group")
+@click.option("--tier", help="Shard this price tier rather than the product")
+@click.option("-n", "--shards", type=int, default=8, show_default=True, help="Number of shards")
+@click.option("--lease", type=int, default=0, help="Capacity to carve out for each shard up-front")
+def shard_capacity(group, product, tier, shards, lease):
+    """Split capacity into shards to reduce lock contention during a sale launch.
+
+    Shard the most specific object which is being contended - sharding a price tier
+    means reservations don't touch the tier, product or group rows at all.
+    """
+    obj = get_capacity_object(group, product, tier)
+    try:
+        obj.shard_capacity(shards, lease)
+    except ValueError as e:
+        raise click.ClickException(str(e)) from e
+
+    db.session.commit()
+    app.logger.info("Sharded %s into %s shards", obj, shards)
+
+
+@tickets.cli.command("unshard_capacity")
+@click.argument("group")
+@click.option("--product", help="Unshard this product rather than the group")
+@click.option("--tier", help="Unshard this price tier rather than the product")
+def unshard_capacity(group, product, tier):
+    """Return unused leased capacity and stop sharding"""
+    obj = get_capacity_object(group, product, tier)
+    obj.unshard_capacity()
+    db.session.commit()
+    app.logger.info("Unsharded %s, %s remaining", obj, obj.get_total_remaining_capacity())
+
+
 @scheduled_task(minutes=30)
 def expire_reserved():
     """Expire reserved tickets"""
@@ -425,10 +481,57 @@ def email_transfer_reminders():
     #     db.session.commit()
 
 
+class WalletUpdater:
+    """Update users' Google Wallet passes on a background thread, at a limited rate.
+
+    The Wallet API has its own quota and is much slower than sending email,
+    so this lets the emails go out without waiting for it.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.updated = 0
+        self.failed = 0
+        self.queue: queue.Queue[int | None] = queue.Queue()
+        self.app = app._get_current_object()  # type: ignore[attr-defined]
+        self.thread = threading.Thread(target=self.run, name="gwallet_updates", daemon=True)
+        self.thread.start()
+
+    def add(self, user: User) -> None:
+        self.queue.put(user.id)
+
+    def run(self) -> None:
+        with self.app.test_request_context():
+            next_call = monotonic()
+            while (user_id := self.queue.get()) is not None:
+                sleep(max(0, next_call - monotonic()))
+                next_call = monotonic() + self.interval
+
+                try:
+                    walletpass.update_gwallet_pass_if_needed(db.session.get_one(User, user_id))
+                    self.updated += 1
+                except Exception:
+                    self.app.logger.exception("Error updating Google Wallet pass for user %s", user_id)
+                    self.failed += 1
+                finally:
+                    db.session.rollback()
+
+    def finish(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+
+
 @tickets.cli.command("email_tickets")
 @click.option("-u", "--user-id", type=int, required=False, help="Email only a specific user")
-def email_tickets(user_id: int | None) -> None:
-    """Email tickets to those who haven't received them"""
+@click.option("-w", "--workers", type=int, default=4, help="Number of PDFs to render at once")
+@click.option("-b", "--batch-size", type=int, default=50, help="Number of users to render PDFs for at a time")
+@click.option("--wallet-rate", type=float, default=5, help="Maximum Google Wallet updates per second")
+def email_tickets(user_id: int | None, workers: int, batch_size: int, wallet_rate: float) -> None:
+    """Email tickets to those who haven't received them
+
+    Each user's tickets are marked as issued as soon as their email has been sent,
+    so if this is interrupted, running it again will carry on where it left off.
+    """
     ctx = app.test_request_context()
     ctx.push()
 
@@ -444,7 +547,7 @@ def email_tickets(user_id: int | None) -> None:
     # We do still want to send out the emails, but we should
     # split out users without admissions tickets and send a different email.
     query = (
-        select(User, func.count(Purchase.id))
+        select(User.id, func.count(Purchase.id))
         .select_from(User)
         .join(User.owned_purchases)
         .where(
@@ -458,29 +561,68 @@ def email_tickets(user_id: int | None) -> None:
     if user_id is not None:
         query = query.where(User.id == user_id)
 
-    users_purchase_counts = list(db.session.execute(query).unique())
-
-    for user, purchase_count in users_purchase_counts:
-        plural = (purchase_count != 1 and "s") or ""
-
-        msg = EmailMessage(
-            f"Your Electromagnetic Field Ticket{plural}",
-            from_email=config.from_email("TICKETS_EMAIL"),
-            to=[user.email],
-        )
+    user_purchase_counts = list(db.session.execute(query))
+    app.logger.info("Emailing tickets to %s users", len(user_purchase_counts))
 
-        already_emailed = set_tickets_emailed(user)
-        msg.body = render_template("emails/receipt.txt", user=user, already_emailed=already_emailed)
+    wallet_updater = None
+    if feature_enabled("ISSUE_GOOGLE_WALLET_TICKETS"):
+        wallet_updater = WalletUpdater(wallet_rate)
 
-        attach_tickets(msg, user)
-
-        app.logger.info("Emailing %s receipt for %s tickets", user.email, purchase_count)
-        msg.send()
-
-        db.session.commit()
-
-        if feature_enabled("ISSUE_GOOGLE_WALLET_TICKETS"):
-            walletpass.update_gwallet_pass_if_needed(user)
+    # Not the shared renderer, which has PDF_RENDER_CONCURRENCY contexts for the web app
+    renderer = PDFRenderer(workers)
+    emailed = 0
+    start = monotonic()
+    try:
+        with mail.get_connection() as conn:
+            for batch in batched(user_purchase_counts, batch_size, strict=False):
+                users = [db.session.get_one(User, id) for id, _ in batch]
+                pdfs = render_receipt_pdfs(users, renderer)
+
+                for user, (_, purchase_count), pdf in zip(users, batch, pdfs, strict=True):
+                    plural = (purchase_count != 1 and "s") or ""
+
+                    msg = EmailMessage(
+                        f"Your Electromagnetic Field Ticket{plural}",
+                        from_email=config.from_email("TICKETS_EMAIL"),
+                        to=[user.email],
+                        connection=conn,
+                    )
+
+                    already_emailed = set_tickets_emailed(user)
+                    msg.body = render_template(
+                        "emails/receipt.txt", user=user, already_emailed=already_emailed
+                    )
+
+                    attach_tickets(msg, user, pdf)
+
+                    app.logger.info("Emailing %s receipt for %s tickets", user.email, purchase_count)
+                    msg.send()
+
+                    db.session.commit()
+                    emailed += 1
+
+                    if wallet_updater:
+                        wallet_updater.add(user)
+
+                elapsed = monotonic() - start
+                app.logger.info(
+                    "Emailed %s of %s users, %.1f per second",
+                    emailed,
+                    len(user_purchase_counts),
+                    emailed / elapsed,
+                )
+    finally:
+        renderer.close()
+        if wallet_updater:
+            app.logger.info("Waiting for Google Wallet updates to finish")
+            wallet_updater.finish()
+
+    elapsed = monotonic() - start
+    click.echo(
+        f"Emailed tickets to {emailed} users in {elapsed:.1f}s ({emailed / max(elapsed, 0.001):.1f} per second)"
+    )
+    if wallet_updater:
+        click.echo(f"Updated {wallet_updater.updated} Google Wallet passes, {wallet_updater.failed} failed")
 
 
 @tickets.cli.group()
@@ -5,7 +5,7 @@
 
 from sqlalchemy import cast, select
 from sqlalchemy.dialects.postgresql import INTERVAL
-from sqlalchemy.orm import InstrumentedAttribute, with_parent
+from sqlalchemy.orm import InstrumentedAttribute, contains_eager, joinedload, with_parent
 
 from apps.schedule import event_tz
 from main import db
@@ -105,6 +105,7 @@ def _occurrences_with_parent(
     return db.session.scalars(
         select(Occurrence)
         .join(Occurrence.schedule_item)
+        .options(contains_eager(Occurrence.schedule_item), joinedload(Occurrence.scheduled_venue))
         .where(with_parent(user, join_via))
         .where(Occurrence.scheduled_time < end)
         .where(occurrence_end > start)
@@ -120,6 +121,9 @@ def fetch_events(user: User, start: datetime, end: datetime) -> Sequence[Calenda
             select(ShiftEntry)
             .where(with_parent(user, User.shift_entries))
             .join(ShiftEntry.shift)
+            .options(
+                contains_eager(ShiftEntry.shift).options(joinedload(Shift.role), joinedload(Shift.venue))
+            )
             .where(Shift.start < end)
             .where(Shift.end > start)
         )
@@ -119,6 +119,7 @@ def volunteer_variables():
     schedule,  # noqa: F401
     sign_up,  # noqa: F401
     stats,  # noqa: F401
+    tasks,  # noqa: F401
     team_admin,  # noqa: F401
     training,  # noqa: F401
 )
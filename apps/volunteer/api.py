@@ -2,6 +2,7 @@
 from typing import TypedDict
 
 from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
 
 from models.volunteer.shift import Shift
 
@@ -37,6 +38,7 @@ def volunteer_json():
     """Basic API to get volunteer needs on Info Beamer screens."""
     urgent_shifts = (
         Shift.query.filter(and_(Shift.end >= datetime.now(), Shift.current_count < Shift.min_needed))
+        .options(joinedload(Shift.role), joinedload(Shift.venue))
         .order_by(Shift.start)
         .limit(10)
         .all()
@@ -49,6 +51,7 @@ def volunteer_json():
                 Shift.current_count >= Shift.min_needed,
             )
         )
+        .options(joinedload(Shift.role), joinedload(Shift.venue))
         .order_by(Shift.start)
         .limit(10)
         .all()
@@ -21,11 +21,11 @@
 from sqlalchemy.orm import joinedload, with_parent
 
 from apps.cfp.date import CONTENT_DAY_START
-from apps.users.calendar import CalendarDict, CalendarEntry, fetch_events
-from main import db, get_or_404
+from apps.users.calendar import CalendarDict, CalendarEntry, VolunteerShiftCalendarEntry, fetch_events
+from main import cache, db, get_or_404
 from models.user import User, generate_api_token
 from models.volunteer.role import Role
-from models.volunteer.shift import Shift, ShiftEntry, ShiftEntryState
+from models.volunteer.shift import SHIFT_GRID_GENERATION, Shift, ShiftEntry, ShiftEntryState
 from models.volunteer.venue import VolunteerVenue
 from models.volunteer.volunteer import Volunteer
 
@@ -34,6 +34,9 @@
 from ..schedule import event_tz
 from . import v_admin_required, v_user_required, volunteer
 
+# The grid is also invalidated whenever a shift, role, venue or entry changes
+SHIFT_GRID_TIMEOUT = 60 * 60
+
 
 def _get_roles_with_user_data(user):
     roles = Role.get_all()
@@ -50,22 +53,60 @@ def _get_roles_with_user_data(user):
     return res
 
 
-def _get_conflicts(shift: Shift, calendar: Sequence[CalendarEntry]) -> tuple[str, list[CalendarDict]]:
-    """Return (primary_conflict_type, conflict_details) for a shift.
+def _get_day_grid(day: date, include_unfinalised: bool) -> list[dict]:
+    """Return the shifts for a day as dicts, without any per-user data.
+
+    This is the same for every volunteer, so it's cached until the shifts change.
+    """
+    key = f"volunteer_shift_grid/{SHIFT_GRID_GENERATION.get()}/{day.isoformat()}/{include_unfinalised}"
+    grid = cache.get(key)
+    if grid is None:
+        grid = []
+        for s in Shift.get_all_for_day(day, include_unfinalised=include_unfinalised):
+            to_add = s.to_localtime_dict()
+            to_add["sign_up_url"] = url_for(".shift", shift_id=s.id)
+            to_add["local_start"] = s.local_start
+            to_add["local_end"] = s.local_end
+            grid.append(to_add)
+        cache.set(key, grid, timeout=SHIFT_GRID_TIMEOUT)
+    return grid
+
+
+def _get_conflicts(
+    shifts: Sequence[dict], calendar: Sequence[CalendarEntry]
+) -> list[tuple[str, list[CalendarDict]]]:
+    """Return (primary_conflict_type, conflict_details) for each shift.
 
     primary_conflict_type is the highest-priority conflict type (for CSS), or ""
     if there are no conflicts. conflict_details is a list of dicts describing
     each conflicting event.
+
+    Both shifts and calendar must be sorted by start time, so we can sweep
+    through them together rather than comparing every shift with every event.
     """
-    conflicts = sorted(
-        [event for event in calendar if event.overlaps_with(shift.local_start, shift.local_end)],
-        key=lambda c: c.conflict_priority,
-    )
-    if not conflicts:
-        return "", []
+    results = []
+    upcoming = 0
+    active: list[CalendarEntry] = []
+    for shift in shifts:
+        start, end = shift["local_start"], shift["local_end"]
+        while upcoming < len(calendar) and calendar[upcoming].start_time < end:
+            active.append(calendar[upcoming])
+            upcoming += 1
+        # Later shifts don't start any earlier, so anything finished now can be dropped
+        active = [event for event in active if event.end_time > start]
+
+        conflicts = sorted(
+            [event for event in active if event.overlaps_with(start, end)],
+            key=lambda c: c.conflict_priority,
+        )
+        if not conflicts:
+            results.append(("", []))
+            continue
+
+        details = [c.to_dict() for c in conflicts]
+        results.append((conflicts[0].type, details))
 
-    details = [c.to_dict() for c in conflicts]
-    return conflicts[0].type, details
+    return results
 
 
 def redirect_next_or_schedule(message: str | None = None) -> ResponseReturnValue:
@@ -94,6 +135,7 @@ def public_dashboard():
             Shift.current_count < Shift.max_needed,
             Shift.start < now + timedelta(days=days),
         )
+        .options(joinedload(Shift.role))
         .order_by(Shift.start, Shift.venue_id)
         .limit(100)
     )
@@ -145,20 +187,24 @@ def schedule():
     else:
         active_day = _active_day(dates)
 
-    shifts = Shift.get_all_for_day(active_day, include_unfinalised=current_volunteer.is_volunteer_admin)
+    shifts = _get_day_grid(active_day, current_volunteer.is_volunteer_admin)
     if len(shifts) == 0:
         # If there's no shifts nothing can conflict, so don't bother looking.
         user_calendar = []
     else:
-        user_calendar = fetch_events(current_user, shifts[0].start, shifts[-1].end)
+        # Shift times are stored as naive UTC
+        start = min(s["local_start"] for s in shifts).astimezone(UTC).replace(tzinfo=None)
+        end = max(s["local_end"] for s in shifts).astimezone(UTC).replace(tzinfo=None)
+        user_calendar = fetch_events(current_user, start, end)
 
+    user_shift_ids = {e.shift.id for e in user_calendar if isinstance(e, VolunteerShiftCalendarEntry)}
     by_time = defaultdict(lambda: [])
 
-    for s in shifts:
-        to_add = s.to_localtime_dict()
-        to_add["conflicts_with"], to_add["conflicts_detail"] = _get_conflicts(s, user_calendar)
-        to_add["sign_up_url"] = url_for(".shift", shift_id=to_add["id"])
-        to_add["is_user_shift"] = current_user in s.volunteers
+    conflicts = _get_conflicts(shifts, user_calendar)
+    for s, (conflicts_with, conflicts_detail) in zip(shifts, conflicts, strict=True):
+        to_add = dict(s)
+        to_add["conflicts_with"], to_add["conflicts_detail"] = conflicts_with, conflicts_detail
+        to_add["is_user_shift"] = s["id"] in user_shift_ids
         by_time[to_add["start_time"]].append(to_add)
 
     roles = _get_roles_with_user_data(current_user)
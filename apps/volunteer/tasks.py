@@ -0,0 +1,32 @@
+import click
+from flask import current_app as app
+from sqlalchemy import select
+
+from main import db
+from models.volunteer.shift import Shift, counted_shift_entries, refresh_shift_counts
+
+from . import volunteer
+
+
+@volunteer.cli.command("check_shift_counts")
+@click.option("--fix/--no-fix", default=False, help="Correct any counts which are wrong")
+def check_shift_counts(fix):
+    """Check the stored shift current_count against the shift entries"""
+    count = counted_shift_entries(Shift.id)
+    wrong = db.session.execute(
+        select(Shift.id, Shift.current_count, count).where(Shift.current_count != count).order_by(Shift.id)
+    ).all()
+
+    for shift_id, current_count, actual in wrong:
+        app.logger.warning("Shift %s has current_count %s, but %s entries", shift_id, current_count, actual)
+
+    if not wrong:
+        app.logger.info("All shift counts are correct")
+        return
+
+    if not fix:
+        raise click.ClickException(f"{len(wrong)} shift counts are wrong, rerun with --fix to correct them")
+
+    refresh_shift_counts(db.session)
+    db.session.commit()
+    app.logger.info("Fixed %s shift counts", len(wrong))
@@ -83,15 +83,89 @@ EMF.delay_search_arrivals = function () {
     EMF.search_arrivals();
   }, 250);
 };
+EMF.scan_queue = [];
+EMF.queue_scan = function (e) {
+  if (e.keyCode != 13) return;
+  e.preventDefault();
+
+  var item = $.trim($(this).val());
+  $(this).val("");
+  if (!item || EMF.scan_queue.includes(item)) return;
+
+  EMF.scan_queue.push(item);
+  EMF.render_scan_queue();
+};
+
+EMF.render_scan_queue = function () {
+  var list = $("#queue-items").empty();
+  EMF.scan_queue.forEach(function (item) {
+    list.append($("<li>").addClass("list-group-item").text(item));
+  });
+  $("#queue-count").text(EMF.scan_queue.length);
+  $("#queue-checkin").prop("disabled", EMF.scan_queue.length == 0);
+};
+
+EMF.bulk_checkin = function () {
+  var items = EMF.scan_queue.slice();
+  $("#queue-checkin").prop("disabled", true);
+
+  $.ajax({
+    url: EMF.bulk_checkin_url,
+    type: "POST",
+    contentType: "application/json",
+    data: JSON.stringify({ items: items }),
+  })
+    .done(function (data) {
+      EMF.scan_queue = EMF.scan_queue.filter((item) => !items.includes(item));
+      EMF.bulk_checkin_done(data);
+    })
+    .fail(EMF.search_arrivals_fail)
+    .always(EMF.render_scan_queue);
+};
+
+EMF.bulk_checkin_classes = {
+  "checked-in": "list-group-item-success",
+  "already-checked-in": "list-group-item-warning",
+  "nothing-to-redeem": "list-group-item-warning",
+  unknown: "list-group-item-danger",
+};
+
+EMF.bulk_checkin_done = function (data) {
+  $("#error").hide();
+  var list = $("#queue-results").empty();
+  data.results.forEach(function (result) {
+    var row = $("<li>")
+      .addClass("list-group-item")
+      .addClass(EMF.bulk_checkin_classes[result.status]);
+    if (result.status == "unknown") {
+      row.text(result.item + ": not found");
+    } else {
+      var link = $("<a>").attr("href", result.url).text(result.name);
+      var redeemed = result.redeemed.length;
+      var already = result.already_redeemed.length;
+      var summary = `: ${redeemed} checked in, ${already} already checked in`;
+      row.append(link, document.createTextNode(summary));
+      if (result.checkin_note) {
+        row.append($("<p>").append($("<strong>").text(result.checkin_note)));
+      }
+    }
+    list.append(row);
+  });
+};
+
 $(function () {
   const configEl = document.querySelector("#arrivals-config");
   if (!configEl) return;
   const config = JSON.parse(configEl.textContent);
   EMF.arrivalsMode = config.arrivalsMode;
   EMF.search_url = config.searchURL;
+  EMF.bulk_checkin_url = config.bulkCheckinURL;
 
   $("#query")
     .on("change keyup", EMF.delay_search_arrivals)
     .on("keydown", EMF.cancel_return)
     .focus();
+
+  $("#queue-input").on("keydown", EMF.queue_scan);
+  $("#queue-checkin").on("click", EMF.bulk_checkin);
 });
@@ -0,0 +1,39 @@
+"""Store shift current_count
+
+Revision ID: 3d9f6b2a8e71
+Revises: e8a3d51c7f24
+Create Date: 2026-10-18 19:26:03.118204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "3d9f6b2a8e71"
+down_revision = "e8a3d51c7f24"
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    with op.batch_alter_table("volunteer_shift", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("current_count", sa.Integer(), server_default="0", nullable=False))
+        batch_op.create_index(batch_op.f("ix_volunteer_shift_current_count"), ["current_count"], unique=False)
+
+    op.execute(
+        """
+        UPDATE volunteer_shift SET current_count = (
+            SELECT count(*) FROM volunteer_shift_entry
+            WHERE volunteer_shift_entry.shift_id = volunteer_shift.id
+            AND volunteer_shift_entry.state NOT IN ('NO_SHOW', 'ABANDONED')
+        )
+        """
+    )
+
+    with op.batch_alter_table("volunteer_shift", schema=None) as batch_op:
+        batch_op.alter_column("current_count", server_default=None)
+
+
+def downgrade():
+    with op.batch_alter_table("volunteer_shift", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_volunteer_shift_current_count"))
+        batch_op.drop_column("current_count")
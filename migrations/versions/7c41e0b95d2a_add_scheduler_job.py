@@ -0,0 +1,50 @@
+"""Add scheduler_job
+
+Revision ID: 7c41e0b95d2a
+Revises: 3d9f6b2a8e71
+Create Date: 2026-10-18 21:04:37.512390
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "7c41e0b95d2a"
+down_revision = "3d9f6b2a8e71"
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        "scheduler_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "state",
+            sa.Enum("queued", "running", "finished", "failed", "cancelled", native_enum=False),
+            nullable=False,
+        ),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("started", sa.DateTime(), nullable=True),
+        sa.Column("finished", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat", sa.DateTime(), nullable=True),
+        sa.Column("cancel_requested", sa.Boolean(), nullable=False),
+        sa.Column("parameters", sa.JSON(), nullable=False),
+        sa.Column("progress", sa.JSON(), nullable=False),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("potential_schedule_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["potential_schedule_id"],
+            ["potential_schedule.id"],
+            name=op.f("fk_scheduler_job_potential_schedule_id_potential_schedule"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_scheduler_job")),
+    )
+    with op.batch_alter_table("scheduler_job", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_scheduler_job_state"), ["state"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("scheduler_job", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_scheduler_job_state"))
+
+    op.drop_table("scheduler_job")
@@ -0,0 +1,29 @@
+"""Add arrivals_snapshot_cursor
+
+Revision ID: 9e2d4b7a1c63
+Revises: 7c41e0b95d2a
+Create Date: 2026-10-18 23:12:48.205117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = "9e2d4b7a1c63"
+down_revision = "7c41e0b95d2a"
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.create_table(
+        "arrivals_snapshot_cursor",
+        sa.Column("upstream", sa.String(), nullable=False),
+        sa.Column("cursor", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("upstream", name=op.f("pk_arrivals_snapshot_cursor")),
+    )
+    # The cursor used to be kept in site state, but the next full snapshot will replace it
+    op.execute("DELETE FROM site_state WHERE name = 'arrivals_snapshot_cursor'")
+
+
+def downgrade():
+    op.drop_table("arrivals_snapshot_cursor")
@@ -1,21 +1,22 @@
 import enum
+import uuid
 from bisect import bisect
 from collections import OrderedDict
-from collections.abc import Sequence
+from collections.abc import Collection, Sequence
 from datetime import UTC, datetime
 from decimal import Decimal
-from itertools import groupby, pairwise
+from itertools import chain, groupby, pairwise
 from typing import TYPE_CHECKING, assert_never
 
 import datetype
-from sqlalchemy import inspect
+from sqlalchemy import event, inspect
 from sqlalchemy.engine.row import Row
-from sqlalchemy.orm import Query
+from sqlalchemy.orm import Query, Session
 from sqlalchemy.orm.base import NO_VALUE
 from sqlalchemy.sql.functions import func
 from sqlalchemy_continuum.utils import transaction_class, version_class
 
-from main import db
+from main import cache, db
 
 # If we're type checking, we want models to inherit from the BaseModel (trivial subclass
 # of DeclarativeBase) as mypy can't handle using the sqlalchemy-flask generated db.Model
@@ -175,6 +176,63 @@ def get_pk(row):
         yield (pk, attr_times)
 
 
+class CacheGeneration:
+    """A token which changes whenever some models are edited, for use in cache keys.
+
+    Adding or deleting an instance of any watched class changes the token, as does
+    changing any of its attributes except ignored_attrs. Tokens can also be split
+    by extra key parts, e.g. a user ID, and refreshed by hand.
+    """
+
+    def __init__(self, key: str, watched_classes: Collection[type] = (), ignored_attrs: Collection[str] = ()):
+        self.key = key
+        self.watched_classes: tuple[type, ...] = ()
+        self.ignored_attrs = frozenset(ignored_attrs)
+        self.watch(*watched_classes)
+
+    def __repr__(self):
+        return f"<CacheGeneration {self.key}>"
+
+    def _cache_key(self, parts) -> str:
+        return "/".join([self.key, *map(str, parts)])
+
+    def get(self, *parts) -> str:
+        generation = cache.get(self._cache_key(parts))
+        if generation is None:
+            generation = self.refresh(*parts)
+        return generation
+
+    def refresh(self, *parts) -> str:
+        generation = uuid.uuid4().hex
+        cache.set(self._cache_key(parts), generation, timeout=0)
+        return generation
+
+    def watch(self, *classes: type) -> None:
+        """Also change whenever these classes are edited, for classes that can't be imported up front."""
+        if classes and not self.watched_classes:
+            event.listen(Session, "after_flush", self.after_flush)
+        self.watched_classes += classes
+
+    def changed(self, session: Session) -> bool:
+        for obj in chain(session.new, session.deleted):
+            if isinstance(obj, self.watched_classes):
+                return True
+
+        for obj in session.dirty:
+            if isinstance(obj, self.watched_classes) and any(
+                attr.history.has_changes()
+                for attr in inspect(obj).attrs
+                if attr.key not in self.ignored_attrs
+            ):
+                return True
+
+        return False
+
+    def after_flush(self, session, flush_context):
+        if self.changed(session):
+            self.refresh()
+
+
 from .admin_message import *  # noqa: F403
 from .arrivals import *  # noqa: F403
 from .basket import *  # noqa: F403
@@ -188,6 +246,7 @@ def get_pk(row):
 from .purchase import *  # noqa: F403
 from .scheduled_task import *  # noqa: F403
 from .site_state import *  # noqa: F403
+from .ticket_queue import *  # noqa: F403
 from .user import *  # noqa: F403
 from .village import *  # noqa: F403
 from .volunteer import *  # noqa: F403
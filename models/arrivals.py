@@ -1,16 +1,29 @@
-from sqlalchemy import ForeignKey
+from collections.abc import Collection
+from datetime import datetime
+from itertools import chain
+from uuid import uuid4
+
+from flask import current_app as app
+from sqlalchemy import ForeignKey, Select, delete, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship, selectinload
 
 from main import db
 from models.permission import Permission
 
-from . import BaseModel
+from . import BaseModel, naive_utcnow
 from .product import Product
+from .purchase import Purchase, bought_states
+from .user import User, generate_checkin_code
 
 __all__ = [
+    "ArrivalsRedemption",
+    "ArrivalsSnapshotCursor",
     "ArrivalsView",
     "ArrivalsViewProduct",
+    "CheckinCode",
+    "CheckinSummary",
 ]
 
 
@@ -70,3 +83,166 @@ def __init__(self, view, product):
 
     def __repr__(self):
         return f"<ArrivalsViewProduct: view {self.view_id}, product {self.product_id}>"
+
+
+class CheckinCode(BaseModel):
+    """A user's checkin code, so a scan can be resolved with one indexed lookup
+    rather than by verifying the HMAC.
+
+    Codes are added for new users as they're created. Arrivals nodes don't have
+    the upstream SECRET_KEY, so they get their codes from the arrivals snapshot.
+    """
+
+    __tablename__ = "checkin_code"
+    __export_data__ = False
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    code: Mapped[str] = mapped_column(unique=True)
+
+    def __repr__(self):
+        return f"<CheckinCode: user {self.user_id}>"
+
+
+class CheckinSummary(BaseModel):
+    """How many paid purchases a user has (and how many are redeemed) in each arrivals view.
+
+    This is kept up to date by checkin_index_change below, and refresh_checkin_summaries
+    needs calling after any bulk update that skips the ORM.
+    """
+
+    __tablename__ = "checkin_summary"
+    __export_data__ = False
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    view_id: Mapped[int] = mapped_column(ForeignKey(ArrivalsView.id, ondelete="CASCADE"), primary_key=True)
+    purchases: Mapped[int]
+    redeemed: Mapped[int]
+
+    def __repr__(self):
+        return f"<CheckinSummary: user {self.user_id}, view {self.view_id}: {self.redeemed}/{self.purchases}>"
+
+
+class ArrivalsRedemption(BaseModel):
+    """A redemption (or undo) made on an arrivals node.
+
+    The node keeps these until upstream has applied them, and upstream keeps a
+    copy of each one it's been sent along with the outcome, so that retried
+    pushes are idempotent and older events can't overwrite newer ones.
+    """
+
+    __tablename__ = "arrivals_redemption"
+    __export_data__ = False
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    event_id: Mapped[str] = mapped_column(unique=True, default=lambda: uuid4().hex)
+    node: Mapped[str]
+    purchase_id: Mapped[int] = mapped_column(ForeignKey("purchase.id"), index=True)
+    redeemed: Mapped[bool]
+    timestamp: Mapped[datetime] = mapped_column(default=naive_utcnow)
+    # Set once upstream has seen the event: one of REDEMPTION_RESULTS
+    result: Mapped[str | None]
+
+    purchase: Mapped[Purchase] = relationship()
+
+    def __init__(self, node: str, purchase: Purchase, redeemed: bool, **kwargs):
+        super().__init__(node=node, purchase=purchase, redeemed=redeemed, **kwargs)
+
+    def __repr__(self):
+        return f"<ArrivalsRedemption {self.event_id}: purchase {self.purchase_id} redeemed={self.redeemed}>"
+
+
+class ArrivalsSnapshotCursor(BaseModel):
+    """On an arrivals node, when the last snapshot from each upstream was taken,
+    so the next pull only needs the purchases modified since.
+    """
+
+    __tablename__ = "arrivals_snapshot_cursor"
+    __export_data__ = False
+
+    upstream: Mapped[str] = mapped_column(primary_key=True)
+    cursor: Mapped[datetime]
+
+    def __repr__(self):
+        return f"<ArrivalsSnapshotCursor: {self.upstream} at {self.cursor}>"
+
+
+# applied: upstream now matches the event
+# unchanged: upstream already matched the event
+# stale: a later event for the same purchase has already been applied
+# rejected: the purchase can't be redeemed upstream (e.g. it's been refunded)
+REDEMPTION_RESULTS = ["applied", "unchanged", "stale", "rejected"]
+
+
+def refresh_checkin_summaries(session: Session, user_ids: Collection[int] | Select | None = None) -> None:
+    """Recalculate the checkin summaries for some users, or everyone."""
+    summary = CheckinSummary.__table__
+    clear = delete(summary)
+    purchase_filter = Purchase.state.in_(bought_states) & Purchase.owner_id.is_not(None)
+    if user_ids is not None:
+        clear = clear.where(summary.c.user_id.in_(user_ids))
+        purchase_filter &= Purchase.owner_id.in_(user_ids)
+
+    counts = (
+        select(
+            Purchase.owner_id,
+            ArrivalsViewProduct.view_id,
+            func.count(),
+            func.count().filter(Purchase.redeemed),
+        )
+        .join(ArrivalsViewProduct, ArrivalsViewProduct.product_id == Purchase.product_id)
+        .where(purchase_filter)
+        .group_by(Purchase.owner_id, ArrivalsViewProduct.view_id)
+    )
+    stmt = insert(summary).from_select(["user_id", "view_id", "purchases", "redeemed"], counts)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "view_id"],
+        set_={"purchases": stmt.excluded.purchases, "redeemed": stmt.excluded.redeemed},
+    )
+
+    connection = session.connection()
+    connection.execute(clear)
+    connection.execute(stmt)
+
+
+def add_checkin_codes(session: Session, user_ids: Collection[int] | Select) -> None:
+    users = session.connection().execute(select(User.id).where(User.id.in_(user_ids)))
+    secret_key = app.config["SECRET_KEY"]
+    codes = [{"user_id": user_id, "code": generate_checkin_code(secret_key, user_id)} for (user_id,) in users]
+    if codes:
+        session.connection().execute(insert(CheckinCode.__table__).on_conflict_do_nothing(), codes)
+
+
+CHECKIN_SUMMARY_PURCHASE_ATTRS = ["state", "owner_id", "product_id", "redeemed"]
+
+
+@event.listens_for(Session, "after_flush")
+def checkin_index_change(session, flush_context):
+    user_ids: set[int | None] = set()
+    new_user_ids = []
+    rebuild = False
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Purchase):
+            attrs = inspect(obj).attrs
+            if obj in session.dirty and not any(
+                attrs[key].history.has_changes() for key in CHECKIN_SUMMARY_PURCHASE_ATTRS
+            ):
+                continue
+            if obj in session.new and obj.state not in bought_states:
+                continue
+            user_ids.add(obj.owner_id)
+            user_ids.update(attrs.owner_id.history.deleted)
+
+        elif isinstance(obj, ArrivalsViewProduct):
+            rebuild = True
+
+        elif isinstance(obj, User) and obj in session.new:
+            new_user_ids.append(obj.id)
+
+    if new_user_ids and not app.config.get("ARRIVALS_NODE"):
+        # Nodes can't generate checkin codes, and get them from upstream
+        add_checkin_codes(session, new_user_ids)
+
+    if rebuild:
+        refresh_checkin_summaries(session)
+    elif user_ids - {None}:
+        refresh_checkin_summaries(session, user_ids - {None})
@@ -14,7 +14,7 @@
 
 from . import Currency
 from .exc import CapacityException
-from .product import PRODUCT_GROUP_TYPES_DICT, PriceTier, Voucher
+from .product import PRODUCT_GROUP_TYPES_DICT, CapacitySnapshot, PriceTier, Voucher
 from .purchase import Purchase
 
 __all__ = [
@@ -226,11 +226,14 @@ def create_purchases(self):
 
         purchases_to_flush = []
         with db.session.no_autoflush:
+            # user_limits takes into account existing purchases
+            user_limits = PriceTier.user_limits(
+                [line.tier for line in self._lines if line.count > len(line.purchases)], self.user
+            )
             for line in self._lines:
                 issue_count = line.count - len(line.purchases)
                 if issue_count > 0:
-                    # user_limit takes into account existing purchases
-                    if issue_count > line.tier.user_limit(self.user):
+                    if issue_count > user_limits[line.tier]:
                         raise CapacityException(f"Insufficient capacity for tier {line.tier}.")
 
                     line.tier.issue_instances(issue_count)
@@ -262,8 +265,9 @@ def ensure_purchase_capacity(self):
         This could be moved to an after_flush handler for CapacityMixin.
         """
         db.session.flush()
+        capacity = CapacitySnapshot(line.tier for line in self._lines)
         for line in self._lines:
-            if line.tier.get_total_remaining_capacity() < 0:
+            if capacity.get_total_remaining_capacity(line.tier) < 0:
                 # explicit rollback - we don't want this exception ignored
                 db.session.rollback()
                 raise CapacityException("Insufficient capacity.")
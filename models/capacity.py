@@ -1,5 +1,11 @@
 from functools import total_ordering
 
+from sqlalchemy import FetchedValue, event
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm.attributes import get_history
+
+from . import BaseModel
+
 
 @total_ordering
 class UnlimitedType:
@@ -21,3 +27,48 @@ def __repr__(self):
 
 
 Unlimited = UnlimitedType()
+
+
+class CapacityShard(BaseModel):
+    """A sub-counter holding a block of capacity leased from a CapacityMixin object.
+
+    Sharded objects issue instances from one of their shards rather than cascading
+    up to their parents, so concurrent reservations only lock a single shard row.
+    Capacity is leased from the owning object (and therefore all its ancestors)
+    in blocks, so the parents are only touched when a shard needs topping up.
+
+    capacity_max is the amount leased to this shard, and capacity_used is the
+    amount of that lease which has been issued.
+    """
+
+    __tablename__ = "capacity_shard"
+    __export_data__ = False
+
+    # There's no foreign key here as shards can belong to any CapacityMixin table
+    object_type: Mapped[str] = mapped_column(primary_key=True)
+    object_id: Mapped[int] = mapped_column(primary_key=True)
+    shard: Mapped[int] = mapped_column(primary_key=True)
+
+    capacity_max: Mapped[int] = mapped_column(default=0, server_onupdate=FetchedValue())
+    capacity_used: Mapped[int] = mapped_column(default=0, server_onupdate=FetchedValue())
+
+    def remaining_capacity(self) -> int:
+        return self.capacity_max - self.capacity_used
+
+    def __repr__(self):
+        return (
+            f"<CapacityShard {self.object_type}:{self.object_id}/{self.shard} "
+            f"{self.capacity_used}/{self.capacity_max}>"
+        )
+
+
+@event.listens_for(CapacityShard, "before_update")
+def capacity_shard_before_update(mapper, connection, target):
+    """Leases and issues happen concurrently, so as with CapacityMixin,
+    rewrite both counters as DB-side increments."""
+    for attr in ["capacity_max", "capacity_used"]:
+        history = get_history(target, attr)
+        if not history.has_changes():
+            continue
+        delta = sum(history.added) - sum(history.deleted)
+        setattr(target, attr, getattr(CapacityShard, attr) + delta)
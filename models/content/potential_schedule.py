@@ -21,6 +21,7 @@
 from .venue import Venue
 
 PotentialScheduleState = Literal["new", "applied", "discarded"]
+SchedulerJobState = Literal["queued", "running", "finished", "failed", "cancelled"]
 
 log = logging.getLogger(__name__)
 
@@ -104,3 +105,46 @@ def __eq__(self, other: Any) -> Any:
 
     def __lt__(self, other: Any) -> Any:
         return self.id < other.id
+
+
+class SchedulerJob(BaseModel):
+    """A run of the automatic scheduler in a background process.
+
+    Jobs are queued from the scheduler page and run by `flask cfp run_scheduler_job`,
+    which records its progress here and creates a PotentialSchedule when it finishes.
+    """
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    state: Mapped[SchedulerJobState] = mapped_column(
+        Enum(
+            *get_args(SchedulerJobState),
+            native_enum=False,
+        ),
+        default="queued",
+        index=True,
+    )
+    created: Mapped[datetime] = mapped_column(default=naive_utcnow)
+    started: Mapped[datetime | None]
+    finished: Mapped[datetime | None]
+    #: Last time the job process reported progress, to spot jobs which have died
+    heartbeat: Mapped[datetime | None]
+    #: Set from the web UI, the job process stops at its next heartbeat
+    cancel_requested: Mapped[bool] = mapped_column(default=False)
+
+    #: The arguments to Scheduler.run
+    parameters: Mapped[dict[str, Any]] = mapped_column(JSON)
+    #: What the job is currently doing, and anything it's found so far
+    progress: Mapped[dict[str, Any]] = mapped_column(JSON, default=dict)
+    error: Mapped[str | None]
+
+    potential_schedule_id: Mapped[int | None] = mapped_column(ForeignKey("potential_schedule.id"))
+    potential_schedule: Mapped[PotentialSchedule | None] = relationship()
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    def update_progress(self, **progress: Any) -> None:
+        # Reassign so the JSON column is marked as changed
+        self.progress = {**self.progress, **progress}
+        self.heartbeat = naive_utcnow()
@@ -5,6 +5,7 @@
 from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from itertools import chain
 from typing import (  # noqa: UP035
     Any,
     Literal,
@@ -22,13 +23,16 @@
     Integer,
     Table,
     UniqueConstraint,
+    event,
     func,
+    inspect,
     select,
 )
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import (
     Mapped,
+    Session,
     column_property,
     mapped_column,
     relationship,
@@ -38,7 +42,7 @@
 from apps.config import config
 from main import db
 
-from .. import BaseModel, naive_utcnow
+from .. import BaseModel, CacheGeneration, naive_utcnow
 from ..user import User
 from . import validate_state_transitions
 from .attributes import (
@@ -634,12 +638,15 @@ def availability(self) -> list[ScheduleItemAvailability]:
         """
         return self.schedule_item.availability
 
-    def get_allowed_venues(self) -> set[Venue]:
+    def get_allowed_venues(self, index: VenueTimeIndex | None = None) -> set[Venue]:
         """Get the allowed venues for this Occurrence, defaulting to the default venues for its
         content type if none are set."""
         if self.allowed_venues:
             return set(self.allowed_venues)
 
+        if index is not None:
+            return index.get_venues(self.schedule_item.type, default_only=not self.manually_scheduled)
+
         query = (
             select(Venue)
             .join(Venue.time_blocks)
@@ -666,37 +673,44 @@ def valid_allowed_venues(self) -> set[Venue]:
             )
         return set(db.session.scalars(select(Venue).where(Venue.allows_attendee_content == True)))
 
-    def time_blocks(self) -> Iterable[TimeBlock]:
+    def _venue_time_blocks(self, venue: Venue, index: VenueTimeIndex | None) -> Iterable[TimeBlock]:
+        """The venue's TimeBlocks for this Occurrence's content type."""
+        if index is not None:
+            return index.get_time_blocks(venue, self.schedule_item.type)
+        return [block for block in venue.time_blocks if block.type == self.schedule_item.type]
+
+    def time_blocks(self, index: VenueTimeIndex | None = None) -> Iterable[TimeBlock]:
         """TimeBlocks which this Occurrence can be scheduled in.
 
         This takes into account whether the Occurrence has been manually scheduled, but it doesn't
         take into account speaker availability.
+
+        Pass a VenueTimeIndex to avoid querying venues and TimeBlocks.
         """
         if self.manually_scheduled and self.scheduled_time:
             # Occurrence is manually scheduled at a specific time, so we only
             # return TimeBlocks in venues that have a suitable timeblock at
             # this time.
-            for venue in self.get_allowed_venues():
-                for timeblock in venue.time_blocks:
+            for venue in self.get_allowed_venues(index):
+                for timeblock in self._venue_time_blocks(venue, index):
                     if (
-                        timeblock.type == self.schedule_item.type
-                        and self.scheduled_end_time is not None
+                        self.scheduled_end_time is not None
                         and timeblock.start <= self.scheduled_time
                         and self.scheduled_end_time <= timeblock.end
                     ):
                         yield timeblock
                         break
         else:
-            for venue in self.get_allowed_venues():
-                for timeblock in venue.time_blocks:
+            for venue in self.get_allowed_venues(index):
+                for timeblock in self._venue_time_blocks(venue, index):
                     # The default filter only applies to plain items - manual scheduling
                     # and explicit allowed_venues both opt out of it.
-                    if timeblock.type == self.schedule_item.type and (
-                        self.manually_scheduled or self.allowed_venues or timeblock.default
-                    ):
+                    if self.manually_scheduled or self.allowed_venues or timeblock.default:
                         yield timeblock
 
-    def allowed_times(self, automatic: bool) -> dict[Venue, list[TimeRange]]:
+    def allowed_times(
+        self, automatic: bool, index: VenueTimeIndex | None = None
+    ) -> dict[Venue, list[TimeRange]]:
         """Return a mapping of Venue -> time range for when this occurrence is allowed to be scheduled,
             which is the input into the automatic scheduler.
 
@@ -708,7 +722,7 @@ def allowed_times(self, automatic: bool) -> dict[Venue, list[TimeRange]]:
         ranges = merge_time_ranges(self.schedule_item.availability_overrides or self.availability)
 
         result: dict[Venue, list[TimeRange]] = defaultdict(list)
-        for time_block in self.time_blocks():
+        for time_block in self.time_blocks(index):
             if self.manually_scheduled and self.scheduled_time:
                 assert self.scheduled_end_time
 
@@ -841,4 +855,30 @@ def scheduled(self) -> bool:
 
 from .cfp import Proposal
 from .potential_schedule import PotentialScheduleOccurrence
-from .venue import TimeBlock, Venue
+from .venue import TimeBlock, Venue, VenueTimeIndex
+
+# Favouriting doesn't change anything in the public schedule
+SCHEDULE_GENERATION = CacheGeneration(
+    "schedule_generation",
+    [ScheduleItem, Occurrence, Venue],
+    ignored_attrs={"favourited_by", "favourite_count"},
+)
+
+
+# Only watches favourites, so has its own listener
+FAVOURITES_GENERATION = CacheGeneration("favourites_generation")
+
+
+@event.listens_for(Session, "after_flush")
+def favourites_change(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            favourites = inspect(obj).attrs.favourites
+        elif isinstance(obj, ScheduleItem):
+            favourites = inspect(obj).attrs.favourited_by
+        else:
+            continue
+
+        if obj in session.deleted or favourites.history.has_changes():
+            FAVOURITES_GENERATION.refresh()
+            return
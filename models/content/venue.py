@@ -1,4 +1,7 @@
+from collections import defaultdict
+from collections.abc import Iterable
 from datetime import datetime
+from typing import Self
 
 from geoalchemy2 import Geometry, WKBElement
 from geoalchemy2.shape import to_shape
@@ -11,6 +14,7 @@
     Mapped,
     mapped_column,
     relationship,
+    selectinload,
 )
 
 from main import db
@@ -148,3 +152,42 @@ class TimeBlock(BaseModel):
 
     def __repr__(self):
         return f"<TimeBlock ({self.type}) for {self.venue.name}: {self.start} - {self.end}>"
+
+
+class VenueTimeIndex:
+    """Every Venue and its TimeBlocks, loaded up-front.
+
+    Building a scheduling problem needs the allowed venues and TimeBlocks of
+    every occurrence. Passing one of these to `Occurrence.allowed_times` and
+    `Occurrence.time_blocks` answers that from memory rather than querying
+    for each occurrence.
+    """
+
+    def __init__(self, venues: Iterable[Venue]):
+        self.venues: dict[int, Venue] = {venue.id: venue for venue in venues}
+
+        #: TimeBlocks for each (venue ID, content type), in start order
+        self.time_blocks: dict[tuple[int, ScheduleItemType], list[TimeBlock]] = defaultdict(list)
+        #: Venues with any TimeBlock for each content type
+        self.venues_by_type: dict[ScheduleItemType, set[Venue]] = defaultdict(set)
+        #: Venues with a default TimeBlock for each content type
+        self.default_venues_by_type: dict[ScheduleItemType, set[Venue]] = defaultdict(set)
+
+        for venue in self.venues.values():
+            for block in sorted(venue.time_blocks, key=lambda b: b.start):
+                self.time_blocks[(venue.id, block.type)].append(block)
+                self.venues_by_type[block.type].add(venue)
+                if block.default:
+                    self.default_venues_by_type[block.type].add(venue)
+
+    @classmethod
+    def load(cls) -> Self:
+        return cls(db.session.scalars(select(Venue).options(selectinload(Venue.time_blocks))))
+
+    def get_time_blocks(self, venue: Venue, type: ScheduleItemType) -> list[TimeBlock]:
+        return self.time_blocks.get((venue.id, type), [])
+
+    def get_venues(self, type: ScheduleItemType, default_only: bool) -> set[Venue]:
+        if default_only:
+            return set(self.default_venues_by_type.get(type, ()))
+        return set(self.venues_by_type.get(type, ()))
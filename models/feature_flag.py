@@ -25,6 +25,7 @@
     "SCHEDULE",
     "SPONSORS_IN_NAV",
     "STRIPE",
+    "TICKETS_PAGE_CACHE",
     "VOLUNTEERS_SIGNUP",
     "VOLUNTEERS_SCHEDULE",
     "VOLUNTEERS_FULL",
@@ -1,12 +1,16 @@
+import math
+import random
 from abc import abstractmethod
 from datetime import datetime
 
-from sqlalchemy import JSON, FetchedValue, and_, event, func
+from sqlalchemy import JSON, FetchedValue, and_, event, func, select
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import Mapped, column_property, mapped_column
 from sqlalchemy.orm.attributes import get_history
 
-from .capacity import Unlimited, UnlimitedType
+from main import db
+
+from .capacity import CapacityShard, Unlimited, UnlimitedType
 from .exc import CapacityException
 
 
@@ -18,11 +22,18 @@ class CapacityMixin:
     capacity.
 
     Objects which inherit this mixin must have a "parent" relationship.
+
+    Capacity can optionally be sharded (see `shard_capacity`), in which case
+    instances are issued from one of a number of CapacityShards, each holding
+    a block of capacity leased from this object and its ancestors.
     """
 
     # A max capacity of None implies no max (or use parent's if set)
     capacity_max: Mapped[int | None] = mapped_column(default=None)
     capacity_used: Mapped[int] = mapped_column(default=0, server_onupdate=FetchedValue())
+    # If non-zero, capacity is issued from this many CapacityShards.
+    # When sharded, capacity_used includes capacity leased to shards.
+    capacity_shard_count: Mapped[int] = mapped_column(default=0, server_default="0")
 
     expires: Mapped[datetime | None]
 
@@ -97,12 +108,48 @@ def get_total_remaining_capacity(self) -> int | UnlimitedType:
 
         Returns Unlimited if no objects have a capacity_max set.
         """
+        return self._add_shard_capacity(self.get_unleased_remaining_capacity(), self.get_capacity_shards())
+
+    def _add_shard_capacity(
+        self, remaining: int | UnlimitedType, shards: list[CapacityShard]
+    ) -> int | UnlimitedType:
+        if not self.capacity_shard_count or isinstance(remaining, UnlimitedType):
+            return remaining
+
+        # Leased capacity has already been taken from our ancestors, so it's
+        # added on after the parent limit is applied. If this transaction has
+        # overdrawn any counter, report that so the caller rolls back.
+        shard_remaining = [shard.remaining_capacity() for shard in shards]
+        overdrawn = [r for r in [remaining, *shard_remaining] if r < 0]
+        if overdrawn:
+            return min(overdrawn)
+
+        return remaining + sum(shard_remaining)
+
+    def get_unleased_remaining_capacity(self) -> int | UnlimitedType:
+        """
+        Get the capacity remaining to this object and all its ancestors,
+        ignoring any capacity leased to this object's shards.
+        """
         remaining = self.remaining_capacity()
         if self.parent:
             return min(remaining, self.parent.get_total_remaining_capacity())
 
         return remaining
 
+    def get_capacity_shards(self) -> list[CapacityShard]:
+        if not self.capacity_shard_count:
+            return []
+
+        return list(
+            db.session.scalars(
+                select(CapacityShard)
+                .where(CapacityShard.object_type == self.__tablename__)
+                .where(CapacityShard.object_id == self.id)
+                .order_by(CapacityShard.shard)
+            )
+        )
+
     def has_expired(self):
         """
         Determine whether this object, and any of its ancestors, have
@@ -111,6 +158,12 @@ def has_expired(self):
         if self.parent and self.parent.has_expired():
             return True
 
+        return self.has_own_expiry_passed()
+
+    def has_own_expiry_passed(self) -> bool:
+        """
+        Determine whether this object has expired, ignoring its ancestors.
+        """
         return bool(self.expires) and self.__expired
 
     def issue_instances(self, count):
@@ -120,6 +173,7 @@ def issue_instances(self, count):
 
         This design (cascading up instead of carving out allocations)
         is liable to contention if there's a rush on reservations.
+        Sharding the capacity avoids this by issuing from leased blocks.
         """
         if not self.has_capacity(count):
             raise CapacityException("Out of capacity.")
@@ -127,18 +181,137 @@ def issue_instances(self, count):
         if self.has_expired():
             raise CapacityException("Expired.")
 
+        if self.capacity_shard_count:
+            self._issue_from_shard(count)
+            return
+
+        self._issue_unsharded(count)
+
+    def _issue_unsharded(self, count):
         if self.parent:
             self.parent.issue_instances(count)
 
         self.capacity_used += count
 
+    def _issue_from_shard(self, count):
+        """
+        Issue from a randomly-chosen shard with enough capacity, so that
+        concurrent transactions are spread across the shard rows.
+        """
+        shards = self.get_capacity_shards()
+        if not shards:
+            # Marked as sharded without any shard rows, e.g. after a partial unshard
+            self._issue_unsharded(count)
+            return
+
+        start = random.randrange(len(shards))
+        shards = shards[start:] + shards[:start]
+
+        for shard in shards:
+            if shard.remaining_capacity() >= count:
+                shard.capacity_used += count
+                return
+
+        self._rebalance_shard(shards[0], shards[1:], count)
+        shards[0].capacity_used += count
+
+    def _rebalance_shard(self, shard, other_shards, count):
+        """
+        Top up shard so that it has at least count capacity available.
+
+        Capacity is leased from this object (which cascades up to its ancestors)
+        while there's some left, and then taken back from the other shards.
+        The lease size shrinks as capacity runs out, so that little capacity is
+        left stranded in idle shards towards the end of a sale.
+        """
+        needed = count - shard.remaining_capacity()
+
+        available = self.get_unleased_remaining_capacity()
+        if isinstance(available, UnlimitedType):
+            lease = max(needed, 1)
+        else:
+            lease = min(available, max(needed, math.ceil(available / (2 * self.capacity_shard_count))))
+
+        if lease > 0:
+            self._issue_unsharded(lease)
+            shard.capacity_max += lease
+            needed -= lease
+
+        for other in other_shards:
+            if needed <= 0:
+                break
+
+            spare = min(needed, other.remaining_capacity())
+            if spare > 0:
+                other.capacity_max -= spare
+                shard.capacity_max += spare
+                needed -= spare
+
+        if needed > 0:
+            # has_capacity should have caught this
+            raise CapacityException("Out of capacity.")
+
     def return_instances(self, count):
         "Reintroduce previously used capacity"
+        for shard in self.get_capacity_shards():
+            returned = min(count, shard.capacity_used)
+            if returned > 0:
+                shard.capacity_used -= returned
+                count -= returned
+
+        # Anything not returned to a shard was issued before sharding
+        if count > 0:
+            self._return_unsharded(count)
+
+    def _return_unsharded(self, count):
         if self.parent:
             self.parent.return_instances(count)
 
         self.capacity_used -= count
 
+    def shard_capacity(self, shard_count, initial_lease=0):
+        """
+        Split this object's capacity into shard_count sub-counters to reduce
+        row-lock contention on this object and its ancestors.
+
+        Shards start empty and lease capacity as it's needed, unless
+        initial_lease is given, in which case that amount is carved out
+        for each shard up-front.
+        """
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1.")
+
+        if self.capacity_shard_count:
+            raise ValueError(f"{self} is already sharded.")
+
+        remaining = self.get_total_remaining_capacity()
+        if isinstance(remaining, UnlimitedType):
+            raise ValueError(f"{self} has unlimited capacity, so sharding it would have no effect.")
+
+        if initial_lease * shard_count > remaining:
+            raise ValueError(f"Cannot lease {initial_lease * shard_count} with {remaining} remaining.")
+
+        self.capacity_shard_count = shard_count
+        for i in range(shard_count):
+            shard = CapacityShard(object_type=self.__tablename__, object_id=self.id, shard=i)
+            if initial_lease:
+                self._issue_unsharded(initial_lease)
+                shard.capacity_max = initial_lease
+            db.session.add(shard)
+
+    def unshard_capacity(self):
+        """
+        Return any unused leased capacity to this object and its ancestors,
+        and go back to issuing instances directly.
+        """
+        for shard in self.get_capacity_shards():
+            unused = shard.remaining_capacity()
+            if unused > 0:
+                self._return_unsharded(unused)
+            db.session.delete(shard)
+
+        self.capacity_shard_count = 0
+
 
 class InheritedAttributesMixin:
     """Create a JSON column to store arbitrary attributes. When fetching attributes, cascade up to the parent (which
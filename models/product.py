@@ -3,26 +3,28 @@
 import re
 import string
 from collections import defaultdict
-from collections.abc import Sequence
+from collections.abc import Iterable, Sequence
 from dataclasses import dataclass
 from datetime import timedelta
 from decimal import Decimal
 from typing import TYPE_CHECKING, cast
 
-from sqlalchemy import ForeignKey, Numeric, UniqueConstraint, func, inspect, select
+from sqlalchemy import ForeignKey, Numeric, UniqueConstraint, func, inspect, select, tuple_
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import (
     Mapped,
     column_property,
+    joinedload,
     mapped_column,
     relationship,
     validates,
 )
+from sqlalchemy.orm.util import identity_key
 
 from main import NaiveDT, db
 
-from . import BaseModel, Currency, naive_utcnow
-from .capacity import UnlimitedType
+from . import BaseModel, CacheGeneration, Currency, naive_utcnow
+from .capacity import CapacityShard, UnlimitedType
 from .mixins import CapacityMixin, InheritedAttributesMixin
 from .purchase import AdmissionTicket, Purchase, Ticket
 
@@ -34,6 +36,7 @@
     from .user import User
 
 __all__ = [
+    "CapacitySnapshot",
     "MultipleLoadedResultsFound",
     "Price",
     "PriceTier",
@@ -468,26 +471,51 @@ def get_price_loaded(self, currency: Currency) -> Price | None:
         prices = [p for p in self.prices if p.currency == currency]
         return one_or_none(prices)
 
-    def user_limit(self, user: User | None = None) -> int:
-        if self.has_expired():
-            return 0
+    def user_limit(self, user: User | None = None, capacity: CapacitySnapshot | None = None) -> int:
+        return PriceTier.user_limits([self], user, capacity)[self]
 
-        remaining = self.get_total_remaining_capacity()
-        if isinstance(remaining, UnlimitedType):
-            limit = self.personal_limit
-        else:
-            limit = min(self.personal_limit, remaining)
+    @classmethod
+    def user_limits(
+        cls, tiers: Iterable[PriceTier], user: User | None = None, capacity: CapacitySnapshot | None = None
+    ) -> dict[PriceTier, int]:
+        """The number of items a user can buy from each tier, taking into account
+        capacity and what they've already bought.
+
+        This fetches the user's existing purchases for all tiers in one query.
+        """
+        tiers = list(tiers)
+        if capacity is None:
+            capacity = CapacitySnapshot(tiers)
+
+        already_purchased: dict[int, int] = {}
+        if user is not None and not user.is_anonymous and tiers:
+            already_purchased = dict(
+                db.session.execute(
+                    select(Purchase.price_tier_id, func.count(Purchase.id))
+                    .where(Purchase.price_tier_id.in_([tier.id for tier in tiers]))
+                    .where(Purchase.purchaser_id == user.id)
+                    .where(Purchase.state.in_(["paid", "payment-pending"]))
+                    .group_by(Purchase.price_tier_id)
+                )
+                .tuples()
+                .all()
+            )
+
+        limits = {}
+        for tier in tiers:
+            if capacity.has_expired(tier):
+                limits[tier] = 0
+                continue
+
+            remaining = capacity.get_total_remaining_capacity(tier)
+            if isinstance(remaining, UnlimitedType):
+                limit = tier.personal_limit
+            else:
+                limit = min(tier.personal_limit, remaining)
 
-        if user is not None and not user.is_anonymous:
-            already_purchased = db.session.execute(
-                select(func.count(Purchase.id))
-                .where(Purchase.price_tier_id == self.id)
-                .where(Purchase.purchaser_id == user.id)
-                .where(Purchase.state.in_(["paid", "payment-pending"]))
-            ).scalar_one()
-            limit = max(0, limit - already_purchased)
+            limits[tier] = max(0, limit - already_purchased.get(tier.id, 0))
 
-        return limit
+        return limits
 
     def __repr__(self):
         return f"<PriceTier {self.name}>"
@@ -500,6 +528,134 @@ def __lt__(self, other):
         return self.id < other.id
 
 
+type CapacityObject = ProductGroup | Product | PriceTier
+
+
+class CapacitySnapshot:
+    """A point-in-time view of the remaining capacity and expiry of a set of PriceTiers.
+
+    Walking up from a PriceTier through its Product and ProductGroups issues a query
+    for each ancestor which isn't already loaded, and the same ancestors are walked
+    again for every tier. This loads the whole chain with a fixed number of queries
+    (none, if it's already in the session) and memoises the results for every object.
+
+    Results reflect the objects as they were when first asked about, so create a new
+    snapshot after issuing or returning capacity.
+    """
+
+    def __init__(self, tiers: Iterable[PriceTier]):
+        self.tiers = list(tiers)
+        self._remaining: dict[tuple[str, int], int | UnlimitedType] = {}
+        self._expired: dict[tuple[str, int], bool] = {}
+        self._shards: dict[tuple[str, int], list[CapacityShard]] = {}
+        self._load()
+
+    @staticmethod
+    def _key(obj: CapacityObject) -> tuple[str, int]:
+        return (obj.__tablename__, obj.id)
+
+    @staticmethod
+    def _is_stale(obj: CapacityObject) -> bool:
+        # capacity_used and the expiry column_property are expired on flush
+        return bool(
+            inspect(obj).unloaded & {"capacity_used", "capacity_shard_count", "_CapacityMixin__expired"}
+        )
+
+    @classmethod
+    def _get_loaded[T: CapacityObject](cls, model: type[T], id: int) -> T | None:
+        """Fetch an object from the session without hitting the DB, if it's usable"""
+        obj = db.session.identity_map.get(identity_key(model, id))
+        if obj is None or cls._is_stale(obj):
+            return None
+        return obj
+
+    def _load(self) -> None:
+        stale_tier_ids = [
+            tier.id
+            for tier in self.tiers
+            if inspect(tier).persistent
+            and (self._is_stale(tier) or self._get_loaded(Product, tier.product_id) is None)
+        ]
+        if stale_tier_ids:
+            db.session.execute(
+                select(PriceTier)
+                .where(PriceTier.id.in_(stale_tier_ids))
+                .options(joinedload(PriceTier.parent))
+            ).scalars().all()
+
+        missing_group_ids = set()
+        for tier in self.tiers:
+            group_id: int | None = tier.parent.group_id
+            while group_id is not None:
+                group = self._get_loaded(ProductGroup, group_id)
+                if group is None:
+                    missing_group_ids.add(group_id)
+                    break
+                group_id = group.parent_id
+
+        if missing_group_ids:
+            # Fetch the missing groups and all their ancestors at once
+            tree = (
+                select(ProductGroup.id, ProductGroup.parent_id)
+                .where(ProductGroup.id.in_(missing_group_ids))
+                .cte("group_tree", recursive=True)
+            )
+            tree = tree.union(
+                select(ProductGroup.id, ProductGroup.parent_id).join(
+                    tree, ProductGroup.id == tree.c.parent_id
+                )
+            )
+            db.session.execute(
+                select(ProductGroup).where(ProductGroup.id.in_(select(tree.c.id)))
+            ).scalars().all()
+
+        sharded = {self._key(obj) for obj in self._all_objects() if obj.capacity_shard_count}
+        if sharded:
+            self._shards = {key: [] for key in sharded}
+            shards = db.session.execute(
+                select(CapacityShard)
+                .where(tuple_(CapacityShard.object_type, CapacityShard.object_id).in_(sharded))
+                .order_by(CapacityShard.shard)
+            ).scalars()
+            for shard in shards:
+                self._shards[(shard.object_type, shard.object_id)].append(shard)
+
+    def _all_objects(self) -> Iterable[CapacityObject]:
+        seen = set()
+        for tier in self.tiers:
+            obj: CapacityObject | None = tier
+            while obj is not None and self._key(obj) not in seen:
+                seen.add(self._key(obj))
+                yield obj
+                obj = obj.parent
+
+    def get_total_remaining_capacity(self, obj: CapacityObject) -> int | UnlimitedType:
+        """Equivalent to obj.get_total_remaining_capacity()"""
+        key = self._key(obj)
+        if key not in self._remaining:
+            remaining = obj.remaining_capacity()
+            if obj.parent:
+                remaining = min(remaining, self.get_total_remaining_capacity(obj.parent))
+
+            if key in self._shards:
+                shards = self._shards[key]
+            else:
+                shards = obj.get_capacity_shards()
+            self._remaining[key] = obj._add_shard_capacity(remaining, shards)
+
+        return self._remaining[key]
+
+    def has_expired(self, obj: CapacityObject) -> bool:
+        """Equivalent to obj.has_expired()"""
+        key = self._key(obj)
+        if key not in self._expired:
+            self._expired[key] = (
+                bool(obj.parent and self.has_expired(obj.parent)) or obj.has_own_expiry_passed()
+            )
+
+        return self._expired[key]
+
+
 class Price(BaseModel):
     """Represents the price of a product, at a given price tier, in a given currency.
 
@@ -765,3 +921,11 @@ def __init__(self, view, product, order=None):
 
     def __repr__(self):
         return f"<ProductViewProduct: view {self.view_id}, product {self.product_id}, order {self.order}>"
+
+
+# Capacity changes whenever something is sold, so doesn't affect how products are displayed
+PRODUCT_CACHE_GENERATION = CacheGeneration(
+    "product_cache_generation",
+    [ProductGroup, Product, PriceTier, Price, ProductView, ProductViewProduct],
+    ignored_attrs={"capacity_used", "capacity_shard_count", "modified"},
+)
@@ -109,3 +109,13 @@ def get_sales_state():
 def get_refund_state():
     states = get_states()
     return states["refund_state"]
+
+
+def get_queue_admission_rate() -> int:
+    """The number of visitors per second to let through the tickets queue, or 0 if it's disabled."""
+    states = get_states()
+    try:
+        return max(int(states.get("queue_admission_rate") or 0), 0)
+    except ValueError:
+        log.error("Invalid queue_admission_rate %r, disabling queue", states["queue_admission_rate"])
+        return 0
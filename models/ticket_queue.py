@@ -0,0 +1,112 @@
+"""
+Shared state for the virtual queue in front of the tickets page.
+
+Visitors are given a position from an ever-increasing counter, and positions up
+to the admission frontier are let through. The frontier moves forward by the
+admission rate every second, but never past the last position issued, so a quiet
+period doesn't let the next rush straight in.
+
+The state can either be kept in the cache (which should be Redis or similar if
+there's more than one web process), or in the DB.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+from sqlalchemy import Sequence, select, text
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from main import cache, db
+
+from . import BaseModel, naive_utcnow
+
+__all__ = [
+    "TicketQueue",
+]
+
+
+class TicketQueue(BaseModel):
+    __tablename__ = "ticket_queue"
+    __export_data__ = False
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    admitted: Mapped[int] = mapped_column(default=0)
+    updated: Mapped[datetime] = mapped_column(default=naive_utcnow)
+
+
+ticket_queue_position = Sequence("ticket_queue_position", metadata=db.metadata)
+
+
+def advance_frontier(
+    admitted: int, updated: datetime, issued: int, rate: int, now: datetime
+) -> tuple[int, datetime]:
+    """Move the admission frontier on by rate positions per second since it was last updated."""
+    steps = math.floor((now - updated).total_seconds() * rate)
+    if admitted + steps >= issued:
+        # Everyone in the queue has been let in, so start counting again from now
+        return max(admitted, issued), now
+
+    # Carry over any part of a step that's built up
+    return admitted + steps, updated + timedelta(seconds=steps / rate)
+
+
+class QueueBackend(ABC):
+    @abstractmethod
+    def issue_position(self) -> int:
+        """Atomically hand out the next position in the queue."""
+
+    @abstractmethod
+    def get_admitted(self, rate: int) -> int:
+        """Get the last position admitted, moving the frontier on if it's due."""
+
+
+class CacheQueueBackend(QueueBackend):
+    ISSUED_KEY = "ticket_queue/issued"
+    FRONTIER_KEY = "ticket_queue/frontier"
+    LOCK_KEY = "ticket_queue/lock"
+
+    def issue_position(self) -> int:
+        cache.add(self.ISSUED_KEY, 0, timeout=0)
+        return cache.inc(self.ISSUED_KEY)
+
+    def get_admitted(self, rate: int) -> int:
+        now = naive_utcnow()
+        admitted, updated = cache.get(self.FRONTIER_KEY) or (0, now)
+
+        # Only one process needs to move the frontier each second
+        if cache.add(self.LOCK_KEY, True, timeout=1):
+            issued = cache.get(self.ISSUED_KEY) or 0
+            admitted, updated = advance_frontier(admitted, updated, issued, rate, now)
+            cache.set(self.FRONTIER_KEY, (admitted, updated), timeout=0)
+
+        return admitted
+
+
+class DBQueueBackend(QueueBackend):
+    def issue_position(self) -> int:
+        # Sequences aren't transactional, so there's no need to commit
+        return db.session.execute(select(ticket_queue_position.next_value())).scalar_one()
+
+    def get_admitted(self, rate: int) -> int:
+        # This uses its own session, so it doesn't commit or roll back anything the
+        # request is doing. The single row is created by the migration. If it's locked,
+        # someone else is moving the frontier, so just use the current value.
+        with Session(db.engine) as session, session.begin():
+            queue = session.execute(
+                select(TicketQueue).where(TicketQueue.id == 1).with_for_update(skip_locked=True)
+            ).scalar_one_or_none()
+            if queue is None:
+                return session.execute(select(TicketQueue.admitted).where(TicketQueue.id == 1)).scalar_one()
+
+            issued = session.execute(text("SELECT last_value FROM ticket_queue_position")).scalar_one()
+            queue.admitted, queue.updated = advance_frontier(
+                queue.admitted, queue.updated, issued, rate, naive_utcnow()
+            )
+            return queue.admitted
+
+
+QUEUE_BACKENDS: dict[str, type[QueueBackend]] = {
+    "cache": CacheQueueBackend,
+    "db": DBQueueBackend,
+}
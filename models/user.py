@@ -14,7 +14,7 @@
 from flask import current_app as app
 from flask import session
 from flask_login import AnonymousUserMixin, UserMixin
-from sqlalchemy import Column, ForeignKey, Index, Integer, Table, func, select, text
+from sqlalchemy import Column, ForeignKey, Index, Integer, Table, func, select
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -550,12 +550,9 @@ def google_wallet_pass_url(self) -> str:
 
 
 Index("ix_user_email_lower", func.lower(User.email), unique=True)
-Index(
-    "ix_user_email_tsearch",
-    text("to_tsvector('simple', replace(email, '@', ' '))"),
-    postgresql_using="gin",
-)
-Index("ix_user_name_tsearch", text("to_tsvector('simple', name)"), postgresql_using="gin")
+# For substring searches (see apps/common/search.py). Needs the pg_trgm extension.
+Index("ix_user_email_trgm", User.email, postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"})
+Index("ix_user_name_trgm", User.name, postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"})
 
 
 class UserShipping(BaseModel):
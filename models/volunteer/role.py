@@ -10,6 +10,7 @@
 from main import db, get_or_404
 
 from .. import BaseModel
+from .shift import SHIFT_GRID_GENERATION
 from .volunteer import VolunteerRoleInterest, VolunteerRoleTraining
 
 if TYPE_CHECKING:
@@ -245,6 +246,9 @@ def get_export_data(cls):
         }
 
 
+SHIFT_GRID_GENERATION.watch(Role)
+
+
 class Team(BaseModel):
     """A team that can have a number of volunteer roles attached."""
 
@@ -1,20 +1,31 @@
 import enum
-from collections.abc import Sequence
+from collections.abc import Collection, Sequence
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+from itertools import chain
 from math import ceil, floor
-from typing import TYPE_CHECKING, Self, TypedDict
+from typing import TYPE_CHECKING, Any, Self, TypedDict
 
 import pytz
-from sqlalchemy import ForeignKey, delete, desc, func, select
+from sqlalchemy import ForeignKey, delete, desc, event, func, inspect, select, update
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import Mapped, column_property, mapped_column, relationship
+from sqlalchemy.orm import (
+    Mapped,
+    Session,
+    column_property,
+    contains_eager,
+    joinedload,
+    mapped_column,
+    relationship,
+)
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
 from apps.config import config
 from main import db
 from models.volunteer.venue import VolunteerVenue
 
-from .. import BaseModel
+from .. import BaseModel, CacheGeneration
 
 if TYPE_CHECKING:
     from ..content.schedule import Occurrence
@@ -63,6 +74,10 @@ class ShiftEntryState(enum.StrEnum):
 }
 
 
+#: Entries in these states don't count towards a shift's current_count
+UNCOUNTED_SHIFT_ENTRY_STATES = [ShiftEntryState.NO_SHOW, ShiftEntryState.ABANDONED]
+
+
 class ShiftEntryStateException(ValueError):
     """Raised when a shift entry is moved to an invalid state."""
 
@@ -282,7 +297,7 @@ class Shift(BaseModel):
     """An available shift for one or more volunteers to perform."""
 
     __tablename__ = "volunteer_shift"
-    __versioned__: dict[str, str] = {}
+    __versioned__: dict[str, Any] = {"exclude": ["current_count"]}
 
     id: Mapped[int] = mapped_column(primary_key=True)
     role_id: Mapped[int] = mapped_column(ForeignKey("volunteer_role.id", ondelete="CASCADE"))
@@ -319,16 +334,9 @@ class Shift(BaseModel):
     #: shift has slightly different requirements.
     notes: Mapped[str | None] = mapped_column(default=None)
 
-    current_count = column_property(
-        select(func.count(ShiftEntry.shift_id))
-        .where(
-            ShiftEntry.shift_id == id,
-            ShiftEntry.state != ShiftEntryState.NO_SHOW,
-            ShiftEntry.state != ShiftEntryState.ABANDONED,
-        )
-        .correlate_except(ShiftEntry)
-        .scalar_subquery()
-    )
+    #: Number of volunteers signed up, excluding no-shows and abandonments.
+    #: Maintained by shift_entry_count_change, see refresh_shift_counts.
+    current_count: Mapped[int] = mapped_column(default=0, index=True)
 
     duration = column_property(end - start)
 
@@ -433,6 +441,7 @@ def get_all_for_day(cls, day: date, *, include_unfinalised: bool = False) -> Seq
         query = (
             select(cls)
             .join(Shift.venue)
+            .options(contains_eager(Shift.venue), joinedload(Shift.role))
             .where(Shift.start >= start)
             .where(Shift.start <= end)
             .order_by(Shift.start, Shift.end, VolunteerVenue.name)
@@ -459,6 +468,64 @@ def earliest_and_latest_in_range(
         return (first, last)
 
 
+def counted_shift_entries(shift_id):
+    """A scalar subquery counting the entries which count towards a shift's current_count."""
+    return (
+        select(func.count(ShiftEntry.shift_id))
+        .where(ShiftEntry.shift_id == shift_id, ShiftEntry.state.not_in(UNCOUNTED_SHIFT_ENTRY_STATES))
+        .scalar_subquery()
+    )
+
+
+def refresh_shift_counts(session: Session, shift_ids: Collection[int] | None = None) -> dict[int, int]:
+    """Recalculate Shift.current_count for the given shifts, or all of them.
+
+    Returns the new count for each shift which was wrong.
+    """
+    shift = Shift.__table__
+    count = counted_shift_entries(shift.c.id)
+    query = (
+        update(shift)
+        .values(current_count=count)
+        .where(shift.c.current_count != count)
+        .returning(shift.c.id, shift.c.current_count)
+    )
+    if shift_ids is not None:
+        query = query.where(shift.c.id.in_(shift_ids))
+
+    changed = dict(session.connection().execute(query).tuples().all())
+
+    # Keep any loaded shifts up to date without reloading them
+    for shift_id, current_count in changed.items():
+        obj = session.identity_map.get(identity_key(Shift, shift_id))
+        if obj is not None:
+            set_committed_value(obj, "current_count", current_count)
+
+    return changed
+
+
+@event.listens_for(Session, "after_flush")
+def shift_entry_count_change(session, flush_context):
+    shift_ids = set()
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, ShiftEntry):
+            shift_ids.add(obj.shift_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, ShiftEntry):
+            attrs = inspect(obj).attrs
+            if attrs.state.history.has_changes() or attrs.shift_id.history.has_changes():
+                shift_ids.add(obj.shift_id)
+                shift_ids.update(attrs.shift_id.history.deleted)
+
+    if shift_ids:
+        refresh_shift_counts(session, shift_ids)
+
+
+# Roles are watched too, but importing them here would be circular, so role.py adds them
+SHIFT_GRID_GENERATION = CacheGeneration("shift_grid_generation", [Shift, ShiftEntry, VolunteerVenue])
+
+
 """
 class TrainingSession(Shift):
     pass
@@ -1,8 +1,11 @@
 from io import BytesIO
 
+import sqlalchemy
 from cairosvg import svg2png
 from PIL import Image
 
+from main import db
+
 
 def render_svg(svg):
     # pyzbar fails to decode qr codes under 52x52 and epc qr codes under 72x72
@@ -16,3 +19,23 @@ def render_svg(svg):
     opaque_image.paste(image, mask=alpha)
 
     return opaque_image
+
+
+class QueryLog:
+    def __init__(self):
+        self.count = 0
+        self.queries = []
+
+    def _query_callback(self, _conn, _cur, query, params, *_):
+        self.count += 1
+        self.queries.append(query)
+
+    def __enter__(self):
+        sqlalchemy.event.listen(db.engine, "before_cursor_execute", self._query_callback)
+        return self
+
+    def __exit__(self, *args):
+        sqlalchemy.event.remove(db.engine, "before_cursor_execute", self._query_callback)
+
+    def __repr__(self):
+        return "<SQLAlchemy Query Logger>"
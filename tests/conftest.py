@@ -78,8 +78,9 @@ def app_factory(cache):
 
         db_obj.drop_all()
 
-        # We're not using migrations here so we have to create the extension manually
+        # We're not using migrations here so we have to create the extensions manually
         db_obj.session.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        db_obj.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         db_obj.session.commit()
         db_obj.session.close()
 
@@ -1,13 +1,16 @@
 import pytest
 from hypothesis import given
-from hypothesis.strategies import data, integers, lists
+from hypothesis.strategies import data, dictionaries, integers, lists
 
 from apps.cfp_review.majority_judgement import (
     MajorityJudgementException,
     calculate_max_normalised_score,
+    calculate_max_normalised_scores,
     calculate_normalised_score,
     calculate_score,
+    calculate_scores,
     get_floor_median,
+    get_mj_order,
 )
 
 
@@ -109,3 +112,57 @@ def test_ordering():
     result = sorted(test, key=lambda x: calculate_max_normalised_score(x), reverse=True)
 
     assert expected == result
+
+
+def test_get_mj_order():
+    for length in range(1, 20):
+        score_list = list(range(length))
+        order = get_mj_order(length).tolist()
+        assert sorted(order) == score_list
+        assert int("".join(str(score_list[i]) for i in order), 20) == calculate_score(score_list, 20)
+
+
+def flatten(score_lists):
+    keys = [key for key, score_list in score_lists.items() for _ in score_list]
+    scores = [score for score_list in score_lists.values() for score in score_list]
+    return keys, scores
+
+
+@given(data())
+def test_calculate_scores(data):
+    base = data.draw(integers(min_value=2, max_value=36))
+    score_lists = data.draw(
+        dictionaries(
+            integers(min_value=1, max_value=2**31),
+            lists(integers(min_value=0, max_value=base - 1), min_size=1, max_size=60),
+        )
+    )
+
+    keys, scores = flatten(score_lists)
+    assert calculate_scores(keys, scores, base) == {
+        key: calculate_score(score_list, base) for key, score_list in score_lists.items()
+    }
+    assert calculate_max_normalised_scores(keys, scores, base) == {
+        key: calculate_max_normalised_score(score_list, base) for key, score_list in score_lists.items()
+    }
+
+
+@given(lists(integers(min_value=0, max_value=2), min_size=1, max_size=30))
+def test_calculate_scores_vote_order(score_list):
+    # Votes for different proposals come back from the database interleaved
+    keys = [i % 3 for i in range(len(score_list))]
+    expected = {
+        key: calculate_max_normalised_score([s for k, s in zip(keys, score_list, strict=True) if k == key])
+        for key in set(keys)
+    }
+    assert calculate_max_normalised_scores(keys, score_list) == expected
+
+
+def test_calculate_scores_invalid():
+    assert calculate_scores([], []) == {}
+
+    with pytest.raises(MajorityJudgementException):
+        calculate_scores([1, 1], [2, 3])
+
+    with pytest.raises(MajorityJudgementException):
+        calculate_max_normalised_scores([1], [-1])
@@ -1,3 +1,5 @@
+import time
+
 import lxml.html
 from locust import HttpUser, between, task
 from locust.exception import StopUser
@@ -7,6 +9,25 @@
 
     run locust -f tests/locust/tickets.py --headless -u 1000 -r 100 --host https://www.emfcamp-test.org
 
+To compare capacity sharding against the default path, run ReserveTicketsUser once as-is,
+then shard the contended tier and run it again:
+
+    flask tickets shard_capacity general --product full --tier full-std -n 16
+
+    run locust -f tests/locust/tickets.py --headless -u 1000 -r 100 --host https://www.emfcamp-test.org ReserveTicketsUser
+
+Use `flask tickets unshard_capacity` with the same arguments to return unused leases afterwards.
+
+CheckTicketsUser is mostly anonymous refreshes of /tickets, which are served from a
+pre-rendered page when the TICKETS_PAGE_CACHE feature flag is enabled. Run it with the
+flag on and off to compare.
+
+QueuedReserveTicketsUser waits in the tickets queue before reserving. Set the queue
+admission rate on the admin site states page, then compare the p99 of the
+"/tickets [reserve]" requests against an unqueued ReserveTicketsUser run. The
+reservation latency should stay flat as -u goes up, with the extra load showing up
+as time spent in the queue instead.
+
 """
 
 
@@ -82,3 +103,41 @@ def reserve_tickets(self, tickets):
         self.client.post("/tickets", data)
 
         raise StopUser()
+
+
+class QueuedReserveTicketsUser(ReserveTicketsUser):
+    def reserve_tickets(self, tickets):
+        self.client.cookies.clear()
+
+        self.client.get("/")
+
+        # Keep our cookies while we wait, as they hold our place in the queue
+        queued_since = time.monotonic()
+        while True:
+            resp = self.client.get("/tickets", name="/tickets [queue]")
+            html = lxml.html.fromstring(resp.content)
+            if not html.xpath('//*[@id="tickets-queue"]'):
+                break
+
+            refresh = html.xpath('//meta[@http-equiv="refresh"]/@content')
+            time.sleep(int(refresh[0]) if refresh else 5)
+
+        self.environment.events.request.fire(
+            request_type="QUEUE",
+            name="time in queue",
+            response_time=(time.monotonic() - queued_since) * 1000,
+            response_length=0,
+            exception=None,
+            context={},
+        )
+
+        form = html.get_element_by_id("choose_tickets")
+        amounts = {i.label.text_content(): i.name for i in form.inputs if i.name.endswith("-amount")}
+
+        data = dict(**form.fields)
+        for display_name, count in tickets.items():
+            data[amounts[display_name]] = count
+
+        self.client.post("/tickets", data, name="/tickets [reserve]")
+
+        raise StopUser()
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+import pytest
+from freezegun import freeze_time
+from itsdangerous import BadSignature
+from sqlalchemy import delete
+
+from apps.arrivals_sync import (
+    REDEMPTION_MAX_AGE,
+    apply_redemptions,
+    dump_snapshot,
+    get_serializer,
+    get_snapshot_cursor,
+    import_snapshot,
+    load_snapshot,
+)
+from main import db
+from models import naive_utcnow
+from models.arrivals import ArrivalsSnapshotCursor, ArrivalsView, ArrivalsViewProduct
+from models.basket import Basket
+from models.permission import Permission
+from models.product import PriceTier
+from models.user import User
+
+
+@pytest.fixture(scope="module")
+def paid_purchase(app):
+    user = User("arrivals-sync@example.com", "Arrivals Sync")
+    db.session.add(user)
+
+    tier = PriceTier.query.filter_by(name="full-std").one()
+    view = ArrivalsView(name="sync-test", required_permission=Permission("arrivals:sync-test"))
+    db.session.add(ArrivalsViewProduct(view, tier.parent))
+
+    basket = Basket(user, "GBP")
+    basket[tier] = 1
+    basket.create_purchases()
+    basket.ensure_purchase_capacity()
+    (purchase,) = basket.purchases
+    purchase.set_state("paid")
+    db.session.commit()
+    return purchase
+
+
+def test_snapshot_roundtrip(app, paid_purchase):
+    data = load_snapshot(dump_snapshot())
+
+    purchases = data["tables"]["purchase"]
+    id_column = purchases["columns"].index("id")
+    assert paid_purchase.id in [row[id_column] for row in purchases["rows"]]
+
+    codes = dict(data["tables"]["checkin_code"]["rows"])
+    assert codes[paid_purchase.owner_id] == paid_purchase.owner.checkin_code
+
+    views = data["tables"]["arrivals_view"]
+    assert "sync-test" in [row[views["columns"].index("name")] for row in views["rows"]]
+
+    with pytest.raises(BadSignature):
+        load_snapshot(dump_snapshot() + "x")
+
+
+def test_apply_redemptions(app, paid_purchase):
+    def event(event_id, redeemed, timestamp):
+        return {
+            "event_id": event_id,
+            "purchase_id": paid_purchase.id,
+            "redeemed": redeemed,
+            "timestamp": datetime(2026, 7, 16, 12, timestamp).isoformat(),
+        }
+
+    results = apply_redemptions("gate-1", [event("sync-a", True, 5)])
+    assert results == [{"event_id": "sync-a", "result": "applied", "redeemed": True}]
+    assert paid_purchase.redeemed
+
+    # Retrying a push gives the same result
+    results = apply_redemptions("gate-1", [event("sync-a", True, 5)])
+    assert results[0]["result"] == "applied"
+
+    # An undo made earlier on another node loses to the later redemption
+    results = apply_redemptions("gate-2", [event("sync-b", False, 1), event("sync-c", True, 10)])
+    assert [r["result"] for r in results] == ["stale", "unchanged"]
+    assert paid_purchase.redeemed
+
+    results = apply_redemptions("gate-2", [event("sync-d", False, 20)])
+    assert results[0]["result"] == "applied"
+    assert not paid_purchase.redeemed
+    db.session.commit()
+
+
+def test_snapshot_cursor(app, paid_purchase, monkeypatch):
+    monkeypatch.setitem(app.config, "ARRIVALS_UPSTREAM", "https://upstream.example.com")
+    assert get_snapshot_cursor() is None
+
+    data = load_snapshot(dump_snapshot())
+    import_snapshot(data)
+    db.session.commit()
+    assert get_snapshot_cursor() == datetime.fromisoformat(data["cursor"])
+
+    # Each upstream has its own cursor
+    monkeypatch.setitem(app.config, "ARRIVALS_UPSTREAM", "https://other.example.com")
+    assert get_snapshot_cursor() is None
+
+    db.session.execute(delete(ArrivalsSnapshotCursor))
+    db.session.commit()
+
+
+def test_sync_redemptions_auth(app, client, paid_purchase):
+    payload = {
+        "node": "gate-3",
+        "events": [
+            {
+                "event_id": "sync-auth",
+                "purchase_id": paid_purchase.id,
+                "redeemed": paid_purchase.redeemed,
+                "timestamp": naive_utcnow().isoformat(),
+            }
+        ],
+    }
+    with app.app_context():
+        signed = get_serializer("arrivals-redemptions").dumps(payload)
+    headers = {"Authorization": f"Bearer {app.config['ARRIVALS_SYNC_TOKEN']}"}
+
+    assert client.post("/arrivals/sync/redemptions", data=signed).status_code == 401
+    response = client.post(
+        "/arrivals/sync/redemptions", data=signed, headers={"Authorization": "Bearer wrong"}
+    )
+    assert response.status_code == 401
+
+    # A signed push can't be replayed later
+    with freeze_time(naive_utcnow() + REDEMPTION_MAX_AGE + timedelta(seconds=1)):
+        response = client.post("/arrivals/sync/redemptions", data=signed, headers=headers)
+    assert response.status_code == 401
+
+    response = client.post("/arrivals/sync/redemptions", data=signed, headers=headers)
+    assert response.status_code == 200
+    assert response.json["results"][0]["result"] == "unchanged"
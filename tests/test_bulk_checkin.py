@@ -0,0 +1,95 @@
+from sqlalchemy import select
+from sqlalchemy_continuum import version_class
+from sqlalchemy_continuum.operation import Operation
+
+from apps.common.receipt import get_receipt_pdf_key
+from main import db
+from models.arrivals import ArrivalsView, ArrivalsViewProduct
+from models.basket import Basket
+from models.product import PriceTier
+from models.purchase import Purchase
+from models.user import User
+
+
+def make_attendee(email, name, tier):
+    user = User(email, name)
+    db.session.add(user)
+    basket = Basket(user, "GBP")
+    basket[tier] = 2
+    basket.create_purchases()
+    basket.ensure_purchase_capacity()
+    for purchase in basket.purchases:
+        purchase.set_state("paid")
+    return user
+
+
+def test_bulk_checkin(app):
+    staff = User("bulk-checkin-staff@example.com", "Bulk Checkin Staff")
+    staff.grant_permission("arrivals:bulk-checkin")
+    db.session.add(staff)
+
+    tier = PriceTier.query.filter_by(name="full-std").one()
+    view = ArrivalsView(name="bulk-checkin", required_permission=staff.permissions[0])
+    db.session.add(ArrivalsViewProduct(view, tier.parent))
+
+    first = make_attendee("bulk-checkin-1@example.com", "Bulk Checkin 1", tier)
+    second = make_attendee("bulk-checkin-2@example.com", "Bulk Checkin 2", tier)
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(staff.id)
+        sess["_fresh"] = True
+
+    items = [first.id, second.checkin_code, "nobody"]
+    rv = client.post("/arrivals/checkin", json={"items": items})
+    assert rv.status_code == 200
+    results = rv.json["results"]
+    assert [r["status"] for r in results] == ["checked-in", "checked-in", "unknown"]
+    assert results[1]["user_id"] == second.id
+    assert len(results[0]["redeemed"]) == 2
+
+    assert all(p.redeemed for p in first.owned_purchases)
+    # Continuum records the bulk redemption
+    assert all(list(p.versions)[-1].redeemed for p in second.owned_purchases)
+
+    rv = client.post("/arrivals/checkin", json={"items": [first.id]})
+    (result,) = rv.json["results"]
+    assert result["status"] == "already-checked-in"
+    assert len(result["already_redeemed"]) == 2
+
+    rv = client.post("/arrivals/checkin", json={"items": "not a list"})
+    assert rv.status_code == 400
+
+
+def test_redeem_bulk(app_with_cache):
+    tier = PriceTier.query.filter_by(name="full-std").one()
+    owner = make_attendee("redeem-bulk@example.com", "Redeem Bulk", tier)
+    db.session.commit()
+    purchase_ids = sorted(p.id for p in owner.owned_purchases)
+
+    key = get_receipt_pdf_key(owner, "https://example.invalid/receipt")
+    assert get_receipt_pdf_key(owner, "https://example.invalid/receipt") == key
+
+    redeemed = Purchase.redeem_bulk(purchase_ids)
+    db.session.commit()
+    assert sorted(p.id for p in redeemed) == purchase_ids
+    # Receipts cached from before check-in aren't served
+    assert get_receipt_pdf_key(owner, "https://example.invalid/receipt") != key
+
+    PurchaseVersion = version_class(Purchase)
+    latest = {
+        v.id: v
+        for v in db.session.scalars(
+            select(PurchaseVersion)
+            .where(PurchaseVersion.id.in_(purchase_ids))
+            .order_by(PurchaseVersion.transaction_id)
+        )
+    }
+    assert sorted(latest) == purchase_ids
+    for version in latest.values():
+        assert version.redeemed
+        assert version.operation_type == Operation.UPDATE
+
+    # Already redeemed purchases are left alone
+    assert Purchase.redeem_bulk(purchase_ids) == []
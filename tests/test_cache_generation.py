@@ -0,0 +1,27 @@
+from main import db
+from models.basket import Basket
+from models.product import PRODUCT_CACHE_GENERATION, PriceTier
+from models.user import User
+
+
+def test_product_generation_changes(app_with_cache):
+    tier = PriceTier.query.filter_by(name="full-std").one()
+    generation = PRODUCT_CACHE_GENERATION.get()
+    assert PRODUCT_CACHE_GENERATION.get() == generation
+
+    # Selling things doesn't change how products are displayed
+    user = User("product-generation@example.com", "Product Generation")
+    basket = Basket(user, "GBP")
+    basket[tier] = 1
+    basket.create_purchases()
+    basket.ensure_purchase_capacity()
+    db.session.commit()
+    assert PRODUCT_CACHE_GENERATION.get() == generation
+
+    tier.personal_limit += 1
+    db.session.commit()
+    assert PRODUCT_CACHE_GENERATION.get() != generation
+
+    # Each set of key parts has its own token
+    assert PRODUCT_CACHE_GENERATION.get("a") == PRODUCT_CACHE_GENERATION.get("a")
+    assert PRODUCT_CACHE_GENERATION.get("a") != PRODUCT_CACHE_GENERATION.get("b")
@@ -0,0 +1,53 @@
+from sqlalchemy import select
+
+from apps.arrivals import user_id_from_checkin_code
+from main import db
+from models.arrivals import ArrivalsView, ArrivalsViewProduct, CheckinSummary
+from models.basket import Basket
+from models.permission import Permission
+from models.product import PriceTier
+from models.user import User
+
+
+def get_summary(user, view):
+    return db.session.execute(
+        select(CheckinSummary.purchases, CheckinSummary.redeemed).where(
+            CheckinSummary.user_id == user.id, CheckinSummary.view_id == view.id
+        )
+    ).one_or_none()
+
+
+def test_checkin_index(app):
+    owner = User("checkin-index-owner@example.com", "Checkin Index Owner")
+    other = User("checkin-index-other@example.com", "Checkin Index Other")
+    db.session.add_all([owner, other])
+
+    tier = PriceTier.query.filter_by(name="full-std").one()
+    view = ArrivalsView(name="checkin-index", required_permission=Permission("arrivals:checkin-index"))
+    db.session.add(ArrivalsViewProduct(view, tier.parent))
+    db.session.commit()
+
+    with app.test_request_context():
+        assert user_id_from_checkin_code(owner.checkin_code) == owner.id
+        assert user_id_from_checkin_code(other.checkin_code) == other.id
+
+    basket = Basket(owner, "GBP")
+    basket[tier] = 1
+    basket.create_purchases()
+    basket.ensure_purchase_capacity()
+    db.session.commit()
+    (purchase,) = basket.purchases
+    assert get_summary(owner, view) is None
+
+    purchase.set_state("paid")
+    db.session.commit()
+    assert get_summary(owner, view) == (1, 0)
+
+    purchase.transfer(owner, other)
+    db.session.commit()
+    assert get_summary(owner, view) is None
+    assert get_summary(other, view) == (1, 0)
+
+    purchase.redeem()
+    db.session.commit()
+    assert get_summary(other, view) == (1, 1)
@@ -1,5 +1,6 @@
 import xml.etree.ElementTree as etree
-from datetime import datetime
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 
 import pytest
 from xmlschema import XMLSchema
@@ -95,6 +96,86 @@ def test_simple_event(frab_schema, request_context):
     assert frab_schema.is_valid(root)
 
 
+def _venue(id, name, priority):
+    return SimpleNamespace(
+        id=id,
+        name=name,
+        priority=priority,
+        allows_attendee_content=False,
+        village_id=None,
+        latlon=None,
+        map_link=None,
+        captions_url=None,
+    )
+
+
+def _occurrence(id, title, venue, start, **extra):
+    schedule_item = SimpleNamespace(
+        id=id,
+        type="talk",
+        names="Someone & someone else",
+        pronouns="they/them",
+        title=title,
+        description="The <foo> bar",
+        short_description="The foo bar",
+        video_privacy="public",
+        official_content=True,
+        slug="the-foo-bar",
+        attributes=None,
+    )
+    return SimpleNamespace(
+        schedule_item=schedule_item,
+        scheduled=True,
+        scheduled_venue=venue,
+        occurrence_num=1,
+        scheduled_time=start,
+        scheduled_end_time=start + timedelta(minutes=30),
+        uses_lottery=False,
+        video_privacy="public",
+        video_recording_lost=False,
+        c3voc_url=extra.get("c3voc_url"),
+        youtube_url=None,
+        thumbnail_url=None,
+    )
+
+
+def test_stream_matches_run(frab_schema, request_context):
+    stage = _venue(1, "Stage A", 1)
+    hinterlands = _venue(2, 'The "hinterlands"', 0)
+    # In day, room and time order, as _iter_frab_occurrences returns them
+    occurrences = [
+        _occurrence(
+            1, "The foo bar", stage, datetime(2016, 8, 5, 10, 30), c3voc_url="http://example.com/ccc"
+        ),
+        _occurrence(2, "Café “quoted”", stage, datetime(2016, 8, 5, 11, 30)),
+        # Before the day changeover, so still on the first day
+        _occurrence(3, "Late", hinterlands, datetime(2016, 8, 6, 1, 0)),
+        _occurrence(4, "Next day", stage, datetime(2016, 8, 6, 10, 0)),
+    ]
+    exporter = FrabXmlExporter(FrabExporterFilter(), occurrences)
+
+    streamed = b"".join(exporter.stream())
+    assert streamed == exporter.run()
+    assert frab_schema.is_valid(etree.fromstring(streamed))
+
+    days = etree.fromstring(streamed).findall("day")
+    assert [day.get("index") for day in days] == ["1", "2"]
+    assert [room.get("name") for room in days[0]] == ["Stage A", 'The "hinterlands"']
+    assert [event.findtext("title") for event in days[0].iter("event")] == [
+        "The foo bar",
+        "Café “quoted”",
+        "Late",
+    ]
+
+    # Days and rooms can't be reopened once they've been written
+    for unordered in [
+        [occurrences[0], occurrences[3], occurrences[1]],
+        [occurrences[0], occurrences[2], occurrences[1]],
+    ]:
+        with pytest.raises(ValueError):
+            b"".join(FrabXmlExporter(FrabExporterFilter(), unordered).stream())
+
+
 # TODO rework this. FrabExporter now wants a QuerySet instead of a dict
 # def test_export_frab(frab_schema, request_context):
 #    flat_sids: list[ScheduleItemDict] = [
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from apps.common import pdf_renderer
+from apps.common.pdf_renderer import PDFRenderer
+
+
+class FakePage:
+    def __init__(self, browser):
+        self.browser = browser
+        self.html = None
+        self.closed = False
+
+    async def route(self, url, handler):
+        self.html = f"{url}: rendered"
+
+    async def goto(self, url):
+        pass
+
+    async def pdf(self, format):
+        if self.browser.hang is not None:
+            await self.browser.hang.wait()
+        return self.html.encode()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = []
+
+    async def new_page(self):
+        page = FakePage(self.browser)
+        self.pages.append(page)
+        return page
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+        self.hang = None
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.connected = False
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.browsers = []
+        self.chromium = self
+        self.stopped = False
+
+    async def launch(self, **kwargs):
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def playwright(monkeypatch):
+    playwright = FakePlaywright()
+    monkeypatch.setattr(pdf_renderer, "async_playwright", lambda: playwright)
+    return playwright
+
+
+@pytest.fixture
+def renderer():
+    renderer = PDFRenderer(concurrency=2)
+    yield renderer
+    renderer.close()
+
+
+def test_render(playwright, renderer):
+    assert renderer.render("https://example.invalid/a", "<p>a</p>") == b"https://example.invalid/a: rendered"
+    futures = [renderer.submit(f"https://example.invalid/{i}", "<p></p>") for i in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [
+        f"https://example.invalid/{i}: rendered".encode() for i in range(5)
+    ]
+
+    # One browser, with a context for each concurrent render, is reused throughout
+    (browser,) = playwright.browsers
+    assert len(browser.contexts) == 2
+    pages = [page for context in browser.contexts for page in context.pages]
+    assert len(pages) == 6
+    assert all(page.closed for page in pages)
+
+
+def test_relaunch_after_crash(playwright, renderer):
+    renderer.render("https://example.invalid/a", "<p>a</p>")
+    (crashed,) = playwright.browsers
+    crashed.connected = False
+
+    assert renderer.render("https://example.invalid/b", "<p>b</p>") == b"https://example.invalid/b: rendered"
+    assert len(playwright.browsers) == 2
+    relaunched = playwright.browsers[1]
+    assert len(relaunched.contexts) == 2
+
+
+def test_timeout(playwright, renderer, monkeypatch):
+    monkeypatch.setattr(pdf_renderer, "RENDER_TIMEOUT", 0.1)
+    renderer.render("https://example.invalid/a", "<p>a</p>")
+    (browser,) = playwright.browsers
+    browser.hang = asyncio.Event()
+
+    for _ in range(3):
+        with pytest.raises(TimeoutError):
+            renderer.render("https://example.invalid/slow", "<p>slow</p>")
+
+    # Cancelled renders close their page and give their context back
+    browser.hang = None
+    assert renderer.render("https://example.invalid/b", "<p>b</p>") == b"https://example.invalid/b: rendered"
+    pages = [page for context in browser.contexts for page in context.pages]
+    assert all(page.closed for page in pages)
@@ -4,20 +4,27 @@
 from decimal import Decimal
 
 import pytest
+from sqlalchemy import select
+from sqlalchemy_continuum import version_class
+from sqlalchemy_continuum.operation import Operation
 
 from main import db
 from models.basket import Basket
 from models.exc import CapacityException
 from models.payment import BankPayment
-from models.product import Price, PriceTier, Product, ProductGroup
+from models.product import CapacitySnapshot, Price, PriceTier, Product, ProductGroup
 from models.purchase import (
     PURCHASE_STATES,
+    AdmissionTicket,
     CheckinStateException,
+    Purchase,
     PurchaseStateException,
     PurchaseTransferException,
 )
 from models.user import User
 
+from ._utils import QueryLog
+
 
 @pytest.fixture()
 def tent(db):
@@ -162,6 +169,35 @@ def test_capacity_propagation(db, parent_group, user):
     assert price1 == product1.get_cheapest_price("GBP")
 
 
+def test_capacity_snapshot(db, parent_group):
+    child = ProductGroup(name=f"child{random_string(8)}", parent=parent_group, capacity_max=6)
+    grandchild = ProductGroup(name=f"grandchild{random_string(8)}", parent=child, capacity_max=4)
+    product = Product(name="product", parent=grandchild, capacity_max=5)
+    tier = PriceTier(name="tier", parent=product)
+    expired_tier = PriceTier(name="expired", parent=product, expires=datetime(2012, 8, 31))
+    db.session.add_all([tier, expired_tier])
+    db.session.commit()
+
+    # Committing expires everything, so the whole chain has to be reloaded
+    with QueryLog() as log:
+        capacity = CapacitySnapshot([tier, expired_tier])
+        assert capacity.get_total_remaining_capacity(tier) == 4
+        assert capacity.get_total_remaining_capacity(parent_group) == 10
+        assert not capacity.has_expired(tier)
+        assert capacity.has_expired(expired_tier)
+        assert tier.user_limit(capacity=capacity) == 4
+        assert expired_tier.user_limit(capacity=capacity) == 0
+    assert log.count == 2
+
+    # Nothing needs reloading now
+    with QueryLog() as log:
+        CapacitySnapshot([tier, expired_tier])
+    assert log.count == 0
+
+    assert tier.get_total_remaining_capacity() == 4
+    assert expired_tier.has_expired()
+
+
 def test_create_purchases(db, parent_group, user):
     product = Product(name="product", capacity_max=3, parent=parent_group)
     tier = PriceTier(name="tier", parent=product)
@@ -190,6 +226,46 @@ def test_create_purchases(db, parent_group, user):
         create_purchases(tier, 1, user)
 
 
+def test_create_purchases_versions(db, parent_group, user):
+    product = Product(name="product-versions", capacity_max=10, parent=parent_group)
+    tier = PriceTier(name="tier", parent=product)
+    db.session.add(Price(price_tier=tier, currency="GBP", price_int=1000))
+    db.session.commit()
+
+    basket = Basket(user, "GBP", basket_uuid="test-basket")
+    basket[tier] = 3
+    basket.create_purchases()
+    basket.ensure_purchase_capacity()
+
+    purchases = basket.purchases
+    assert len(purchases) == 3
+    assert product.capacity_used == 3
+    for purchase in purchases:
+        # parent_group is an admissions group
+        assert isinstance(purchase, AdmissionTicket)
+        assert purchase in db.session
+        assert purchase.id is not None
+        assert purchase.state == "reserved"
+        assert purchase.basket_uuid == "test-basket"
+        assert purchase.owner == user
+        assert purchase.is_ticket
+    db.session.commit()
+
+    for purchase in purchases:
+        assert len(purchase.versions.all()) == 1
+    assert set(purchases) <= set(user.purchases)
+
+    PurchaseVersion = version_class(Purchase)
+    versions = db.session.scalars(
+        select(PurchaseVersion).where(PurchaseVersion.id.in_([p.id for p in purchases]))
+    ).all()
+    assert sorted(v.id for v in versions) == sorted(p.id for p in purchases)
+    for version in versions:
+        assert version.operation_type == Operation.INSERT
+        assert version.basket_uuid == "test-basket"
+        assert version.owner_id == user.id
+
+
 def test_purchase_state_machine():
     states_dict = PURCHASE_STATES
 
@@ -362,3 +438,79 @@ def test_transfer(db, user, parent_group):
 
     assert xfer.to_user.id == user2.id
     assert xfer.from_user.id == user1.id
+
+
+def test_sharded_capacity(db, parent_group, user):
+    product = Product(name="product", capacity_max=8, parent=parent_group)
+    tier = PriceTier(name="tier", parent=product)
+    Price(price_tier=tier, currency="GBP", price_int=666)
+    db.session.add(tier)
+    db.session.commit()
+
+    create_purchases(tier, 1, user)
+
+    tier.shard_capacity(4)
+    db.session.commit()
+    assert tier.capacity_shard_count == 4
+    assert len(tier.get_capacity_shards()) == 4
+    assert tier.get_total_remaining_capacity() == 7
+
+    purchases = create_purchases(tier, 2, user)
+    db.session.commit()
+
+    # Capacity was leased from the tier, which cascades up to the parents
+    assert sum(shard.capacity_used for shard in tier.get_capacity_shards()) == 2
+    assert sum(shard.capacity_max for shard in tier.get_capacity_shards()) == product.capacity_used - 1
+    assert tier.get_total_remaining_capacity() == 5
+    assert parent_group.get_total_remaining_capacity() == 10 - product.capacity_used
+
+    # Exhausting the capacity forces shards to rebalance between themselves
+    for _ in range(5):
+        create_purchases(tier, 1, user)
+    db.session.commit()
+    assert tier.get_total_remaining_capacity() == 0
+
+    with pytest.raises(CapacityException):
+        create_purchases(tier, 1, user)
+    db.session.rollback()
+
+    purchases[0].cancel()
+    db.session.commit()
+    assert tier.get_total_remaining_capacity() == 1
+
+    tier.unshard_capacity()
+    db.session.commit()
+    assert tier.capacity_shard_count == 0
+    assert tier.get_capacity_shards() == []
+    assert tier.capacity_used == 7
+    assert product.capacity_used == 7
+    assert tier.get_total_remaining_capacity() == 1
+
+
+def test_shard_unlimited_capacity(db, user):
+    group = ProductGroup(type="admissions", name=f"unlimited{random_string(8)}")
+    product = Product(name="product", parent=group)
+    tier = PriceTier(name="tier", parent=product)
+    db.session.add(tier)
+    db.session.commit()
+
+    with pytest.raises(ValueError):
+        tier.shard_capacity(4)
+
+
+def test_sharded_capacity_without_shards(db, parent_group, user):
+    product = Product(name="product", capacity_max=4, parent=parent_group)
+    tier = PriceTier(name="tier", parent=product)
+    Price(price_tier=tier, currency="GBP", price_int=666)
+    db.session.add(tier)
+    db.session.commit()
+
+    # Left sharded after the shard rows were removed
+    tier.capacity_shard_count = 2
+    db.session.commit()
+
+    create_purchases(tier, 1, user)
+    db.session.commit()
+    assert tier.capacity_used == 1
+    assert product.capacity_used == 1
+    assert tier.get_total_remaining_capacity() == 3
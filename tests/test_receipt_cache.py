@@ -0,0 +1,47 @@
+from apps.common.receipt import make_qrfile
+from main import db
+from models.basket import Basket
+from models.product import PriceTier
+from models.purchase import RECEIPT_CACHE_GENERATION
+from models.user import User
+
+
+def test_receipt_generation_changes(app_with_cache):
+    owner = User("receipt-owner@example.com", "Receipt Owner")
+    other = User("receipt-other@example.com", "Receipt Other")
+    db.session.add_all([owner, other])
+    db.session.commit()
+
+    basket = Basket(owner, "GBP")
+    basket[PriceTier.query.filter_by(name="full-std").one()] = 1
+    basket.create_purchases()
+    basket.ensure_purchase_capacity()
+    db.session.commit()
+    (purchase,) = basket.purchases
+
+    owner_generation = RECEIPT_CACHE_GENERATION.get(owner.id)
+    assert RECEIPT_CACHE_GENERATION.get(owner.id) == owner_generation
+
+    purchase.set_state("paid")
+    db.session.commit()
+    assert RECEIPT_CACHE_GENERATION.get(owner.id) != owner_generation
+
+    owner_generation = RECEIPT_CACHE_GENERATION.get(owner.id)
+    other_generation = RECEIPT_CACHE_GENERATION.get(other.id)
+    purchase.transfer(owner, other)
+    db.session.commit()
+    assert RECEIPT_CACHE_GENERATION.get(owner.id) != owner_generation
+    assert RECEIPT_CACHE_GENERATION.get(other.id) != other_generation
+
+    # Unrelated changes don't invalidate the receipt
+    other_generation = RECEIPT_CACHE_GENERATION.get(other.id)
+    purchase.ticket_issued = True
+    db.session.commit()
+    assert RECEIPT_CACHE_GENERATION.get(other.id) == other_generation
+
+
+def test_make_qrfile_is_reusable():
+    first = make_qrfile("https://example.invalid/checkin", kind="png", scale=3)
+    assert first.read()
+    second = make_qrfile("https://example.invalid/checkin", kind="png", scale=3)
+    assert second.read() == first.getvalue()
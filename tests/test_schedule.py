@@ -1,8 +1,14 @@
 from datetime import datetime
+from types import SimpleNamespace
 
 import pytest
 
+from apps.config import config
+from apps.schedule.data import ScheduleContext, ScheduleFilter
 from apps.schedule.frab_exporter import FrabExporter, FrabExporterFilter
+from main import external_url
+
+from ._utils import QueryLog
 
 
 @pytest.mark.parametrize(
@@ -22,3 +28,41 @@ def test_get_duration(start_time, end_time, expected):
     start_time = datetime.strptime(start_time, fmt)
     end_time = datetime.strptime(end_time, fmt)
     assert exporter.format_duration(start_time, end_time) == expected
+
+
+@pytest.mark.parametrize("slug", ["the-foo-bar", None])
+def test_schedule_context_item_link(request_context, slug):
+    ctx = ScheduleContext.from_filter(ScheduleFilter())
+    schedule_item = SimpleNamespace(id=123, slug=slug)
+    expected = external_url("schedule.item", year=config.event_year, schedule_item_id=123, slug=slug)
+    assert ctx.item_link(schedule_item) == expected
+
+
+def test_schedule_feed_not_modified(app_with_cache):
+    app_with_cache.config["SCHEDULE"] = True
+    try:
+        client = app_with_cache.test_client()
+        url = f"/schedule/{config.event_year}.frab.xml"
+        rv = client.get(url)
+        assert rv.status_code == 200
+        assert "ETag" not in rv.headers, "The first response is streamed"
+
+        rv = client.get(url)
+        assert rv.status_code == 200
+        etag = rv.headers["ETag"]
+
+        with QueryLog() as log:
+            rv = client.get(url, headers={"If-None-Match": etag})
+            assert rv.status_code == 304
+            assert log.count == 0, "Unchanged feeds are served from the cache"
+
+            # Parameters the feed doesn't read share the cache entry
+            rv = client.get(f"{url}?utm_source=test", headers={"If-None-Match": etag})
+            assert rv.status_code == 304
+            assert log.count == 0
+
+        rv = client.get(f"{url}?official_venues_only=1")
+        assert rv.status_code == 200
+        assert "ETag" not in rv.headers, "Differently filtered feeds are cached separately"
+    finally:
+        app_with_cache.config["SCHEDULE"] = False
@@ -0,0 +1,223 @@
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import combinations
+
+import pytest
+from scipy.stats import false_discovery_control, hypergeom
+from slotmachine import Conflict, Talk, VenueTimes
+
+from apps.cfp.scheduler import Scheduler, compute_clashes, restrict_to_changes
+from models.content.schedule import Occurrence, ScheduleItem, ScheduleItemAvailability
+from models.content.venue import TimeBlock, Venue, VenueTimeIndex
+
+from ._utils import QueryLog
+
+DAYS = [datetime(2026, 7, 17), datetime(2026, 7, 18), datetime(2026, 7, 19)]
+
+
+@pytest.fixture(scope="module")
+def venues(db):
+    """Roughly EMF's official venues: a few stages for each type, open all day."""
+    venues = []
+    for type, count in [("talk", 3), ("workshop", 6), ("performance", 1)]:
+        for i in range(count):
+            venue = Venue(name=f"Scheduler {type} {i}", official_venue=True, capacity=100 * (i + 1))
+            for day in DAYS:
+                venue.time_blocks.append(
+                    TimeBlock(
+                        type=type,
+                        start=day + timedelta(hours=10),
+                        end=day + timedelta(hours=20),
+                        automatic=True,
+                        # The last venue of each type is only used on request
+                        default=i < count - 1,
+                    )
+                )
+            venues.append(venue)
+    db.session.add_all(venues)
+    db.session.commit()
+    return venues
+
+
+def add_occurrences(db, user, venues, count):
+    types = ["talk", "workshop", "performance"]
+    occurrences = []
+    for i in range(count):
+        si = ScheduleItem(user=user, type=types[i % 3], title=f"Scheduler item {i}", official_content=True)
+        occurrence = Occurrence(occurrence_num=1, schedule_item=si, scheduled_duration=30 * (i % 4 + 1))
+        if i % 5 == 0:
+            si.availability = [
+                ScheduleItemAvailability(
+                    start=DAYS[1] + timedelta(hours=12), end=DAYS[1] + timedelta(hours=18)
+                )
+            ]
+        if i % 7 == 0:
+            occurrence.allowed_venues = [v for v in venues if v.time_blocks[0].type == si.type][-1:]
+        if i % 11 == 0:
+            occurrence.manually_scheduled = True
+            occurrence.scheduled_time = DAYS[i % 3] + timedelta(hours=11)
+            occurrence.scheduled_venue = next(v for v in venues if v.time_blocks[0].type == si.type)
+        si.occurrences = [occurrence]
+        occurrences.append(occurrence)
+
+    db.session.add_all(occurrences)
+    db.session.commit()
+    return occurrences
+
+
+def test_index_matches_queries(db, user, venues):
+    index = VenueTimeIndex.load()
+    for occurrence in add_occurrences(db, user, venues, 60):
+        assert occurrence.get_allowed_venues(index) == occurrence.get_allowed_venues()
+        assert set(occurrence.time_blocks(index)) == set(occurrence.time_blocks())
+        assert occurrence.allowed_times(True, index) == occurrence.allowed_times(True)
+        assert occurrence.allowed_times(False, index) == occurrence.allowed_times(False)
+
+
+def test_schedule_problem_query_count(db, user, venues):
+    types = ["talk", "workshop", "performance"]
+    add_occurrences(db, user, venues, 30)
+
+    with QueryLog() as small:
+        Scheduler().get_schedule_problem(types)
+
+    # An EMF-sized schedule
+    add_occurrences(db, user, venues, 400)
+
+    start = time.perf_counter()
+    with QueryLog() as large:
+        problem = Scheduler().get_schedule_problem(types)
+    elapsed = time.perf_counter() - start
+
+    assert len(problem.talks) > 400
+    assert large.count == small.count, "Building the problem doesn't query per occurrence"
+    assert elapsed < 10
+
+
+@dataclass(frozen=True)
+class FakeProposal:
+    id: int
+
+
+@dataclass(frozen=True)
+class FakeOccurrence:
+    id: int
+    proposal: FakeProposal | None
+
+
+def pairwise_clashes(user_faves):
+    """compute_clashes as it was before it used a sparse matrix"""
+    population = len(user_faves)
+    fans = Counter()
+    popularity = Counter()
+    for occurrences in user_faves.values():
+        unique = set(occurrences)
+        fans.update(unique)
+        for o1, o2 in combinations(sorted(unique, key=lambda o: o.id), 2):
+            if o1.proposal == o2.proposal:
+                continue
+            popularity[(o1, o2)] += 1
+
+    candidates = [(pair, count) for pair, count in popularity.items() if count >= 5]
+    if not candidates:
+        return []
+
+    a_fans = [fans[a] for (a, _), _ in candidates]
+    b_fans = [fans[b] for (_, b), _ in candidates]
+    expected = [na * nb / population for na, nb in zip(a_fans, b_fans, strict=True)]
+    pvalues = hypergeom.sf([count - 1 for _, count in candidates], population, a_fans, b_fans)
+    qvalues = false_discovery_control(pvalues, method="bh")
+
+    ranked = []
+    for ((o1, o2), count), mean, qvalue in zip(candidates, expected, qvalues, strict=True):
+        if count < 1.5 * mean or qvalue > 0.05:
+            continue
+        ranked.append((o1, o2, count, max(1, round(count - mean))))
+    return ranked
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_compute_clashes_matches_pairwise(seed):
+    rand = random.Random(seed)
+    proposals = [FakeProposal(i) for i in range(rand.randint(5, 40))]
+    occurrences = [
+        FakeOccurrence(i, rand.choice([*proposals, None]))
+        for i in rand.sample(range(1000), len(proposals) + 5)
+    ]
+
+    # Some people favourite everything, and some items are popular together
+    popular = rand.sample(occurrences, min(len(occurrences), 4))
+    user_faves = {}
+    for user_id in range(rand.randint(0, 300)):
+        faves = rand.sample(occurrences, rand.choice([1, 3, 10, len(occurrences)]))
+        if rand.random() < 0.3:
+            faves += popular
+        user_faves[user_id] = faves
+
+    ranked = compute_clashes(user_faves)
+    assert sorted(ranked, key=lambda r: (r[0].id, r[1].id)) == sorted(
+        pairwise_clashes(user_faves), key=lambda r: (r[0].id, r[1].id)
+    )
+    assert [r[3] for r in ranked] == sorted((r[3] for r in ranked), reverse=True)
+
+
+def test_restrict_to_changes():
+    day = DAYS[0]
+
+    def at(hour):
+        return day + timedelta(hours=hour)
+
+    def talk(id, speakers, duration=60):
+        venue_times = [VenueTimes(venue=v, times=[(at(10), at(18))]) for v in (1, 2)]
+        return Talk(id=id, duration=duration, speakers=speakers, venue_times=venue_times, minutes_after=10)
+
+    talks = [
+        talk(1, {1}),
+        talk(2, {2}),
+        talk(3, {3}),
+        # Now too long for its slot
+        talk(4, {4}, duration=90),
+        # New, so it has no slot
+        talk(5, {5}),
+        talk(6, {6}),
+        # Tweaked onto the same slot as 6
+        talk(7, {7}),
+        # Shares a speaker with 6
+        talk(8, {6}),
+        # Not being scheduled, just there for conflicts
+        talk(9, {9}),
+    ]
+    previous = {
+        1: (1, at(10)),
+        2: (1, at(12)),
+        3: (1, at(15)),
+        4: (1, at(17)),
+        6: (2, at(10)),
+        7: (2, at(10)),
+        8: (2, at(16)),
+    }
+    talks[-1].venue, talks[-1].start_time = 2, at(13)
+    conflicts = [Conflict(talks={1, 2}, weight=10), Conflict(talks={3, 5}, weight=10)]
+
+    conflicts, changed, resolved = restrict_to_changes(talks, conflicts, set(range(1, 9)), previous)
+    assert changed == {4, 5, 6, 7}
+    # Talk 3 is near talk 4, and talk 8 shares a speaker with talk 6
+    assert resolved == {3, 4, 5, 6, 7, 8}
+    assert [c.talks for c in conflicts] == [{3, 5}]
+
+    pinned = {t.id: t for t in talks if t.id not in resolved}
+    for id in [1, 2]:
+        venue, start = previous[id]
+        assert [(vt.venue, vt.times) for vt in pinned[id].venue_times] == [
+            (venue, [(start, start + timedelta(hours=1))])
+        ]
+        assert (pinned[id].venue, pinned[id].start_time) == (venue, start)
+
+    # Talks being re-solved start from their previous slot if it's still allowed
+    talks_by_id = {t.id: t for t in talks}
+    assert len(talks_by_id[3].venue_times) == 2
+    assert (talks_by_id[3].venue, talks_by_id[3].start_time) == (1, at(15))
+    assert talks_by_id[4].start_time is None
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from apps.cfp import scheduler_jobs
+from apps.cfp.scheduler_jobs import (
+    START_JOBS_LOCK,
+    cancel_job,
+    check_scheduler_jobs,
+    queue_scheduler_job,
+    run_job,
+    start_queued_jobs,
+)
+from models import naive_utcnow
+from models.content.potential_schedule import SchedulerJob
+
+
+@pytest.fixture
+def launched(app, db, monkeypatch):
+    """Record jobs which would have been started in a new process."""
+    launched = []
+    monkeypatch.setattr(scheduler_jobs, "launch_job", launched.append)
+    monkeypatch.setitem(app.config, "SCHEDULER_JOB_CONCURRENCY", 2)
+    yield launched
+
+    db.session.execute(
+        update(SchedulerJob).where(SchedulerJob.state.in_(["queued", "running"])).values(state="cancelled")
+    )
+    db.session.commit()
+
+
+def queue(db, count):
+    jobs = [queue_scheduler_job(["talk"], ["talk"], 100, 1) for _ in range(count)]
+    db.session.commit()
+    return jobs
+
+
+def test_start_queued_jobs(db, launched):
+    first, second, third = queue(db, 3)
+
+    assert start_queued_jobs() == [first, second]
+    assert launched == [first.id, second.id]
+    assert third.state == "queued"
+    assert start_queued_jobs() == []
+
+    # There's nothing to schedule in this module
+    assert run_job(first.id) == "failed"
+    assert first.error == "Scheduler failed: No talks to schedule"
+    assert first.progress["talks"] == 0
+    assert first.finished is not None
+
+    # The finished job makes room for the next
+    assert launched == [first.id, second.id, third.id]
+    assert third.state == "running"
+
+
+def test_start_queued_jobs_waits_for_lock(db, launched):
+    (job,) = queue(db, 1)
+
+    # Another process is starting jobs
+    with Session(db.engine) as other, other.begin():
+        other.execute(select(func.pg_advisory_xact_lock(START_JOBS_LOCK)))
+
+        db.session.execute(text("SET LOCAL lock_timeout = '100ms'"))
+        with pytest.raises(OperationalError):
+            start_queued_jobs()
+        db.session.rollback()
+
+    assert start_queued_jobs() == [job]
+    assert launched == [job.id]
+
+
+def test_cancel(db, launched):
+    queued, running = queue(db, 2)
+    running.state = "running"
+
+    cancel_job(queued)
+    cancel_job(running)
+    db.session.commit()
+    assert queued.state == "cancelled"
+    assert running.state == "running"
+    assert running.cancel_requested
+
+    # The job notices at its next heartbeat
+    assert run_job(running.id) == "cancelled"
+    assert running.finished is not None
+    assert launched == []
+
+
+def test_stale_jobs(db, launched):
+    stale, alive, waiting = queue(db, 3)
+    stale.state = alive.state = "running"
+    stale.heartbeat = naive_utcnow() - timedelta(minutes=10)
+    alive.heartbeat = naive_utcnow()
+    db.session.commit()
+
+    assert check_scheduler_jobs() == {"failed": [stale.id], "started": [waiting.id]}
+    assert stale.state == "failed"
+    assert alive.state == "running"
+    assert launched == [waiting.id]
@@ -0,0 +1,46 @@
+from apps.common.search import arrivals_users_from_query, users_from_query
+from main import db
+from models.basket import Basket
+from models.product import PriceTier
+from models.user import User
+
+
+def test_users_from_query_ranking(app):
+    users = [
+        User("search-jo@example.com", "Jo"),
+        User("search-joanna@example.com", "Joanna Smith"),
+        User("search-smith@example.com", "Bobby Jo Smith"),
+        User("search-under_score@example.com", "Under Score"),
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    jo, joanna, bobby, underscore = users
+
+    assert users_from_query("jo")[:3] == [jo, joanna, bobby]
+
+    results = users_from_query("jo smith")
+    assert set(results[:2]) == {joanna, bobby}
+    assert jo in results[2:]
+
+    assert users_from_query("search-under_score@example.com") == [underscore]
+    # Wildcards are escaped
+    assert users_from_query("search-under%score") == []
+    assert users_from_query("  ") == []
+
+
+def test_arrivals_users_from_query(app):
+    user = User("search-arrivals@example.com", "Arrivals Search")
+    db.session.add(user)
+    basket = Basket(user, "GBP")
+    basket[PriceTier.query.filter_by(name="full-std").one()] = 1
+    basket.create_purchases()
+    db.session.commit()
+    (purchase,) = basket.purchases
+
+    assert arrivals_users_from_query(str(purchase.id))[0] == user
+    assert arrivals_users_from_query(user.checkin_code[:6]) == [user]
+
+    # Fragments need the start of the code, and have to match
+    assert user not in arrivals_users_from_query(user.checkin_code[2:8])
+    wrong = user.checkin_code[:5] + ("A" if user.checkin_code[5] != "A" else "B")
+    assert arrivals_users_from_query(wrong) == []
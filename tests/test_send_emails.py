@@ -0,0 +1,88 @@
+import email
+import socketserver
+import threading
+
+import pytest
+from sqlalchemy import select
+
+from apps.base.scheduled_tasks import EMAIL_BATCH_SIZE, send_emails
+from models.email import EmailJob, EmailJobRecipient
+from models.user import User
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib"""
+
+    def reply(self, line: bytes) -> None:
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.reply(b"220 sink")
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+            if command == b"DATA":
+                self.reply(b"354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (line := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(line)
+                self.server.messages.append(email.message_from_bytes(b"".join(data)))  # type: ignore[attr-defined]
+                self.reply(b"250 OK")
+            elif command == b"QUIT":
+                self.reply(b"221 Bye")
+                return
+            else:
+                self.reply(b"250 OK")
+
+
+@pytest.fixture
+def smtp_sink():
+    server = socketserver.ThreadingTCPServer(("localhost", 0), SMTPSinkHandler)
+    server.daemon_threads = True
+    server.messages = []  # type: ignore[attr-defined]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_send_emails(app, db, smtp_sink):
+    _, port = smtp_sink.server_address
+    app.config.update(
+        BULK_MAIL_BACKEND="apps.common.backends.bulk.BulkEmailBackend",
+        BULK_MAIL_SERVER="localhost",
+        BULK_MAIL_PORT=port,
+        EMAIL_SEND_WORKERS=3,
+    )
+
+    count = EMAIL_BATCH_SIZE * 3 + 5
+    job = EmailJob(
+        priority=1,
+        bulk=True,
+        volunteer=False,
+        from_email="test@example.com",
+        subject="Bulk test",
+        text_body="Hello",
+    )
+    db.session.add(job)
+    for i in range(count):
+        user = User(f"send-emails-{i}@example.com", f"Recipient {i}")
+        db.session.add(EmailJobRecipient(job=job, user=user))
+    db.session.commit()
+
+    assert send_emails() == count
+
+    # Every recipient gets exactly one email, even with several workers
+    recipients = sorted(message["To"] for message in smtp_sink.messages)
+    assert recipients == sorted(f"send-emails-{i}@example.com" for i in range(count))
+
+    db.session.expire_all()
+    unsent = db.session.scalars(
+        select(EmailJobRecipient).where(EmailJobRecipient.job == job, EmailJobRecipient.sent == False)
+    ).all()
+    assert unsent == []
+
+    # Nothing's left to send
+    assert send_emails() == 0
@@ -1,27 +1,12 @@
 import pytest
-import sqlalchemy
 
+from apps.common.receipt import get_purchase_metadata, get_purchase_metadata_bulk
 from main import db
+from models.basket import Basket
+from models.product import PriceTier
+from models.user import User
 
-
-class QueryLog:
-    def __init__(self):
-        self.count = 0
-        self.queries = []
-
-    def _query_callback(self, _conn, _cur, query, params, *_):
-        self.count += 1
-        self.queries.append(query)
-
-    def __enter__(self):
-        sqlalchemy.event.listen(db.engine, "before_cursor_execute", self._query_callback)
-        return self
-
-    def __exit__(self, *args):
-        sqlalchemy.event.remove(db.engine, "before_cursor_execute", self._query_callback)
-
-    def __repr__(self):
-        return "<SQLAlchemy Query Logger>"
+from ._utils import QueryLog
 
 
 @pytest.mark.parametrize("url,queries", [("/tickets", 2), ("/", 0)])
@@ -34,3 +19,86 @@ def test_query_count(app_with_cache, url, queries):
         rv = client.get(url)
         assert rv.status_code == 200, f"Fetching {url} results in HTTP 200"
         assert log.count <= queries, f"{url} query count"
+
+
+def test_query_count_authenticated(app_with_cache):
+    """Logged-in users shouldn't cost a query per price tier on the tickets page."""
+    email = "query_count_user@example.com"
+    user = User.get_by_email(email)
+    if not user:
+        user = User(email, "Query Count User")
+        db.session.add(user)
+        db.session.commit()
+
+    client = app_with_cache.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user.id)
+        sess["_fresh"] = True
+
+    client.get("/tickets")  # Initial fetch to fill caches
+
+    with QueryLog() as log:
+        rv = client.get("/tickets")
+        assert rv.status_code == 200, "Fetching /tickets results in HTTP 200"
+        # User, permissions, product view, products and purchase counts
+        assert log.count <= 5, "/tickets query count"
+
+
+def test_query_count_cached_tickets_page(app_with_cache):
+    """With the page cache enabled, anonymous visitors only need the product view."""
+    app_with_cache.config["TICKETS_PAGE_CACHE"] = True
+    try:
+        client = app_with_cache.test_client()
+        uncached = client.get("/tickets")  # Initial fetch to fill caches
+
+        with QueryLog() as log:
+            rv = client.get("/tickets")
+            assert rv.status_code == 200, "Fetching /tickets results in HTTP 200"
+            assert log.count <= 1, "/tickets query count"
+
+        assert b"tier-amount-" not in rv.data
+        assert rv.data.count(b"<tr data-price=") == uncached.data.count(b"<tr data-price=")
+    finally:
+        app_with_cache.config["TICKETS_PAGE_CACHE"] = False
+
+
+def test_query_count_purchase_metadata(app_with_cache):
+    """Receipt metadata is loaded in one query for purchases and one for transfers."""
+    users = []
+    for i in range(3):
+        user = User(f"receipt_meta_{i}@example.com", f"Receipt Meta {i}")
+        db.session.add(user)
+        basket = Basket(user, "GBP")
+        basket[PriceTier.query.filter_by(name="full-std").one()] = 2
+        basket[PriceTier.query.filter_by(name="parking").one()] = 1
+        basket.create_purchases()
+        basket.ensure_purchase_capacity()
+        for purchase in basket.purchases:
+            purchase.set_state("paid")
+        users.append(user)
+    db.session.commit()
+
+    admission = next(p for p in users[0].owned_purchases if p.product.parent.type == "admissions")
+    admission.transfer(users[0], users[1])
+    db.session.commit()
+
+    for user in users:
+        # Load the users outside the log
+        db.session.refresh(user)
+
+    with QueryLog() as log:
+        meta = get_purchase_metadata(users[0])
+        assert len(meta.admissions) == 1
+        assert len(meta.parking_tickets) == 1
+        assert [t.to_user.email for t in meta.transferred_tickets] == [users[1].email]
+        assert [t.purchase.product.checkin_display_name for t in meta.transferred_tickets]
+        assert meta.admissions[0].price_tier.name == "full-std"
+        assert log.count == 2, "Single user purchase metadata query count"
+
+    with QueryLog() as log:
+        metas = get_purchase_metadata_bulk(users)
+        assert [len(metas[user.id].admissions) for user in users] == [1, 3, 2]
+        for user in users:
+            for purchase in metas[user.id].admissions + metas[user.id].parking_tickets:
+                assert purchase.product.checkin_display_name
+        assert log.count == 2, "Bulk purchase metadata query count"
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+from freezegun import freeze_time
+
+from apps.tickets import queue
+from apps.tickets.queue import check_queue, load_token
+from main import cache
+from models import naive_utcnow
+from models.ticket_queue import CacheQueueBackend, DBQueueBackend, TicketQueue, advance_frontier
+from models.user import User
+
+START = datetime(2026, 3, 1, 12, 0, 0)
+
+
+def test_frontier_advances_at_rate():
+    admitted, updated = advance_frontier(0, START, 1000, 10, START + timedelta(seconds=3))
+    assert admitted == 30
+    assert updated == START + timedelta(seconds=3)
+
+
+def test_frontier_keeps_partial_steps():
+    admitted, updated = advance_frontier(0, START, 1000, 4, START + timedelta(seconds=1.3))
+    assert admitted == 5
+    assert updated == START + timedelta(seconds=1.25)
+
+    # The remaining 0.05s counts towards the next step
+    admitted, updated = advance_frontier(admitted, updated, 1000, 4, START + timedelta(seconds=1.5))
+    assert admitted == 6
+
+
+def test_frontier_stops_at_last_issued():
+    later = START + timedelta(hours=1)
+    admitted, updated = advance_frontier(0, START, 20, 10, later)
+    assert admitted == 20
+    assert updated == later
+
+    # A rush after a quiet period isn't let straight in
+    admitted, _ = advance_frontier(admitted, updated, 1000, 10, later + timedelta(seconds=1))
+    assert admitted == 30
+
+
+@pytest.fixture
+def empty_queue(app_with_cache, db):
+    """Reset the frontier to now. The DB row is normally created by the migration."""
+    cache.clear()
+    ticket_queue = db.session.get(TicketQueue, 1)
+    if ticket_queue is None:
+        ticket_queue = TicketQueue(id=1)
+        db.session.add(ticket_queue)
+    ticket_queue.admitted = 0
+    ticket_queue.updated = naive_utcnow()
+    db.session.commit()
+    return ticket_queue.updated
+
+
+@pytest.mark.parametrize("backend_cls", [CacheQueueBackend, DBQueueBackend])
+def test_backend(db, empty_queue, backend_cls):
+    backend = backend_cls()
+    positions = [backend.issue_position() for _ in range(5)]
+    assert positions == list(range(positions[0], positions[0] + 5))
+
+    # Changes the request has made aren't committed or thrown away
+    user = User(f"ticket-queue-{backend_cls.__name__}@example.com", "Ticket Queue")
+    db.session.add(user)
+
+    with freeze_time(empty_queue):
+        assert backend.get_admitted(1) == 0
+    with freeze_time(empty_queue + timedelta(seconds=2)):
+        assert backend.get_admitted(1) == 2
+    with freeze_time(empty_queue + timedelta(hours=1)):
+        assert backend.get_admitted(1) == positions[-1]
+
+    assert user in db.session.new
+    db.session.rollback()
+
+
+@pytest.mark.parametrize("backend", ["cache", "db"])
+def test_check_queue(app_with_cache, empty_queue, monkeypatch, backend):
+    monkeypatch.setitem(app_with_cache.config, "TICKETS_QUEUE_BACKEND", backend)
+    monkeypatch.setattr(queue, "get_queue_admission_rate", lambda: 1)
+
+    with app_with_cache.test_request_context("/"):
+        app_with_cache.preprocess_request()
+        with freeze_time(empty_queue):
+            _, status, headers = check_queue()
+            assert status == 200
+            assert headers["Cache-Control"] == "no-store"
+            token = load_token()
+            assert not token["admitted"]
+
+        # The frontier moves on one position a second
+        with freeze_time(empty_queue + timedelta(seconds=token["position"] + 1)):
+            assert check_queue() is None
+            assert load_token() == {"position": token["position"], "admitted": True}
+
+            # Once admitted, the visitor doesn't queue again
+            monkeypatch.setattr(queue, "get_admitted_position", lambda rate: 0)
+            assert check_queue() is None
+
+    monkeypatch.setattr(queue, "get_queue_admission_rate", lambda: 0)
+    with app_with_cache.test_request_context("/"):
+        assert check_queue() is None
+        assert load_token() is None
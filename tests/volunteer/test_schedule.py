@@ -0,0 +1,68 @@
+import random
+from datetime import datetime, timedelta
+
+from apps.users.calendar import CalendarEntry
+from apps.volunteer.schedule import _get_conflicts
+
+START = datetime(2026, 7, 17, 8, 0)
+
+
+def entry(type, start, minutes, priority):
+    return CalendarEntry(
+        type=type,
+        title=f"{type} at {start:%H:%M}",
+        start_time=start,
+        end_time=start + timedelta(minutes=minutes),
+        venue_name=None,
+        venue_mapref=None,
+        conflict_priority=priority,
+    )
+
+
+def test_conflicts():
+    shifts = [
+        {"local_start": START, "local_end": START + timedelta(hours=2)},
+        {"local_start": START + timedelta(hours=1), "local_end": START + timedelta(hours=4)},
+        {"local_start": START + timedelta(hours=5), "local_end": START + timedelta(hours=6)},
+    ]
+    calendar = [
+        entry("favourited_content", START + timedelta(minutes=90), 60, 2),
+        entry("volunteer_shift", START + timedelta(hours=2), 60, 0),
+        entry("owned_content", START + timedelta(hours=4), 60, 1),
+    ]
+
+    (first_type, first), (second_type, second), (third_type, third) = _get_conflicts(shifts, calendar)
+    assert first_type == "favourited_content"
+    assert [c["type"] for c in first] == ["favourited_content"]
+
+    # The highest priority conflict comes first
+    assert second_type == "volunteer_shift"
+    assert [c["type"] for c in second] == ["volunteer_shift", "favourited_content"]
+
+    # Touching isn't overlapping
+    assert third_type == ""
+    assert third == []
+
+
+def test_conflicts_match_pairwise():
+    rand = random.Random(0)
+    types = ["volunteer_shift", "owned_content", "favourited_content"]
+
+    shifts = []
+    for _ in range(50):
+        start = START + timedelta(minutes=rand.randrange(0, 24 * 60, 15))
+        shifts.append(
+            {"local_start": start, "local_end": start + timedelta(minutes=rand.randrange(30, 480, 30))}
+        )
+    shifts.sort(key=lambda s: s["local_start"])
+
+    calendar = []
+    for _ in range(30):
+        priority = rand.randrange(3)
+        start = START + timedelta(minutes=rand.randrange(0, 24 * 60, 10))
+        calendar.append(entry(types[priority], start, rand.randrange(10, 600, 10), priority))
+    calendar.sort(key=lambda e: e.start_time)
+
+    for shift, (_, details) in zip(shifts, _get_conflicts(shifts, calendar), strict=True):
+        expected = [e for e in calendar if e.overlaps_with(shift["local_start"], shift["local_end"])]
+        assert sorted(c["title"] for c in details) == sorted(e.title for e in expected)
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import update
+
+from models.user import User
+from models.volunteer.role import Role, Team
+from models.volunteer.shift import Shift, ShiftEntry, ShiftEntryState, refresh_shift_counts
+from models.volunteer.venue import VolunteerVenue
+
+
+def test_current_count(db: SQLAlchemy, user: User):
+    role = Role(name="Count Role", slug="count-role", team=Team(name="Count Team", slug="count-team"))
+    venue = VolunteerVenue(name="Count Venue", slug="count-venue")
+    shift = Shift(role=role, venue=venue, start=datetime(2026, 7, 17, 9), end=datetime(2026, 7, 17, 11))
+    other_user = User("shift-count@example.com", "Shift Count")
+    db.session.add_all([shift, other_user])
+    db.session.flush()
+    assert shift.current_count == 0
+
+    entry = ShiftEntry(user=user, shift=shift)
+    db.session.add_all([entry, ShiftEntry(user=other_user, shift=shift)])
+    db.session.flush()
+    assert shift.current_count == 2
+
+    entry.set_state(ShiftEntryState.ABANDONED)
+    db.session.flush()
+    assert shift.current_count == 1
+
+    entry.set_state(ShiftEntryState.ARRIVED)
+    db.session.flush()
+    assert shift.current_count == 2
+
+    db.session.delete(entry)
+    db.session.flush()
+    assert shift.current_count == 1
+
+
+def test_refresh_shift_counts(db: SQLAlchemy, user: User):
+    role = Role(name="Refresh Role", slug="refresh-role", team=Team(name="Refresh Team", slug="refresh-team"))
+    venue = VolunteerVenue(name="Refresh Venue", slug="refresh-venue")
+    shift = Shift(role=role, venue=venue, start=datetime(2026, 7, 17, 9), end=datetime(2026, 7, 17, 11))
+    db.session.add(ShiftEntry(user=user, shift=shift))
+    db.session.flush()
+
+    db.session.execute(update(Shift).where(Shift.id == shift.id).values(current_count=5))
+    assert refresh_shift_counts(db.session) == {shift.id: 1}
+    assert shift.current_count == 1
+    assert refresh_shift_counts(db.session) == {}